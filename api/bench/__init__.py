@@ -0,0 +1,14 @@
+"""
+Benchmarks and load tests (run from api/: `python -m bench --help`).
+
+  synth    synthetic models + lookup store matching models/feature_names.json
+  mock     local Etherscan v2 stand-in (latency, rate limits, large histories)
+  micro    in-process microbenchmarks: feature extraction, scoring per batch size
+  load     end-to-end: API + mock as subprocesses, jobs/s, /v1/verify p50/p99, peak RSS
+  compare  diff two result files; non-zero exit on regressions
+  run      synth (if missing) + micro + load, written to bench/results/<commit>.json
+
+Nothing here touches models/ or data/: everything is generated under a work
+directory (default /tmp/sybilscan-bench) and the services are pointed at it
+through SYBILSCAN_MODEL_DIR / SYBILSCAN_LOOKUP_DIR / ETHERSCAN_API_URL.
+"""
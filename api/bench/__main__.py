@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from bench import synth
+
+_BASE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(_BASE, "results")
+
+
+def _commit() -> str:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_BASE,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=_BASE,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _use_synth(work: str):
+    """Point the services at the synthetic models; must run before anything imports services.*"""
+    if not synth.exists(work):
+        sys.exit(f"no synthetic data in {work}; run `python -m bench synth` first")
+    os.environ.update(synth.env(work))
+
+
+def _write(result: dict, cmd: str, out: str = None) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    suffix = "" if cmd == "run" else f"-{cmd}"
+    out = out or os.path.join(RESULTS_DIR, f"{result['commit']}{suffix}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    return out
+
+
+def main():
+    p = argparse.ArgumentParser(prog="python -m bench", description="SybilScan benchmarks and load tests.")
+    p.add_argument("--work", default=synth.WORK_DIR, help="synthetic data directory")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("synth", help="generate synthetic models + lookup store")
+    s.add_argument("--rows", type=int, default=200000, help="lookup rows")
+    s.add_argument("--trees", type=int, default=200)
+    s.add_argument("--seed", type=int, default=0)
+
+    mk = sub.add_parser("mock", help="serve the Etherscan stand-in")
+    mk.add_argument("--host", default="127.0.0.1")
+    mk.add_argument("--port", type=int, default=8900)
+    mk.add_argument("--latency-ms", type=float, default=0)
+    mk.add_argument("--jitter-ms", type=float, default=0)
+    mk.add_argument("--rps", type=float, default=0, help="per-apikey limit (0: unlimited)")
+    mk.add_argument("--rate-limit-p", type=float, default=0, help="random rate-limit response probability")
+    mk.add_argument("--big-every", type=int, default=0, help="every k-th address gets a large history")
+    mk.add_argument("--big-rows", type=int, default=25000, help="rows per endpoint for large histories")
+    mk.add_argument("--callback-failures", type=int, default=0, help="503s per job before /callback accepts")
+
+    mi = sub.add_parser("micro", help="in-process microbenchmarks")
+    mi.add_argument("--min-s", type=float, default=0.3, help="minimum time per benchmark")
+    mi.add_argument("--out", help="write results JSON here")
+
+    for name, help_ in (("load", "end-to-end load scenarios"), ("run", "synth (if missing) + micro + load")):
+        lo = sub.add_parser(name, help=help_)
+        lo.add_argument("--jobs", type=int, default=40)
+        lo.add_argument("--job-size", type=int, default=1000)
+        lo.add_argument("--verify", type=int, default=500)
+        lo.add_argument("--verify-live", type=int, default=100)
+        lo.add_argument("--live", type=int, default=200)
+        lo.add_argument("--concurrency", type=int, default=16)
+        lo.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+        lo.add_argument("--latency-ms", type=float, default=50)
+        lo.add_argument("--jitter-ms", type=float, default=50)
+        lo.add_argument("--rps", type=float, default=0, help="mock per-key limit (0: unlimited)")
+        lo.add_argument("--rate-limit-p", type=float, default=0)
+        lo.add_argument("--big-every", type=int, default=25)
+        lo.add_argument("--out", help="write results JSON here")
+        if name == "run":
+            lo.add_argument("--min-s", type=float, default=0.3)
+            lo.add_argument("--baseline", help="result file to compare against")
+
+    c = sub.add_parser("compare", help="diff two result files")
+    c.add_argument("base")
+    c.add_argument("head")
+    c.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+
+    args = p.parse_args()
+
+    if args.cmd == "synth":
+        t = synth.generate(args.work, lookup_rows=args.rows, trees=args.trees, seed=args.seed)
+        print(f"synthetic data in {args.work}: {json.dumps(t)}")
+        return
+
+    if args.cmd == "mock":
+        from bench.mock_etherscan import serve
+        serve(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rps=args.rps,
+              rate_limit_p=args.rate_limit_p, big_every=args.big_every, big_rows=args.big_rows,
+              callback_failures=args.callback_failures)
+        return
+
+    if args.cmd == "compare":
+        from bench.compare import load, report
+        text, regressions = report(load(args.base), load(args.head), args.threshold)
+        print(text)
+        sys.exit(1 if regressions else 0)
+
+    result = {"commit": _commit(), "created_at": time.time()}
+    if args.cmd == "run" and not synth.exists(args.work):
+        print(f"generating synthetic data in {args.work} …")
+        synth.generate(args.work)
+    _use_synth(args.work)
+    result["synth"] = json.load(open(os.path.join(args.work, "synth.json")))
+
+    if args.cmd in ("micro", "run"):
+        from bench import micro
+        result["micro"] = micro.run(args.min_s)
+    if args.cmd in ("load", "run"):
+        from bench import load
+        result["load"] = load.run(
+            args.work, jobs=args.jobs, job_size=args.job_size, verify_n=args.verify,
+            verify_live=args.verify_live, live=args.live, concurrency=args.concurrency, workers=args.workers,
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rps=args.rps,
+            rate_limit_p=args.rate_limit_p, big_every=args.big_every)
+    out = _write(result, args.cmd, args.out)
+    print(json.dumps(result, indent=2))
+    print(f"→ {out}")
+
+    if args.cmd == "run" and args.baseline:
+        from bench.compare import load as load_result, report
+        text, regressions = report(load_result(args.baseline), result)
+        print(text)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
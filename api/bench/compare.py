@@ -0,0 +1,64 @@
+"""
+Baseline report: metric-by-metric diff of two bench result files.
+
+Only metrics with a known direction are compared: `*_ms`, `*rss_mb`,
+`*cpu_s` and `requests_per_job` (lower is better, except the single-sample
+max_ms) and `*per_s` / `rps` (higher is better). A change worse
+than `threshold` (relative) is a regression; the CLI exits 1 if there is any.
+"""
+
+import json
+
+
+def flatten(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def direction(metric: str) -> int:
+    """-1 lower is better, +1 higher is better, 0 not compared."""
+    parts = metric.split(".")
+    name = parts[-1]
+    if "config" in parts or name == "max_ms":      # max is one sample: too noisy to gate on
+        return 0
+    if name.endswith(("_ms", "rss_mb", "cpu_s")) or name in ("ms", "requests_per_job"):
+        return -1
+    if name.endswith("per_s") or name == "rps":
+        return 1
+    return 0
+
+
+def compare(base: dict, head: dict, threshold: float = 0.10) -> list:
+    """[(metric, base, head, relative change, verdict)] for metrics present in both."""
+    b, h = flatten(base), flatten(head)
+    rows = []
+    for metric in sorted(b.keys() & h.keys()):
+        sign = direction(metric)
+        if not sign or not b[metric]:
+            continue
+        change = (h[metric] - b[metric]) / abs(b[metric])
+        better = change * sign
+        verdict = "regressed" if better < -threshold else "improved" if better > threshold else ""
+        rows.append((metric, b[metric], h[metric], change, verdict))
+    return rows
+
+
+def report(base: dict, head: dict, threshold: float = 0.10) -> tuple:
+    """(text table, number of regressions)."""
+    rows = compare(base, head, threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    lines = [f"{'metric':<{width}}  {base.get('commit', 'base'):>14}  {head.get('commit', 'head'):>14}  change"]
+    for metric, b, h, change, verdict in rows:
+        lines.append(f"{metric:<{width}}  {b:>14.4g}  {h:>14.4g}  {change:+7.1%}  {verdict}")
+    return "\n".join(lines), sum(r[4] == "regressed" for r in rows)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,311 @@
+"""
+End-to-end load scenarios against a real API process.
+
+Starts the mock Etherscan and `uvicorn main:app` as subprocesses on free
+ports, pointed at the synthetic models / lookup and at throwaway job, feature
+cache and key stores, waits for /ready, then runs:
+
+  score_jobs    concurrent /v1/score jobs of known addresses, submit → complete,
+                awaited by polling /status or over /v1/jobs/{id}/events (SSE)
+  verify_known  /v1/verify on lookup addresses (p50 / p99)
+  verify_live   /v1/verify on unknown addresses, each a full mock fetch
+  live_job      one /v1/score job with live=true over unknown addresses, with a
+                completion callback to the mock (first attempt rejected)
+
+Peak RSS and CPU time are the whole API process tree (workers and scoring
+processes included), read from /proc; RSS is sampled every 50 ms.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import tempfile
+import threading
+import subprocess
+import httpx
+import numpy as np
+from bench import synth
+
+_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children() -> dict:
+    """ppid → [pid] for every process (Linux /proc)."""
+    out = {}
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        out.setdefault(ppid, []).append(int(d))
+    return out
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_kb(pid: int) -> int:
+    kids, total, stack = _children(), 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += _rss_kb(p)
+        stack.extend(kids.get(p, ()))
+    return total
+
+
+def tree_cpu_s(pid: int) -> float:
+    """User + system CPU seconds of `pid` and its live descendants."""
+    kids, total, stack = _children(), 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(kids.get(p, ()))
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+class RssSampler(threading.Thread):
+    """Background peak-RSS sampler; `mark()` starts a new per-scenario peak."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak = self.scenario_peak = 0
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.is_set():
+            kb = tree_rss_kb(self.pid)
+            self.peak = max(self.peak, kb)
+            self.scenario_peak = max(self.scenario_peak, kb)
+            self._stop.wait(self.interval)
+
+    def mark(self) -> float:
+        mb, self.scenario_peak = self.scenario_peak / 1024, 0
+        return round(mb, 1)
+
+    def stop(self):
+        self._stop.set()
+
+
+def _latency(ms: list) -> dict:
+    a = np.asarray(ms)
+    return {"p50_ms": round(float(np.percentile(a, 50)), 2), "p99_ms": round(float(np.percentile(a, 99)), 2),
+            "max_ms": round(float(a.max()), 2), "n": len(a)}
+
+
+async def _wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, timeout: float = 120) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API exited with {proc.returncode} before /ready")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError("API not ready in time")
+
+
+async def _job(client: httpx.AsyncClient, body: dict, poll_s: float = 0.02) -> float:
+    t = time.perf_counter()
+    r = await client.post("/v1/score", json=body)
+    r.raise_for_status()
+    jid = r.json()["job_id"]
+    while True:
+        s = (await client.get(f"/v1/jobs/{jid}/status")).json()
+        if s["status"] in ("complete", "failed"):
+            if s["status"] == "failed":
+                raise RuntimeError(f"job {jid} failed: {s.get('error')}")
+            return (time.perf_counter() - t) * 1000
+        await asyncio.sleep(poll_s)
+
+
+async def _wait_events(client: httpx.AsyncClient, jid: str):
+    """Wait for a job on its event stream (no polling); raise unless it completes."""
+    event = None
+    async with client.stream("GET", f"/v1/jobs/{jid}/events", params={"results": "false"}) as resp:
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "done":
+                status = json.loads(line[6:])
+                if status["status"] != "complete":
+                    raise RuntimeError(f"job {jid} {status['status']}: {status.get('error')}")
+                return
+    raise RuntimeError(f"job {jid}: event stream closed before done")
+
+
+async def _job_events(client: httpx.AsyncClient, body: dict) -> float:
+    t = time.perf_counter()
+    r = await client.post("/v1/score", json=body)
+    r.raise_for_status()
+    await _wait_events(client, r.json()["job_id"])
+    return (time.perf_counter() - t) * 1000
+
+
+async def _gather(coros, concurrency: int) -> list:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(c):
+        async with sem:
+            return await c
+    return await asyncio.gather(*(one(c) for c in coros))
+
+
+async def score_jobs(client, known: list, jobs: int, size: int, concurrency: int, explain: str,
+                     pid: int, events: bool = False) -> dict:
+    rng = random.Random(1)
+    bodies = [{"addresses": rng.sample(known, size), "explain": explain} for _ in range(jobs)]
+    wait = _job_events if events else _job
+    sent, cpu = client.requests, tree_cpu_s(pid)
+    t = time.perf_counter()
+    lat = await _gather([wait(client, b) for b in bodies], concurrency)
+    wall = time.perf_counter() - t
+    return {"jobs_per_s": round(jobs / wall, 2), "addresses_per_s": round(jobs * size / wall, 1),
+            "requests_per_job": round((client.requests - sent) / jobs, 1),
+            "api_cpu_s": round(tree_cpu_s(pid) - cpu, 2), **_latency(lat)}
+
+
+async def _verify_one(client, addr: str, explain: str) -> float:
+    t = time.perf_counter()
+    r = await client.post("/v1/verify", json={"address": addr, "explain": explain})
+    r.raise_for_status()
+    if r.json().get("data_source") == "error":
+        raise RuntimeError(f"verify {addr}: {r.json()}")
+    return (time.perf_counter() - t) * 1000
+
+
+async def verify(client, addrs: list, concurrency: int, explain: str) -> dict:
+    t = time.perf_counter()
+    lat = await _gather([_verify_one(client, a, explain) for a in addrs], concurrency)
+    return {"rps": round(len(addrs) / (time.perf_counter() - t), 1), **_latency(lat)}
+
+
+async def live_job(client, addrs: list, concurrency: int, callback_url: str) -> dict:
+    body = {"addresses": addrs, "live": True, "concurrency": concurrency, "explain": "none",
+            "callback_url": callback_url}
+    t = time.perf_counter()
+    jid = (await client.post("/v1/score", json=body)).json()["job_id"]
+    await _wait_events(client, jid)
+    ms = (time.perf_counter() - t) * 1000
+    for _ in range(100):       # the mock rejects the first attempt; the retry follows after backoff
+        callback = (await client.get(f"/v1/jobs/{jid}/status")).json().get("callback_status")
+        if callback != "pending":
+            break
+        await asyncio.sleep(0.1)
+    return {"addresses_per_s": round(len(addrs) / ms * 1000, 1), "ms": round(ms, 1), "callback": callback}
+
+
+async def _scenarios(api: str, mock: str, proc: subprocess.Popen, cfg: dict) -> dict:
+    out = {}
+    known = synth.addresses(cfg["lookup_rows"])
+    rng = random.Random(0)
+    async def count(request):
+        client.requests += 1
+
+    async with httpx.AsyncClient(base_url=api, timeout=300, event_hooks={"request": [count]}) as client, \
+            httpx.AsyncClient(base_url=mock) as mock_client:
+        client.requests = 0
+        out["ready_s"] = round(await _wait_ready(client, proc), 2)
+        await _job(client, {"addresses": known[:10], "explain": "none"})     # spawns the scoring pool
+        sampler = RssSampler(proc.pid)
+        sampler.start()
+        sampler.mark()
+        try:
+            for name, explain, events in (("none", "none", False), ("top3", "top3", False),
+                                          ("none,events", "none", True)):
+                out[f"score_jobs[{name}]"] = await score_jobs(
+                    client, known, cfg["jobs"], cfg["job_size"], cfg["concurrency"], explain, proc.pid, events)
+                out[f"score_jobs[{name}]"]["peak_rss_mb"] = sampler.mark()
+            out["verify_known"] = await verify(client, rng.sample(known, cfg["verify"]), cfg["concurrency"], "top3")
+            out["verify_known"]["peak_rss_mb"] = sampler.mark()
+
+            before = (await mock_client.get("/stats")).json()
+            out["verify_live"] = await verify(client, synth.addresses(cfg["verify_live"], seed=2),
+                                              cfg["concurrency"], "top3")
+            out["verify_live"]["peak_rss_mb"] = sampler.mark()
+            out["live_job"] = await live_job(client, synth.addresses(cfg["live"], seed=3), cfg["concurrency"],
+                                             f"{mock}/callback")
+            out["live_job"]["peak_rss_mb"] = sampler.mark()
+            after = (await mock_client.get("/stats")).json()
+            out["etherscan"] = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+        finally:
+            sampler.stop()
+        out["peak_rss_mb"] = round(sampler.peak / 1024, 1)
+    return out
+
+
+def run(work: str = synth.WORK_DIR, jobs: int = 40, job_size: int = 1000, verify_n: int = 500,
+        verify_live: int = 100, live: int = 200, concurrency: int = 16, workers: int = 1,
+        latency_ms: float = 50, jitter_ms: float = 50, rps: float = 0, rate_limit_p: float = 0.0,
+        big_every: int = 25) -> dict:
+    meta = json.load(open(os.path.join(work, "synth.json")))
+    api_port, mock_port = _free_port(), _free_port()
+    api, mock = f"http://127.0.0.1:{api_port}", f"http://127.0.0.1:{mock_port}"
+    cfg = {"lookup_rows": meta["lookup_rows"], "jobs": jobs, "job_size": job_size, "verify": verify_n,
+           "verify_live": verify_live, "live": live, "concurrency": concurrency, "workers": workers,
+           "latency_ms": latency_ms, "jitter_ms": jitter_ms, "mock_rps": rps,
+           "rate_limit_p": rate_limit_p, "big_every": big_every}
+
+    with tempfile.TemporaryDirectory(prefix="sybilscan-load-") as tmp:
+        env = {
+            **os.environ, **synth.env(work),
+            "ETHERSCAN_API_URL":  f"{mock}/v2/api",
+            "ETHERSCAN_KEY_RPS":  str(rps or 1000),
+            "JOB_STORE_PATH":     os.path.join(tmp, "jobs.sqlite"),
+            "FEATURE_CACHE_PATH": os.path.join(tmp, "feature_cache.sqlite"),
+            "ETHERSCAN_KEY_BUDGET_PATH": os.path.join(tmp, "etherscan_keys.sqlite"),
+            "API_KEYS_PATH":      os.path.join(tmp, "api_keys.json"),
+            "API_BUCKETS_PATH":   os.path.join(tmp, "api_buckets.sqlite"),
+            "API_KEY_RPS":        "1000000",
+            "API_KEY_BURST":      "1000000",
+            "SYBILSCAN_REQUIRE_KEY": "0",
+            "API_ANON_RPS":       "0",
+            "CALLBACK_BACKOFF_S": "0.5",
+            "CALLBACK_ALLOW_HOSTS": "127.0.0.1",     # the mock's /callback receiver
+        }
+        mock_cmd = [sys.executable, "-m", "bench", "mock", "--port", str(mock_port),
+                    "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms), "--rps", str(rps),
+                    "--rate-limit-p", str(rate_limit_p), "--big-every", str(big_every), "--callback-failures", "1"]
+        api_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port),
+                   "--workers", str(workers), "--log-level", "warning"]
+        procs = [subprocess.Popen(mock_cmd, cwd=_API_DIR, env=env),
+                 subprocess.Popen(api_cmd, cwd=_API_DIR, env=env)]
+        try:
+            out = asyncio.run(_scenarios(api, mock, procs[1], cfg))
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                try:
+                    p.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+    return {"config": cfg, **out}
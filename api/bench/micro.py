@@ -0,0 +1,83 @@
+"""
+In-process microbenchmarks on the synthetic models and lookup.
+
+Import after bench.synth.env() is in os.environ (bench/__main__ does this):
+the services read their model / lookup paths at import.
+"""
+
+import time
+import numpy as np
+from bench import synth
+
+BATCHES = (1, 16, 256, 4096)
+EXTRACT_BATCHES = (1, 16, 128)
+CLUSTER_SIZES = (5000, 50000)
+
+
+def _time(fn, min_s: float = 0.3, max_n: int = 1000) -> dict:
+    """Call fn until min_s has elapsed (at least 3 times); per-call ms."""
+    fn()      # warm caches / lazy tables
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < 3 or (time.perf_counter() - start < min_s and len(samples) < max_n):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    s = np.array(samples)
+    return {"ms": round(float(np.median(s)), 4), "p90_ms": round(float(np.percentile(s, 90)), 4), "n": len(s)}
+
+
+def _rows_per_s(r: dict, rows: int) -> dict:
+    r["rows_per_s"] = round(rows / max(r["ms"], 1e-6) * 1000, 1)
+    return r
+
+
+def run(min_s: float = 0.3) -> dict:
+    from services import clusters, features, registry
+    from services.model import score_addresses, score_live_features
+
+    m = registry.reload(force=True)
+    known = synth.addresses(len(m.lookup))
+    unknown = synth.addresses(max(BATCHES), seed=1)
+    out = {"registry": {"precomputed": m.scores is not None, **registry.status()["timings"]}}
+
+    # Feature extraction: stacked batch pass, and one large page folded into a state
+    hist = synth.histories(unknown[:max(EXTRACT_BATCHES)])
+    for n in EXTRACT_BATCHES:
+        tx = sum(len(r) for h in hist[:n] for r in h.values())
+        out[f"extract_batch[{n}]"] = _rows_per_s(
+            _time(lambda: features.extract_batch(unknown[:n], hist[:n], synth.T_MAX), min_s), tx)
+    page = synth.history(unknown[0], "txlist", 10000)
+    out["fold[txlist,10000]"] = _rows_per_s(
+        _time(lambda: features.fold(features.new_state(), unknown[0], "txlist", page, synth.T_MAX), min_s), 10000)
+
+    # Known-address scoring per batch size and explain mode (lookup + table path)
+    for explain in ("none", "top3"):
+        for n in BATCHES:
+            addrs = known[:n]
+            out[f"score_addresses[{explain},{n}]"] = _rows_per_s(
+                _time(lambda: score_addresses(addrs, explain=explain), min_s), n)
+
+    # Live-feature scoring (model path, no table)
+    feats = features.extract_batch(unknown[:max(EXTRACT_BATCHES)], hist, synth.T_MAX)
+    for explain in ("none", "top3"):
+        for n in (1, 16, 128):
+            out[f"score_live_features[{explain},{n}]"] = _rows_per_s(
+                _time(lambda: score_live_features(unknown[:n], feats[:n], explain=explain), min_s), n)
+
+    # Funding-graph components over a whole job (farm members plus independent funders)
+    for n in CLUSTER_SIZES:
+        addrs = synth.addresses(n, seed=4)
+        funders = [synth.farm(a) or "0x%040x" % i for i, a in enumerate(addrs)]
+        out[f"cluster.components[{n}]"] = _rows_per_s(
+            _time(lambda: clusters.components(addrs, funders), min_s), n)
+
+    # Raw tree engine
+    if m.engine is not None:
+        X = np.asarray(m.lookup.matrix[:max(BATCHES)], dtype=float)
+        for n in BATCHES:
+            out[f"engine.lgb_proba[{n}]"] = _rows_per_s(_time(lambda: m.engine.lgb_proba(X[:n]), min_s), n)
+            out[f"engine.iso_score[{n}]"] = _rows_per_s(_time(lambda: m.engine.iso_score(X[:n]), min_s), n)
+        for n in BATCHES[:3]:
+            out[f"engine.contributions[{n}]"] = _rows_per_s(_time(lambda: m.engine.contributions(X[:n]), min_s), n)
+    return out
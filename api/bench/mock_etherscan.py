@@ -0,0 +1,113 @@
+"""
+Local Etherscan v2 stand-in for load tests.
+
+Serves module=account (txlist / txlistinternal / tokentx / tokennfttx) with
+startblock / endblock / page / offset and module=block getblocknobytime, from
+the deterministic histories in bench.synth, with Etherscan's response shapes:
+"No transactions found" for empty pages and the NOTOK "Max rate limit reached"
+body when a key goes over `rps` (or at random with probability `rate_limit_p`).
+Every `big_every`-th address has `big_rows` rows per endpoint, so block-range
+paging and the 10k-row page cap get exercised. POST /callback is a job
+webhook receiver that answers 503 to the first `callback_failures` attempts
+per job, so callback retries get exercised too.
+
+    python -m bench mock --port 8900 --latency-ms 80 --rps 5
+    ETHERSCAN_API_URL=http://127.0.0.1:8900/v2/api uvicorn main:app
+"""
+
+import json
+import time
+import bisect
+import random
+import asyncio
+import hashlib
+import functools
+from collections import Counter
+from fastapi import FastAPI, Request, Response
+from bench import synth
+
+_NO_TX = {"status": "0", "message": "No transactions found", "result": []}
+_LIMITED = {"status": "0", "message": "NOTOK", "result": "Max rate limit reached"}
+
+
+def create_app(latency_ms: float = 0.0, jitter_ms: float = 0.0, rps: float = 0.0,
+               rate_limit_p: float = 0.0, big_every: int = 0, big_rows: int = 25000,
+               callback_failures: int = 0, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="etherscan-mock")
+    rng = random.Random(seed)
+    windows = {}              # apikey → (second, requests in it)
+    stats = Counter()
+    attempts = Counter()      # job_id → callback attempts
+
+    def _big(addr: str) -> bool:
+        if not big_every:
+            return False
+        return int(hashlib.blake2b(addr.encode(), digest_size=4).hexdigest(), 16) % big_every == 0
+
+    @functools.lru_cache(maxsize=2048)
+    def _rows(addr: str, action: str) -> tuple:
+        rows = synth.history(addr, action, big_rows if _big(addr) else None)
+        return tuple(rows), [int(r["blockNumber"]) for r in rows]
+
+    def _limited(key: str) -> bool:
+        if rate_limit_p and rng.random() < rate_limit_p:
+            return True
+        if not rps:
+            return False
+        sec = int(time.monotonic())
+        start, n = windows.get(key, (sec, 0))
+        if start != sec:
+            start, n = sec, 0
+        windows[key] = (start, n + 1)
+        return n + 1 > rps
+
+    @app.get("/v2/api")
+    async def api(request: Request):
+        q = request.query_params
+        stats["requests"] += 1
+        if latency_ms or jitter_ms:
+            await asyncio.sleep((latency_ms + rng.uniform(0, jitter_ms)) / 1000)
+        if _limited(q.get("apikey", "")):
+            stats["rate_limited"] += 1
+            return _LIMITED
+        module, action = q.get("module"), q.get("action")
+        if module == "block" and action == "getblocknobytime":
+            return {"status": "1", "message": "OK",
+                    "result": str(max(0, (int(q["timestamp"]) - synth.GENESIS_TS) // 12))}
+        if module != "account" or action not in ("txlist", "txlistinternal", "tokentx", "tokennfttx"):
+            return {"status": "0", "message": "NOTOK", "result": "Error! Invalid module or action"}
+        rows, blocks = _rows(q.get("address", "").lower(), action)
+        lo, hi = int(q.get("startblock", 0)), int(q.get("endblock", 99999999))
+        offset, page = int(q.get("offset", 10000)), int(q.get("page", 1))
+        a, b = bisect.bisect_left(blocks, lo), bisect.bisect_right(blocks, hi)
+        if q.get("sort") == "desc":
+            sel = list(reversed(rows[a:b]))
+        else:
+            sel = list(rows[a:b])
+        sel = sel[(page - 1) * offset:page * offset]
+        stats["rows"] += len(sel)
+        if not sel:
+            return _NO_TX
+        # Skip FastAPI's per-field encoder: a 10k-row page would make the mock the bottleneck
+        return Response(json.dumps({"status": "1", "message": "OK", "result": sel}), media_type="application/json")
+
+    @app.post("/callback")
+    async def callback(request: Request):
+        job = (await request.json()).get("job_id")
+        attempts[job] += 1
+        if attempts[job] <= callback_failures:
+            stats["callback_rejected"] += 1
+            return Response(status_code=503)
+        stats["callbacks"] += 1
+        return {"ok": True}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def serve(host: str = "127.0.0.1", port: int = 8900, **kw):
+    import uvicorn
+    uvicorn.run(create_app(**kw), host=host, port=port, log_level="warning")
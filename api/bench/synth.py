@@ -0,0 +1,194 @@
+"""
+Synthetic models, lookup store and transaction histories for the benchmarks.
+
+Features follow the shape of the labeled T-30 table (heavy-tailed positives,
+~20% all-zero rows, timestamps in 2016–2023) for whatever models/feature_names.json
+lists, so model size and lookup layout track the real ones without the data.
+Histories are a pure function of (address, endpoint): the mock server and the
+microbenchmarks see the same rows without storing them. A FARM_SHARE of
+addresses is seeded from one of FARMS shared wallets (their first normal
+transaction is an inbound transfer from it), so funding clusters exist.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import subprocess
+import numpy as np
+
+_BASE = os.path.dirname(os.path.abspath(__file__))
+FEATURE_NAMES_PATH = os.path.join(_BASE, "..", "models", "feature_names.json")
+WORK_DIR = os.getenv("SYBILSCAN_BENCH_DIR", "/tmp/sybilscan-bench")
+
+T_MIN, T_MAX = 1_450_000_000, 1_700_000_000
+GENESIS_TS = 1_438_269_988          # ETH block 0; blocks are 12 s apart from here
+_TOKENS = ("WETH", "USDC", "BLUR", "UNI-V2", "CAKE-LP", "PEPE")
+FARMS, FARM_SHARE = 500, 0.2
+
+
+def model_dir(work: str = WORK_DIR) -> str:
+    return os.path.join(work, "models")
+
+
+def lookup_dir(work: str = WORK_DIR) -> str:
+    return os.path.join(work, "lookup")
+
+
+# ── features + models ───────────────────────────────────────
+
+def features(n: int, feature_names: list, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = np.empty((n, len(feature_names)))
+    for j, name in enumerate(feature_names):
+        if name.endswith("_ts") and name != "buy_first_ts":
+            X[:, j] = rng.uniform(T_MIN, T_MAX, n)
+        else:
+            X[:, j] = rng.lognormal(np.log(rng.uniform(1, 60)), 1.5, n)
+    X[rng.random(n) < 0.2] = 0.0
+    return X
+
+
+def labels(X: np.ndarray, seed: int = 0) -> np.ndarray:
+    """~9% positives from a noisy rule over the first few columns."""
+    rng = np.random.default_rng(seed + 1)
+    z = np.log1p(np.abs(X[:, :6])) @ rng.normal(size=min(6, X.shape[1]))
+    z += rng.normal(scale=z.std() / 2 + 1e-9, size=len(z))
+    return (z > np.quantile(z, 0.91)).astype(int)
+
+
+def make_models(out_dir: str, feature_names: list, rows: int = 20000, trees: int = 200, seed: int = 0):
+    """LightGBM classifier + IsolationForest with the production file names."""
+    import joblib
+    import lightgbm as lgb
+    from sklearn.ensemble import IsolationForest
+
+    X = features(rows, feature_names, seed)
+    y = labels(X, seed)
+    clf = lgb.LGBMClassifier(n_estimators=trees, num_leaves=31, learning_rate=0.05,
+                             random_state=seed, verbose=-1)
+    clf.fit(X, y)
+    iso = IsolationForest(n_estimators=100, random_state=seed).fit(X)
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(clf, os.path.join(out_dir, "lgb_blur_t30.joblib"))
+    joblib.dump(iso, os.path.join(out_dir, "iso_blur.joblib"))
+    with open(os.path.join(out_dir, "feature_names.json"), "w") as f:
+        json.dump(feature_names, f)
+
+
+def addresses(n: int, seed: int = 0) -> list:
+    """Deterministic 0x addresses (lookup rows use seed 0; live scenarios use others)."""
+    raw = np.random.default_rng(seed + 1000).bytes(20 * n)
+    return ["0x" + raw[i:i + 20].hex() for i in range(0, 20 * n, 20)]
+
+
+def make_lookup(out_dir: str, feature_names: list, rows: int = 200000, seed: int = 0):
+    from services.lookup import LookupStore, _to_keys
+
+    addrs = addresses(rows, seed)
+    keys, _ = _to_keys(addrs)
+    funders, _ = _to_keys([farm(a) or "" for a in addrs])
+    order = np.argsort(keys, kind="stable")
+    matrix = features(rows, feature_names, seed + 2).astype(np.float64)
+    LookupStore(keys[order], np.ascontiguousarray(matrix[order]), feature_names,
+                funders=funders[order]).save(out_dir, source="synthetic")
+
+
+def generate(work: str = WORK_DIR, lookup_rows: int = 200000, trees: int = 200, seed: int = 0) -> dict:
+    """Models, lookup store and precomputed score table under `work`. Returns stage timings."""
+    feature_names = json.load(open(FEATURE_NAMES_PATH))
+    timings = {}
+    t = time.perf_counter()
+    make_models(model_dir(work), feature_names, trees=trees, seed=seed)
+    timings["models"] = round(time.perf_counter() - t, 2)
+    t = time.perf_counter()
+    make_lookup(lookup_dir(work), feature_names, rows=lookup_rows, seed=seed)
+    timings["lookup"] = round(time.perf_counter() - t, 2)
+    # Tree export + score table, in a fresh process so the services read env() at import
+    t = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "services.precompute"], cwd=os.path.join(_BASE, ".."),
+                   env={**os.environ, **env(work)}, check=True, stdout=subprocess.DEVNULL)
+    timings["precompute"] = round(time.perf_counter() - t, 2)
+    with open(os.path.join(work, "synth.json"), "w") as f:
+        json.dump({"lookup_rows": lookup_rows, "trees": trees, "seed": seed, "created_at": time.time()}, f)
+    return timings
+
+
+def exists(work: str = WORK_DIR) -> bool:
+    return os.path.exists(os.path.join(work, "synth.json"))
+
+
+def env(work: str = WORK_DIR) -> dict:
+    """Environment that points the services at the synthetic models and lookup."""
+    return {"SYBILSCAN_MODEL_DIR": model_dir(work), "SYBILSCAN_LOOKUP_DIR": lookup_dir(work)}
+
+
+# ── histories ───────────────────────────────────────────────
+
+def _seed(addr: str, kind: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{addr.lower()}:{kind}".encode(), digest_size=8).digest(), "little")
+
+
+def _hex(rng, n: int) -> list:
+    raw = rng.bytes(20 * n)
+    return ["0x" + raw[i:i + 20].hex() for i in range(0, 20 * n, 20)]
+
+
+def farm(addr: str):
+    """Farm wallet that funded `addr`, or None for an independent address."""
+    h = _seed(addr, "farm")
+    if (h % 1000) >= FARM_SHARE * 1000:
+        return None
+    return "0x" + hashlib.blake2b(f"farm:{h // 1000 % FARMS}".encode(), digest_size=20).hexdigest()
+
+
+def history(addr: str, kind: str, rows: int = None) -> list:
+    """
+    Etherscan-shaped rows for `addr` on one endpoint, ascending by block.
+    `rows` defaults to a per-address count between 0 and ~300.
+    """
+    addr = addr.lower()
+    rng = np.random.default_rng(_seed(addr, kind))
+    n = int(rng.integers(0, 300)) if rows is None else rows
+    if not n:
+        return []
+    ts = np.sort(rng.integers(T_MIN, T_MAX, n))
+    blocks = (ts - GENESIS_TS) // 12
+    peers = _hex(rng, 16)
+    contracts = _hex(rng, 8)
+    outgoing = rng.random(n) < 0.5
+    other = rng.integers(0, len(peers), n)
+    value = rng.integers(0, 10**18, n)
+    contract = rng.integers(0, len(contracts), n)
+    out = []
+    for i in range(n):
+        peer = peers[other[i]]
+        row = {
+            "blockNumber": str(blocks[i]),
+            "timeStamp":   str(ts[i]),
+            "hash":        "0x%064x" % (_seed(addr, kind) ^ i),
+            "from":        addr if outgoing[i] else peer,
+            "to":          peer if outgoing[i] else addr,
+            "value":       str(value[i]),
+        }
+        if kind in ("tokentx", "tokennfttx"):
+            row["contractAddress"] = contracts[contract[i]]
+        if kind == "tokentx":
+            row["tokenSymbol"] = _TOKENS[contract[i] % len(_TOKENS)]
+            row["tokenDecimal"] = "18"
+        if kind == "tokennfttx":
+            row["tokenID"] = str(i)
+            del row["value"]
+        out.append(row)
+    funder = farm(addr) if kind == "txlist" else None
+    if funder is not None:
+        seeded = T_MIN - 86400       # before any other row on every endpoint
+        out[0].update({"from": funder, "to": addr, "value": str(10**17),
+                       "timeStamp": str(seeded), "blockNumber": str((seeded - GENESIS_TS) // 12)})
+    return out
+
+
+def histories(addrs: list, rows: int = None) -> list:
+    from services.features import ENDPOINTS
+    return [{kind: history(a, kind, rows) for kind in ENDPOINTS} for a in addrs]
@@ -1,22 +1,68 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from routes.score import router as score_router
 from routes.keys import router as keys_router
+from services import auth, etherscan, jobs, metrics, registry
 
-app = FastAPI(title="SybilScan API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loader = registry.start()
+    etherscan.get_client()
+    await jobs.start()
+    credits = asyncio.create_task(auth.run_flusher())
+    lag = asyncio.create_task(metrics.watch_loop())
+    yield
+    for t in (credits, loader, lag):
+        t.cancel()
+    await asyncio.gather(credits, loader, lag, return_exceptions=True)
+    await jobs.stop()
+    await etherscan.close_client()
+
+
+app = FastAPI(title="SybilScan API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(metrics.Middleware)
 
 app.include_router(score_router)
 app.include_router(keys_router)
 
 
+@app.exception_handler(registry.NotReady)
+async def not_ready(request: Request, exc: registry.NotReady):
+    return JSONResponse({"detail": f"Models not ready: {exc}"}, status_code=503, headers={"Retry-After": "1"})
+
+
 @app.get("/health")
 def health():
-    from services.model import lgb_model
-    return {"status": "ok", "model_loaded": lgb_model is not None}
+    """Liveness: never waits on model loading."""
+    return {
+        "status": "ok",
+        "model_loaded": registry.status()["fingerprint"] is not None,
+        "etherscan": etherscan.key_stats(),
+    }
+
+
+@app.get("/ready")
+def ready(response: Response):
+    """Readiness: 200 once models are loaded, with per-stage load timings; 503 until then."""
+    s = registry.status()
+    if s["fingerprint"] is None:
+        response.status_code = 503
+    return s
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition for this worker."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, HTTPException, Request
 from pydantic import BaseModel
-from services.auth import generate_key, validate_key
+from services.auth import generate_key, mint_wait, validate_key
 
 router = APIRouter()
 
@@ -10,7 +10,11 @@ class KeyRequest(BaseModel):
 
 
 @router.post("/v1/keys")
-def create_key(req: KeyRequest):
+def create_key(req: KeyRequest, request: Request):
+    """New API key; each client IP may create API_KEY_MINT_PER_HOUR of them."""
+    wait = mint_wait(request.client.host if request.client else "")
+    if wait:
+        raise HTTPException(429, "Too many keys created", headers={"Retry-After": str(max(1, round(wait)))})
     key = generate_key(req.name)
     import datetime
     return {"key": key, "name": req.name, "created_at": datetime.datetime.utcnow().isoformat()}
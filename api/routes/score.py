@@ -1,7 +1,20 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from services.jobs import create_job, get_job, run_job
+import os
+import re
+import time
+import json
 import asyncio
+from email.utils import formatdate
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from services.jobs import LIVE_FETCH_TIMEOUT_S, LIVE_MAX_CONCURRENCY
+from services.jobs import changes, create_job, export_path, get_job, get_status, get_result, get_results
+from services.jobs import submit, upload_job
+from services.callbacks import valid_url
+from services.etherscan import has_keys
+from services.model import EXPLAIN_MODES
+from services.upload import UploadError, valid_address
+from services.auth import require_key, charge
 
 router = APIRouter()
 
@@ -14,47 +27,316 @@ SUPPORTED_CHAINS = {
 
 class ScoreRequest(BaseModel):
     addresses: list[str]
-    threshold: float = 0.5
+    threshold: float = 0.5    # allowlist download: addresses scoring below this
     chain: str = "eth"
+    live: bool = False        # fetch features for addresses missing from the lookup
+    concurrency: int = 8      # live mode: max in-flight fetches for this job
+    explain: str = "top3"     # none | top3 | full — contributions cost more than the score itself
+    cluster: bool = False     # cluster the batch by funder once scored, raising risk in large clusters
+    callback_url: str = None  # POSTed the final job status when the job finishes
 
 
 class VerifyRequest(BaseModel):
     address: str
     chain: str = "eth"
+    explain: str = "top3"
+
+
+class CrossChainRequest(BaseModel):
+    addresses: list[str]
+    chains: list[str] = []    # default: every supported chain with a usable key
+    explain: str = "none"
+    concurrency: int = 16     # live fetches in flight, shared across all chains and addresses
+    timeout: float = 30.0     # seconds; pairs not fetched by then come back as errors
+
+
+CROSS_CHAIN_MAX_ADDRESSES = 50
+
+
+def _explain_mode(explain: str) -> str:
+    return explain if explain in EXPLAIN_MODES else "top3"
+
+
+async def _callback_url(url: str):
+    if not url:
+        return None
+    if not await valid_url(url):
+        raise HTTPException(400, "callback_url must be an http(s) URL on a public address")
+    return url
 
 
 @router.post("/v1/score")
-async def score(req: ScoreRequest):
+async def score(req: ScoreRequest, key: str = Depends(require_key)):
     """Submit a batch job. Returns job_id for polling."""
     if len(req.addresses) > 50_000:
         raise HTTPException(400, "Max 50,000 addresses per batch")
     chain = req.chain if req.chain in SUPPORTED_CHAINS else "eth"
-    jid = create_job(req.addresses, chain=chain)
-    asyncio.create_task(run_job(jid))
+    jid = await create_job(req.addresses, chain=chain, live=req.live, concurrency=req.concurrency,
+                     explain=_explain_mode(req.explain), cluster=req.cluster, threshold=req.threshold,
+                     callback_url=await _callback_url(req.callback_url))
+    submit(jid)
+    charge(key, len(req.addresses))
     return {"job_id": jid, "status": "pending", "total": len(req.addresses)}
 
 
+@router.post("/v1/score/upload")
+async def score_upload(request: Request, chain: str = "eth", live: bool = False, concurrency: int = 8,
+                       explain: str = "top3", cluster: bool = False, threshold: float = 0.5,
+                       callback_url: str = None, key: str = Depends(require_key)):
+    """
+    Submit a batch job from a streamed body: CSV (first column), NDJSON or one
+    address per line, optionally gzip-compressed. No size cap beyond
+    UPLOAD_MAX_ADDRESSES; scoring starts while the body is still arriving.
+    """
+    chain = chain if chain in SUPPORTED_CHAINS else "eth"
+    callback_url = await _callback_url(callback_url)
+    try:
+        job = await upload_job(
+            request.stream(), chain=chain, live=live, concurrency=concurrency,
+            encoding=request.headers.get("content-encoding", "").lower(), explain=_explain_mode(explain),
+            cluster=cluster, threshold=threshold, callback_url=callback_url,
+        )
+    except UploadError as e:
+        raise HTTPException(400, str(e))
+    charge(key, job["total"])
+    return job
+
+
+RESULTS_PAGE_MAX = 10_000
+_FOLLOW_POLL_S   = 1.0
+_KEEPALIVE_S     = 15.0
+_FILE_CHUNK      = 256 * 1024
+_RANGE           = re.compile(r"bytes=(\d*)-(\d*)")
+
+
 @router.get("/v1/jobs/{job_id}")
-def job_status(job_id: str):
-    j = get_job(job_id)
+async def job_status(job_id: str):
+    """Full job: status, summary, addresses and every result. Prefer /status + /results when polling."""
+    j = await get_job(job_id)
     if not j:
         raise HTTPException(404, "Job not found")
-    scored = [r for r in j["results"] if r.get("score") is not None]
-    summary = {
-        "total":   j["total"],
-        "high":    sum(1 for r in scored if r["risk"] == "high"),
-        "medium":  sum(1 for r in scored if r["risk"] == "medium"),
-        "low":     sum(1 for r in scored if r["risk"] == "low"),
-        "unknown": sum(1 for r in j["results"] if r.get("risk") in ("unknown", "error")),
+    return j
+
+
+@router.get("/v1/jobs/{job_id}/status")
+async def job_status_light(job_id: str):
+    """Status, progress and risk summary without addresses or results."""
+    j = await get_status(job_id)
+    if not j:
+        raise HTTPException(404, "Job not found")
+    return j
+
+
+@router.get("/v1/jobs/{job_id}/results")
+async def job_results(job_id: str, after: int = -1, limit: int = Query(1000, ge=1, le=RESULTS_PAGE_MAX)):
+    """
+    Results in completion order after cursor `after` (start at -1).
+    Pass the returned `next` as `after` to fetch only rows that landed since.
+    """
+    j = await get_status(job_id)
+    if not j:
+        raise HTTPException(404, "Job not found")
+    rows = await get_results(job_id, after=after, limit=limit)
+    nxt = rows[-1][0] if rows else after
+    done = j["status"] not in ("pending", "running") and len(rows) < limit
+    # Stored rows are already JSON; splice them in rather than decode + re-encode
+    body = (
+        f'{{"job_id":"{job_id}","status":"{j["status"]}","next":{nxt},'
+        f'"done":{"true" if done else "false"},"results":[' + ",".join(r for _, r in rows) + "]}"
+    )
+    return Response(body, media_type="application/json")
+
+
+@router.get("/v1/jobs/{job_id}/results.ndjson")
+async def job_results_ndjson(job_id: str, after: int = -1, follow: bool = False):
+    """
+    Stream results after cursor `after` as NDJSON, one result per line.
+    Cursors are contiguous, so a client that read k lines resumes at after + k.
+    With follow=true the stream stays open until the job finishes.
+    """
+    if not await get_status(job_id):
+        raise HTTPException(404, "Job not found")
+
+    async def lines():
+        cursor = after
+        while True:
+            # Status first: once it reads finished, every result is already stored
+            j = await get_status(job_id)
+            finished = j is None or j["status"] not in ("pending", "running")
+            while rows := await get_results(job_id, after=cursor, limit=1000):
+                cursor = rows[-1][0]
+                yield "".join(r + "\n" for _, r in rows)
+            if finished or not follow:
+                return
+            await asyncio.sleep(_FOLLOW_POLL_S)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _sse(event: str, data: str, id: int = None) -> str:
+    return (f"id: {id}\n" if id is not None else "") + f"event: {event}\ndata: {data}\n\n"
+
+
+@router.get("/v1/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, after: int = -1, results: bool = True):
+    """
+    Server-Sent Events for a job, pushed as the runner stores each batch:
+    `progress` (the /status payload) whenever it changes, `results` (a JSON
+    array of newly stored rows; the event id is the cursor, so a reconnect
+    with Last-Event-ID resumes) and a final `done` before the stream closes.
+    Jobs with cluster=true send their rows once clustering has finalised them.
+    """
+    if not await get_status(job_id):
+        raise HTTPException(404, "Job not found")
+    last = request.headers.get("last-event-id", "")
+    cursor = int(last) if last.lstrip("-").isdigit() else after
+
+    async def events():
+        nonlocal cursor
+        sent, quiet = None, time.monotonic()
+        async for _ in changes(job_id):
+            j = await get_status(job_id)
+            if j is None:
+                yield _sse("done", json.dumps({"job_id": job_id, "status": "evicted"}))
+                return
+            finished = j["status"] not in ("pending", "running")
+            if (j["status"], j["completed"], j["total"]) != sent:
+                sent = (j["status"], j["completed"], j["total"])
+                quiet = time.monotonic()
+                yield _sse("progress", json.dumps(j))
+            if results and (finished or not j["cluster"]):
+                while rows := await get_results(job_id, after=cursor, limit=1000):
+                    cursor = rows[-1][0]
+                    quiet = time.monotonic()
+                    yield _sse("results", "[" + ",".join(r for _, r in rows) + "]", cursor)
+            if finished:
+                yield _sse("done", json.dumps(j))
+                return
+            if time.monotonic() - quiet >= _KEEPALIVE_S:
+                quiet = time.monotonic()
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _read(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(_FILE_CHUNK, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _file_response(request: Request, path: str, filename: str) -> Response:
+    """
+    Serve a finished (immutable) file with ETag / If-None-Match and a single
+    byte range (Range, If-Range); multiple or malformed ranges get the whole file.
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "private, max-age=86400",
     }
-    return {**j, "progress": j["completed"] / max(j["total"], 1), "summary": summary}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    start, end, status = 0, size - 1, 200
+    m = _RANGE.fullmatch(request.headers.get("range", "").strip())
+    if m and (m[1] or m[2]) and request.headers.get("if-range", etag) == etag:
+        if m[1]:
+            start, end = int(m[1]), min(int(m[2]), size - 1) if m[2] else size - 1
+        else:
+            start = max(size - int(m[2]), 0)      # suffix range: the last N bytes
+        if start >= size or start > end:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type="application/gzip")
+    return StreamingResponse(_read(path, start, end - start + 1), status_code=status, headers=headers,
+                             media_type="application/gzip")
+
+
+async def _download(request: Request, job_id: str, kind: str, suffix: str) -> Response:
+    j = await get_status(job_id)
+    if not j:
+        raise HTTPException(404, "Job not found")
+    if j["status"] != "complete":
+        raise HTTPException(409, f"Job is {j['status']}; exports are available once it completes")
+    path = await export_path(job_id, kind)
+    return _file_response(request, path, f"sybilscan_{job_id[:8]}{suffix}")
+
+
+@router.api_route("/v1/jobs/{job_id}/results.csv.gz", methods=["GET", "HEAD"])
+async def job_results_csv(job_id: str, request: Request):
+    """Every result as gzip CSV (no contributions), written as the job ran; supports Range."""
+    return await _download(request, job_id, "csv", ".csv.gz")
+
+
+@router.api_route("/v1/jobs/{job_id}/allowlist.csv.gz", methods=["GET", "HEAD"])
+async def job_allowlist(job_id: str, request: Request):
+    """
+    Addresses scoring below the job's `threshold` (and not raised by
+    clustering), as gzip CSV; maintained as the job ran; supports Range.
+    """
+    return await _download(request, job_id, "allowlist", ".allowlist.csv.gz")
+
+
+@router.get("/v1/jobs/{job_id}/results/{address}/explain")
+async def job_result_explain(job_id: str, address: str, mode: str = "full", key: str = Depends(require_key)):
+    """Contributions for one scored row, computed on demand (jobs run with explain=none stay cheap)."""
+    j = await get_status(job_id)
+    if not j:
+        raise HTTPException(404, "Job not found")
+    r = await get_result(job_id, address)
+    if r is None or r.get("data_source") not in ("cached", "live"):
+        raise HTTPException(404, "No score for this address in the job")
+    charge(key)
+    from services.model import explain_address
+    return await explain_address(r["address"], chain=r.get("chain", j["chain"]), explain=_explain_mode(mode))
 
 
 @router.post("/v1/verify")
-async def verify(req: VerifyRequest):
+async def verify(req: VerifyRequest, key: str = Depends(require_key)):
     """Real-time single-address scoring. Supports chain selection."""
-    if not req.address or len(req.address) < 10:
+    if not valid_address(req.address):
         raise HTTPException(400, "Invalid address")
+    charge(key)
     chain = req.chain if req.chain in SUPPORTED_CHAINS else "eth"
     from services.model import score_address_live
-    return await score_address_live(req.address, chain=chain)
+    return await score_address_live(req.address, chain=chain, explain=_explain_mode(req.explain))
+
+
+@router.post("/v1/verify/chains")
+async def verify_chains(req: CrossChainRequest, key: str = Depends(require_key)):
+    """
+    Score addresses on several chains at once: fetches run concurrently under
+    one budget and are scored in one batch. One credit per (address, chain)
+    queried; chains answered `unsupported` (no key for them) are not charged.
+    """
+    if not req.addresses or not all(map(valid_address, req.addresses)):
+        raise HTTPException(400, "Invalid address")
+    if len(req.addresses) > CROSS_CHAIN_MAX_ADDRESSES:
+        raise HTTPException(400, f"Max {CROSS_CHAIN_MAX_ADDRESSES} addresses per call")
+    # default: the chains the configured keys can query (paid-tier chains need their own key)
+    chains = list(dict.fromkeys(req.chains)) or sorted(c for c in SUPPORTED_CHAINS if has_keys(c))
+    unknown = [c for c in chains if c not in SUPPORTED_CHAINS]
+    if unknown:
+        raise HTTPException(400, f"Unsupported chain(s): {', '.join(unknown)}")
+    from services.model import score_cross_chain
+    results = await score_cross_chain(
+        req.addresses, chains, explain=_explain_mode(req.explain),
+        concurrency=max(1, min(req.concurrency, LIVE_MAX_CONCURRENCY)),
+        timeout=max(0.1, min(req.timeout, LIVE_FETCH_TIMEOUT_S)),
+    )
+    charge(key, sum(len(chains) - len(r["chains_unsupported"]) for r in results))
+    return {"chains": chains, "results": results}
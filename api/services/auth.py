@@ -1,28 +1,305 @@
+"""
+API-key registry backed by data/api_keys.json.
+
+Keys are served from memory and reloaded only when the file changes. Credit
+usage is counted in memory and folded into the file in batches; every write
+goes through a temp file + os.replace under an exclusive file lock, so
+concurrent writers (other uvicorn workers, key generation) never lose data.
+Each key also gets a token bucket, filled in credits (one per address scored)
+and drained by what each request is charged, so one tenant cannot saturate
+Etherscan or the scoring workers. Keys are required unless
+SYBILSCAN_REQUIRE_KEY=0; anonymous callers then share a single bucket.
+
+Buckets live in a SQLite file (API_BUCKETS_PATH) shared by every worker on
+the host, so `uvicorn --workers N` still gives a key its configured rate, not
+N times it; with API_BUCKETS_PATH="" each process keeps its own. Charges are
+settled on a worker thread. Key creation is limited per client IP the same
+way (API_KEY_MINT_PER_HOUR).
+"""
+
+import os
 import json
+import time
+import asyncio
+import hashlib
 import secrets
-import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from fastapi import Header, HTTPException
+
+try:
+    import fcntl
+except ImportError:       # non-POSIX: in-process lock only
+    fcntl = None
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+KEYS_FILE     = os.getenv("API_KEYS_PATH", os.path.join(_DATA_DIR, "api_keys.json"))
+REQUIRE_KEY   = os.getenv("SYBILSCAN_REQUIRE_KEY", "1") != "0"    # "0": anonymous calls allowed
+KEY_RPS       = float(os.getenv("API_KEY_RPS", "100"))             # credits/s per key; "rps" in a key entry overrides
+KEY_BURST     = float(os.getenv("API_KEY_BURST", "5000"))
+ANON_RPS      = float(os.getenv("API_ANON_RPS", "10"))             # credits/s shared by all anonymous callers
+ANON_BURST    = float(os.getenv("API_ANON_BURST", "500"))
+FLUSH_S       = float(os.getenv("API_KEY_FLUSH_S", "5"))
+MINT_PER_HOUR = float(os.getenv("API_KEY_MINT_PER_HOUR", "5"))       # new keys per client IP; 0: unlimited
+BUCKETS_PATH  = os.getenv("API_BUCKETS_PATH", os.path.join(_DATA_DIR, "api_buckets.sqlite"))
+_STAT_EVERY_S = 1.0                                                # file change check interval
+
+_lock = threading.RLock()
+_keys = {}
+_stamp = None            # (mtime_ns, size) of the loaded file
+_checked = 0.0
+_pending = {}            # key → credits used since the last flush
+_buckets = {}            # bucket name → [credits, updated] without a shared store
+_debits = {}             # key (None: anonymous) → credits charged, not yet taken from its bucket
+_local = threading.local()     # one store connection per thread
+_settling = threading.Lock()   # a popped debit is in its bucket before the next check reads it
 
-KEYS_FILE = "api/data/api_keys.json"
 
+@contextmanager
+def _file_lock():
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(KEYS_FILE)), exist_ok=True)
+        with open(KEYS_FILE + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
-def _load():
-    if not os.path.exists(KEYS_FILE):
-        return {}
-    return json.load(open(KEYS_FILE))
 
+def _stat():
+    try:
+        st = os.stat(KEYS_FILE)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
 
-def _save(d):
-    json.dump(d, open(KEYS_FILE, "w"))
+
+def _read() -> dict:
+    global _keys, _stamp
+    stamp = _stat()
+    if stamp is None:
+        _keys, _stamp = {}, None
+    elif stamp != _stamp:
+        with open(KEYS_FILE) as f:
+            _keys = json.load(f)
+        _stamp = stamp
+    return _keys
+
+
+def _load(force: bool = False) -> dict:
+    """In-memory registry, re-read only when the file's mtime/size changed."""
+    global _checked
+    now = time.monotonic()
+    with _lock:
+        if force or now - _checked >= _STAT_EVERY_S:
+            _checked = now
+            _read()
+        return _keys
+
+
+def _write(d: dict):
+    """Atomically replace the keys file and adopt `d` as the registry. Caller holds _file_lock()."""
+    global _keys, _stamp
+    path = os.path.abspath(KEYS_FILE)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".api_keys.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(d, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _keys, _stamp = d, _stat()
 
 
 def generate_key(name):
-    d = _load()
     key = "sk-" + secrets.token_hex(24)
-    d[key] = {"name": name, "credits_used": 0}
-    _save(d)
+    with _file_lock():
+        d = dict(_load(force=True))
+        d[key] = {"name": name, "credits_used": 0}
+        _write(d)
     return key
 
 
 def validate_key(key):
-    d = _load()
-    return d.get(key)
+    info = _load().get(key)
+    if info is None:
+        return None
+    return {**info, "credits_used": info.get("credits_used", 0) + _pending.get(key, 0)}
+
+
+def charge(key: str, credits: int = 1):
+    """
+    Spend `credits` (one per address) from the caller's bucket and record a
+    key's usage in memory; flush() folds it into the file. The bucket is
+    debited on a worker thread and may go negative, so a large batch is
+    admitted and its cost delays later calls.
+    """
+    with _lock:
+        if _limits(key) is not None:
+            _debits[key] = _debits.get(key, 0) + credits
+        if key:
+            _pending[key] = _pending.get(key, 0) + credits
+    if not _debits:
+        return
+    try:
+        asyncio.get_running_loop().run_in_executor(None, _settle)
+    except RuntimeError:       # not on the event loop: settle here
+        _settle()
+
+
+def flush():
+    """Add pending credit usage to the file in one locked, atomic write."""
+    with _lock:
+        if not _pending:
+            return
+        batch = dict(_pending)
+        _pending.clear()
+    try:
+        with _file_lock():
+            d = dict(_load(force=True))
+            for key, n in batch.items():
+                if key in d:
+                    d[key] = {**d[key], "credits_used": d[key].get("credits_used", 0) + n}
+            _write(d)
+    except Exception:
+        with _lock:
+            for key, n in batch.items():
+                _pending[key] = _pending.get(key, 0) + n
+        raise
+
+
+async def run_flusher():
+    """Background task: flush credits every FLUSH_S (and once more on cancel)."""
+    try:
+        while True:
+            await asyncio.sleep(FLUSH_S)
+            try:
+                await asyncio.to_thread(flush)
+            except OSError:
+                pass   # keep the credits pending; retry next tick
+    finally:
+        flush()
+
+
+def _db():
+    db = getattr(_local, "conn", None)
+    if db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(BUCKETS_PATH)), exist_ok=True)
+        db = sqlite3.connect(BUCKETS_PATH, isolation_level=None, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name    TEXT PRIMARY KEY,
+                credits REAL NOT NULL,
+                updated REAL NOT NULL
+            )""")
+        _local.conn = db
+    return db
+
+
+def _limits(key: str):
+    """(bucket name, rate, burst) for `key` (None: the shared anonymous bucket); None if unlimited."""
+    if key is None:
+        name, rate, burst = "anon", ANON_RPS, ANON_BURST
+    else:
+        name = "key:" + hashlib.sha256(key.encode()).hexdigest()[:16]
+        rate, burst = float(_load().get(key, {}).get("rps", KEY_RPS)), KEY_BURST
+    return None if rate <= 0 else (name, rate, burst)
+
+
+def _take(name: str, rate: float, burst: float, debit: float = 0.0, need: float = None) -> float:
+    """
+    Refill bucket `name` up to now and subtract `debit` (only if it holds at
+    least `need`, when given); returns the credits it held before the debit.
+    Blocks on the shared store, so call it off the event loop.
+    """
+    now = time.time()
+    if not BUCKETS_PATH:
+        with _lock:
+            b = _buckets.setdefault(name, [burst, now])
+            b[0] = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+            held = b[0]
+            if need is None or held >= need:
+                b[0] -= debit
+            return held
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute("SELECT credits, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        held = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+        credits = held - debit if need is None or held >= need else held
+        db.execute("INSERT OR REPLACE INTO buckets (name, credits, updated) VALUES (?, ?, ?)",
+                   (name, credits, now))
+        db.execute("COMMIT")
+    except BaseException:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+    return held
+
+
+def _settle():
+    """Take the charges recorded by charge() from their buckets."""
+    with _settling:
+        with _lock:
+            batch = dict(_debits)
+            _debits.clear()
+        for key, credits in batch.items():
+            lim = _limits(key)
+            if lim is not None:
+                _take(*lim, debit=credits)
+
+
+def _wait(key: str) -> float:
+    """0 if the caller has a credit left, else the seconds until it has one again."""
+    lim = _limits(key)
+    if lim is None:
+        return 0.0
+    with _settling:
+        with _lock:
+            debit = _debits.pop(key, 0)
+        credits = _take(*lim, debit=debit) - debit
+    return 0.0 if credits >= 1 else (1 - credits) / lim[1]
+
+
+def mint_wait(ip: str) -> float:
+    """Spend one of `ip`'s key-creation credits: 0 if it had one, else the seconds until it will."""
+    if MINT_PER_HOUR <= 0:
+        return 0.0
+    rate = MINT_PER_HOUR / 3600
+    held = _take(f"mint:{ip}", rate, MINT_PER_HOUR, debit=1, need=1)
+    return 0.0 if held >= 1 else (1 - held) / rate
+
+
+def require_key(authorization: str = Header(None), x_api_key: str = Header(None)):
+    """
+    FastAPI dependency: resolve the caller's key (Bearer token or X-API-Key)
+    and turn it away while its bucket is empty; the route then charge()s what
+    the request costs. Returns the key, or None for anonymous calls when
+    SYBILSCAN_REQUIRE_KEY=0 (they share one bucket).
+    """
+    key = x_api_key
+    if authorization and authorization.startswith("Bearer "):
+        key = authorization[7:]
+    if not key:
+        if REQUIRE_KEY:
+            raise HTTPException(401, "API key required")
+        key = None
+    elif key not in _load():
+        raise HTTPException(401, "Invalid API key")
+    wait = _wait(key)
+    if wait:
+        raise HTTPException(429, "Rate limit exceeded", headers={"Retry-After": str(max(1, round(wait)))})
+    return key
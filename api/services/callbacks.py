@@ -0,0 +1,117 @@
+"""
+Job completion callbacks (webhooks).
+
+When a job submitted with a `callback_url` finishes (complete or failed), its
+status payload is POSTed there as JSON. Network errors, 5xx, 408 and 429 are
+retried with exponential backoff (CALLBACK_BACKOFF_S doubling, with jitter,
+capped at a minute) up to CALLBACK_RETRIES times; other 4xx answers are
+final. The outcome is kept on the job as `callback_status` (pending,
+delivered, or "failed: <reason>"). With CALLBACK_SECRET set, each request
+carries X-SybilScan-Signature: sha256=<HMAC of the body> so receivers can
+check it came from this service.
+
+Callback URLs must resolve to public addresses only, both when the job is
+submitted and before every attempt (so a host cannot be re-pointed at an
+internal one later): loopback, private, link-local and other non-global
+targets are refused unless listed in CALLBACK_ALLOW_HOSTS (host names, IPs or
+CIDR ranges, comma-separated). Each attempt then connects to the address that
+was just checked, with the original Host header and TLS server name, so a
+second lookup cannot be answered with a different (internal) address.
+"""
+
+import os
+import hmac
+import json
+import random
+import asyncio
+import hashlib
+import ipaddress
+from urllib.parse import urlsplit
+import httpx
+from services import metrics
+
+CALLBACK_RETRIES   = int(os.getenv("CALLBACK_RETRIES", "6"))
+CALLBACK_BACKOFF_S = float(os.getenv("CALLBACK_BACKOFF_S", "1"))
+CALLBACK_TIMEOUT_S = float(os.getenv("CALLBACK_TIMEOUT_S", "10"))
+CALLBACK_SECRET    = os.getenv("CALLBACK_SECRET", "")
+CALLBACK_ALLOW_HOSTS = [h.strip().lower() for h in os.getenv("CALLBACK_ALLOW_HOSTS", "").split(",") if h.strip()]
+_BACKOFF_MAX_S     = 60.0
+
+
+def _allowed(host: str, ip) -> bool:
+    """A non-public target that CALLBACK_ALLOW_HOSTS lets through."""
+    for entry in CALLBACK_ALLOW_HOSTS:
+        if entry == host:
+            return True
+        try:
+            if ip in ipaddress.ip_network(entry, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+async def _resolve(url: str):
+    """The address to connect to for an http(s) URL, if it resolves only to public (or allow-listed) ones."""
+    try:
+        u = urlsplit(url)
+        host, port = u.hostname, u.port
+    except ValueError:
+        return None
+    if u.scheme not in ("http", "https") or not host:
+        return None
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port or 443, proto=6)
+    except OSError:
+        return None
+    ips = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    for ip in ips:
+        if (not ip.is_global or ip.is_multicast) and not _allowed(host.lower(), ip):
+            return None
+    return ips[0] if ips else None
+
+
+async def valid_url(url: str) -> bool:
+    """An http(s) URL whose host resolves only to public addresses (or allow-listed ones)."""
+    return await _resolve(url) is not None
+
+
+def _retryable(status: int) -> bool:
+    return status >= 500 or status in (408, 429)
+
+
+async def deliver(url: str, payload: dict) -> str:
+    """POST `payload` to `url` until it is accepted or retries run out; returns the outcome."""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    headers = {"Content-Type": "application/json", "X-SybilScan-Event": "job.finished"}
+    if CALLBACK_SECRET:
+        sig = hmac.new(CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-SybilScan-Signature"] = f"sha256={sig}"
+    last = ""
+    async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT_S) as client:
+        for attempt in range(CALLBACK_RETRIES + 1):
+            if attempt:
+                metrics.CALLBACKS.inc("retry")
+                delay = min(CALLBACK_BACKOFF_S * 2 ** (attempt - 1), _BACKOFF_MAX_S)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            ip = await _resolve(url)
+            if ip is None:
+                last = "non-public address"
+                break
+            # Connect to the address just checked rather than letting httpx look the name up again
+            target = httpx.URL(url)
+            try:
+                r = await client.post(target.copy_with(host=str(ip)), content=body,
+                                      headers={**headers, "Host": target.netloc.decode("ascii")},
+                                      extensions={"sni_hostname": target.host})
+            except httpx.HTTPError as e:
+                last = type(e).__name__
+                continue
+            if r.is_success:
+                metrics.CALLBACKS.inc("delivered")
+                return "delivered"
+            last = f"HTTP {r.status_code}"
+            if not _retryable(r.status_code):
+                break
+    metrics.CALLBACKS.inc("failed")
+    return f"failed: {last}"
@@ -0,0 +1,127 @@
+"""
+Funding-graph clustering: an optional post-scoring stage for batch jobs.
+
+Sybil farms are usually seeded from one wallet, so addresses whose first
+inbound transfer came from the same sender (or chain of senders) belong
+together. Every job address with a known funder — live results carry
+`funded_by`; lookup hits take the funder recorded in the lookup store (the
+labeled CSV's funded_by column), else the feature cache, filled by any earlier
+live fetch on the job's chain — is linked to that funder, and connected
+components over the whole job are found in one sparse-graph pass (scipy,
+which scikit-learn already depends on). A funder that is itself a job
+address chains its cluster onto its own funder's.
+
+Rows that are part of a cluster get `cluster_id` (numbered in input order)
+and `cluster_size` (job addresses in it); members of clusters of at least
+CLUSTER_MIN_SIZE have their risk raised one level, the model's verdict kept
+as `model_risk`. Addresses with no funding edge are left as they are; the
+summary counts those whose funder is not known at all (`unknown_funder`), so
+a job over a lookup without funders says so instead of silently finding
+nothing.
+Only the fields involved are read and merged back (SQLite JSON functions, a
+page at a time), so rows are never decoded in Python and memory stays at a few
+small tuples per address.
+"""
+
+import os
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from services import feature_cache, job_store, metrics, registry
+
+CLUSTER_MIN_SIZE = int(os.getenv("CLUSTER_MIN_SIZE", "5"))
+# Shared funders that say nothing about common control (exchange hot wallets, bridges, faucets)
+CLUSTER_IGNORE_FUNDERS = {a.strip().lower() for a in os.getenv("CLUSTER_IGNORE_FUNDERS", "").split(",") if a.strip()}
+
+_PAGE   = 5000
+_RAISED = {"low": "medium", "medium": "high"}
+
+
+def components(addrs: list, funders: list) -> tuple:
+    """
+    (cluster id, cluster size) per address for addresses linked to their
+    funders; -1 / 0 where an address has no funding edge at all. Repeated
+    addresses are one node.
+    """
+    if not addrs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    nodes = {}
+    row = np.fromiter((nodes.setdefault(a, len(nodes)) for a in addrs), dtype=np.int64, count=len(addrs))
+    members = len(nodes)                   # job addresses are nodes 0 … members-1
+    src = [row[i] for i, f in enumerate(funders) if f]
+    dst = [nodes.setdefault(f, len(nodes)) for f in funders if f]
+    n = len(nodes)
+    graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    linked = np.bincount(np.asarray(src + dst, dtype=np.int64), minlength=n) > 0
+    size = np.bincount(labels[:members], minlength=n)
+    label, has = labels[row], linked[row]
+    # Number clusters by first appearance so ids read naturally in input order
+    ids = np.full(n, -1, dtype=np.int64)
+    seen = label[has]
+    uniq, first = np.unique(seen, return_index=True)
+    ids[uniq[np.argsort(first)]] = np.arange(len(uniq))
+    return np.where(has, ids[label], -1), np.where(has, size[label], 0)
+
+
+_FIELDS = ("address", "data_source", "funded_by", "risk", "model_risk", "score")
+
+
+def _pages(job_id: str):
+    """Yield pages of (n, *_FIELDS) over a job's stored results."""
+    after = -1
+    while True:
+        page = job_store.result_fields(job_id, _FIELDS, after=after, limit=_PAGE)
+        if not page:
+            return
+        after = page[-1][0]
+        yield page
+
+
+def cluster_job(job_id: str, chain: str) -> dict:
+    """Cluster a finished job's addresses by funder and annotate its results. Returns the summary."""
+    store = registry.current().lookup
+    rows, addrs, funders = [], [], []
+    unknown = 0
+    for page in _pages(job_id):
+        lookup = [a for _, a, src, f, *_ in page if f is None and src == "cached"]
+        known = store.funders_of(lookup) if lookup else {}
+        rest = [a for a in lookup if a not in known]
+        if rest:
+            known.update(feature_cache.funders(chain, rest))
+        for n, addr, _, f, risk, model_risk, score in page:
+            f = f or known.get(addr)
+            unknown += not f
+            rows.append((n, model_risk or risk, score is not None))   # model_risk: a resumed job re-runs the stage
+            addrs.append(addr)
+            funders.append(None if f in CLUSTER_IGNORE_FUNDERS else f)
+
+    with metrics.stage("cluster"):
+        ids, sizes = components(addrs, funders)
+    del addrs
+
+    flagged, updates = 0, []
+    for (n, risk, scored), cid, size, funder in zip(rows, ids.tolist(), sizes.tolist(), funders):
+        if cid < 0:
+            continue
+        fields = {"funded_by": funder, "cluster_id": cid, "cluster_size": size, "risk": risk, "model_risk": None}
+        if size >= CLUSTER_MIN_SIZE and scored and risk in _RAISED:
+            fields.update(risk=_RAISED[risk], model_risk=risk)
+            flagged += 1
+        updates.append((n, fields))
+        if len(updates) >= _PAGE:
+            job_store.update_results(job_id, updates)
+            updates = []
+    job_store.update_results(job_id, updates)
+
+    summary = {
+        "linked":         int((ids >= 0).sum()),
+        "clusters":       len(np.unique(ids[sizes >= 2])),
+        "largest":        int(sizes.max()) if len(sizes) else 0,
+        "flagged":        flagged,
+        "unknown_funder": unknown,
+        "min_size":       CLUSTER_MIN_SIZE,
+    }
+    job_store.set_clusters(job_id, summary)
+    return summary
@@ -7,6 +7,8 @@ import asyncio
 import os
 import time
 import httpx
+from services import feature_cache, features, metrics
+from services.keypool import KeyPool
 
 # ── API Keys (set env vars or fall back to defaults) ─────────────────────────
 CHAIN_CONFIG = {
@@ -23,61 +25,242 @@ CHAIN_CONFIG = {
     "celo":     {"chainid": 42220,   "key": os.getenv("ETHERSCAN_ETH",  "EH2EBW54AHN4JC1DR5ZC12GDKFG554JX7D")},
     "moonbeam": {"chainid": 1284,    "key": os.getenv("ETHERSCAN_ETH",  "EH2EBW54AHN4JC1DR5ZC12GDKFG554JX7D")},
     # Paid tier only
-    "base":     {"chainid": 8453,    "key": os.getenv("ETHERSCAN_BASE", "")},
-    "op":       {"chainid": 10,      "key": os.getenv("ETHERSCAN_OP",   "")},
-    "bsc":      {"chainid": 56,      "key": os.getenv("ETHERSCAN_BSC",  "")},
+    "base":     {"chainid": 8453,    "key": os.getenv("ETHERSCAN_BASE", ""), "paid": True},
+    "op":       {"chainid": 10,      "key": os.getenv("ETHERSCAN_OP",   ""), "paid": True},
+    "bsc":      {"chainid": 56,      "key": os.getenv("ETHERSCAN_BSC",  ""), "paid": True},
 }
 
-# Etherscan v2 — single endpoint, chain routed by chainid
-BASE = "https://api.etherscan.io/v2/api"
+# Etherscan v2 — single endpoint, chain routed by chainid (override to point at a stand-in, e.g. bench/mock_etherscan.py)
+BASE = os.getenv("ETHERSCAN_API_URL", "https://api.etherscan.io/v2/api")
 
-# Fallback keys for ETH (round-robin)
+# Fallback keys for ETH (extra keys via ETHERSCAN_KEYS=k1,k2,…)
 _ETH_KEYS = [
     "EH2EBW54AHN4JC1DR5ZC12GDKFG554JX7D",
     "NPSPUHS61RHBNF49VJTZT23KE8PBV2PZ7A",
-]
-_key_idx = 0
-
-def _get_key(chain: str) -> str:
-    global _key_idx
-    cfg = CHAIN_CONFIG.get(chain, CHAIN_CONFIG["eth"])
-    if cfg["key"]:
-        return cfg["key"]
-    # Fall back to ETH keys round-robin
-    k = _ETH_KEYS[_key_idx % len(_ETH_KEYS)]
-    _key_idx += 1
-    return k
+] + [k.strip() for k in os.getenv("ETHERSCAN_KEYS", "").split(",") if k.strip()]
+
+
+class EtherscanError(Exception):
+    """Upstream failure (as opposed to an address with no transactions)."""
+
+
+class EtherscanRequestError(EtherscanError):
+    """Etherscan rejected the request itself (bad address, chain not on the key's plan); retrying cannot help."""
+
+
+def _chain_keys(chain: str) -> list:
+    """
+    Keys eligible for `chain`: its dedicated key plus the shared ETH pool on
+    free-tier chains; a paid-tier chain's dedicated key alone (none without
+    one — the free keys would only be refused).
+    """
+    key = CHAIN_CONFIG[chain]["key"]
+    if CHAIN_CONFIG[chain].get("paid"):
+        return [key] if key else []
+    return list(dict.fromkeys(k for k in (key, *_ETH_KEYS) if k))
+
+
+# One token bucket per key (Etherscan limits per key, across chains), shared by
+# every process on the host through ETHERSCAN_KEY_BUDGET_PATH ("" = per process)
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+_keys = KeyPool(
+    rate=float(os.getenv("ETHERSCAN_KEY_RPS", "5")),
+    path=os.getenv("ETHERSCAN_KEY_BUDGET_PATH", os.path.join(_DATA_DIR, "etherscan_keys.sqlite")),
+)
+for _chain in CHAIN_CONFIG:
+    _keys.register(_chain, _chain_keys(_chain))
+
+
+def has_keys(chain: str) -> bool:
+    """Whether live fetches on `chain` can be made with the configured keys."""
+    return chain in CHAIN_CONFIG and bool(_chain_keys(chain))
+
+
+def key_stats() -> dict:
+    return _keys.stats()
+
 
 def _get_chainid(chain: str) -> int:
     return CHAIN_CONFIG.get(chain, CHAIN_CONFIG["eth"])["chainid"]
 
+# ── HTTP client (process-wide, connection-pooled; lifecycle owned by main.lifespan) ──
+_HTTP_TIMEOUT         = float(os.getenv("ETHERSCAN_TIMEOUT", "15"))
+_HTTP_CONNECT_TIMEOUT = float(os.getenv("ETHERSCAN_CONNECT_TIMEOUT", "5"))
+_HTTP_MAX_CONNECTIONS = int(os.getenv("ETHERSCAN_MAX_CONNECTIONS", "100"))
+_HTTP_MAX_KEEPALIVE   = int(os.getenv("ETHERSCAN_MAX_KEEPALIVE", "20"))
+_HTTP_KEEPALIVE_S     = float(os.getenv("ETHERSCAN_KEEPALIVE_EXPIRY", "30"))
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client; created lazily so scripts work without the app lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=_HTTP_KEEPALIVE_S,
+            ),
+            timeout=httpx.Timeout(_HTTP_TIMEOUT, connect=_HTTP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 # T0 reference for Blur Season 2
 BLUR_T0 = 1700525735
 
-# Known Blur Blend contracts (ETH mainnet only; ignored on other chains)
-_KNOWN_BLEND_CONTRACTS = {
-    "0x29469395eaf6f95920e59f858042f0e28d98a20b",
-}
+
+def _key_error(message: str) -> bool:
+    """A NOTOK reply that is the key's fault (so another key may succeed)."""
+    m = message.lower()
+    return "api key" in m and ("invalid" in m or "missing" in m)
 
 
-async def _fetch(client: httpx.AsyncClient, params: dict, chain: str, retries: int = 3) -> dict:
-    params["apikey"] = _get_key(chain)
+async def _fetch(client: httpx.AsyncClient, params: dict, chain: str, retries: int = 4) -> dict:
+    """
+    One Etherscan call. Rate limits, transport errors, 5xx and bad keys are
+    retried (on the best key available); an error about the request itself
+    is raised at once as EtherscanRequestError and leaves the key in good
+    standing, so one bad address cannot evict the shared keys.
+    """
+    chain = chain if chain in CHAIN_CONFIG else "eth"
     params["chainid"] = _get_chainid(chain)
+    action = params.get("action", "")
+    last_error = None
     for attempt in range(retries):
+        if attempt:
+            metrics.ETHERSCAN_RETRIES.inc(chain, action)
+        with metrics.ETHERSCAN_KEY_WAIT.time(chain):
+            key = await _keys.acquire(chain)
+        params["apikey"] = key
         try:
-            resp = await client.get(BASE, params=params, timeout=15)
-            data = resp.json()
-            if data.get("status") == "1":
-                return data
-            if data.get("message") == "No transactions found":
-                return {"result": []}
-            if "rate limit" in str(data.get("result", "")).lower():
-                await asyncio.sleep(1.5)
+            with metrics.ETHERSCAN_SECONDS.time(chain, action):
+                resp = await client.get(BASE, params=params)
+                resp.raise_for_status()
+                data = resp.json()
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            last_error = f"HTTP {status}"
+            if status == 429:
+                _keys.throttled(key)
+                metrics.ETHERSCAN_REQUESTS.inc(chain, action, "rate_limited")
                 continue
+            metrics.ETHERSCAN_REQUESTS.inc(chain, action, "http_error")
+            if status < 500:
+                raise EtherscanRequestError(f"{action} on {chain}: {last_error}") from None
+            _keys.failed(key)
+            continue
+        except (httpx.HTTPError, ValueError) as e:
+            _keys.failed(key)
+            metrics.ETHERSCAN_REQUESTS.inc(chain, action, "http_error")
+            last_error = f"{type(e).__name__}: {e}"
+            continue
+        result = data.get("result")
+        if data.get("status") == "1":
+            _keys.ok(key)
+            metrics.ETHERSCAN_REQUESTS.inc(chain, action, "ok")
+            return data
+        if isinstance(result, list) and not result:
+            # "No transactions found" and friends
+            _keys.ok(key)
+            metrics.ETHERSCAN_REQUESTS.inc(chain, action, "empty")
             return {"result": []}
-        except Exception:
-            await asyncio.sleep(1)
-    return {"result": []}
+        last_error = str(result or data.get("message"))
+        if "rate limit" in last_error.lower():
+            _keys.throttled(key)
+            metrics.ETHERSCAN_REQUESTS.inc(chain, action, "rate_limited")
+            continue
+        metrics.ETHERSCAN_REQUESTS.inc(chain, action, "error")
+        if _key_error(last_error):
+            _keys.failed(key)
+            continue
+        # "Error! Invalid address format", "Free API access is not supported for this chain", …
+        _keys.ok(key)
+        raise EtherscanRequestError(f"{action} on {chain}: {last_error}")
+    metrics.ETHERSCAN_FAILURES.inc(chain, action)
+    raise EtherscanError(f"{action} on {chain} failed after {retries} attempts: {last_error}")
+
+
+_PAGE_SIZE   = 10000                                   # Etherscan's max rows per page
+_MAX_PAGES   = int(os.getenv("ETHERSCAN_MAX_PAGES", "50"))   # per endpoint per refresh
+_LATEST      = 99999999
+_LATEST_SLACK_S = 120       # a t0 this close to now just means "latest block"
+
+# (chain, t0) → last block at or before t0
+_t0_blocks = {}
+_T0_BLOCKS_MAX = 4096
+
+
+async def _block_at(client: httpx.AsyncClient, chain: str, t0: int) -> int:
+    """Resolve t0 to the last block at or before it (cached per chain/t0)."""
+    if t0 >= time.time() - _LATEST_SLACK_S:
+        return _LATEST
+    key = (chain, t0)
+    if key not in _t0_blocks:
+        data = await _fetch(client, {
+            "module": "block", "action": "getblocknobytime",
+            "timestamp": t0, "closest": "before",
+        }, chain)
+        if len(_t0_blocks) >= _T0_BLOCKS_MAX:
+            _t0_blocks.clear()
+        _t0_blocks[key] = int(data["result"])
+    return _t0_blocks[key]
+
+
+class _Truncated(Exception):
+    """_MAX_PAGES pages were read before reaching the end of the block range."""
+
+
+async def _iter_pages(client: httpx.AsyncClient, action: str, addr: str,
+                      startblock: int, endblock: int, chain: str):
+    """
+    Yield ascending pages of `action` rows in [startblock, endblock].
+    Pages advance by block range, so history is not capped by page*offset;
+    a block that straddles a page boundary is re-requested with the next page.
+    Every yielded page ends on a complete block. Raises _Truncated after
+    _MAX_PAGES pages if the range is not exhausted.
+    """
+    for _ in range(_MAX_PAGES):
+        data = await _fetch(client, {
+            "module": "account", "action": action,
+            "address": addr, "startblock": startblock, "endblock": endblock,
+            "sort": "asc", "offset": _PAGE_SIZE, "page": 1,
+        }, chain)
+        rows = data.get("result") or []
+        if len(rows) < _PAGE_SIZE:
+            yield rows
+            return
+        last = int(rows[-1]["blockNumber"])
+        head = [t for t in rows if int(t["blockNumber"]) < last]
+        if head:
+            yield head
+            startblock = last
+        else:
+            # One block fills a whole page; it cannot be split by block range
+            yield rows
+            startblock = last + 1
+    raise _Truncated
+
+
+async def _all(coros):
+    """Run `coros` together; the first failure cancels the rest instead of leaving them on the keys."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
 
 async def fetch_features(address: str, t0: int = None, chain: str = "eth") -> dict:
@@ -85,140 +268,118 @@ async def fetch_features(address: str, t0: int = None, chain: str = "eth") -> di
     Fetch live on-chain features for `address` on the given chain.
     Uses only transactions before timestamp `t0` (defaults to now).
     Returns 18 behavioral features matching the Blur model schema.
+
+    Full history up to t0's block is streamed page by page and folded into
+    running aggregates, which the feature cache keeps: a repeat call within
+    the freshness window costs no API calls, and later calls only request
+    blocks after the last one seen. A history longer than ETHERSCAN_MAX_PAGES
+    pages is folded up to the cap and flagged `_partial`; the next call
+    carries on from there instead of serving it as fresh.
     """
     if t0 is None:
         t0 = int(time.time())
 
     addr = address.lower()
 
-    async with httpx.AsyncClient() as client:
-        tx_data = await _fetch(client, {
-            "module": "account", "action": "txlist",
-            "address": addr, "startblock": 0, "endblock": 99999999,
-            "sort": "asc", "offset": 10000, "page": 1,
-        }, chain)
-        txs = [t for t in (tx_data.get("result") or [])
-               if int(t.get("timeStamp", 0)) < t0]
-
-        int_data = await _fetch(client, {
-            "module": "account", "action": "txlistinternal",
-            "address": addr, "startblock": 0, "endblock": 99999999,
-            "sort": "asc", "offset": 5000, "page": 1,
-        }, chain)
-        int_txs = [t for t in (int_data.get("result") or [])
-                   if int(t.get("timeStamp", 0)) < t0]
+    began = time.perf_counter()
+    state = await asyncio.to_thread(feature_cache.get, chain, addr)
+    if state is not None and (state["as_of"] > t0 or "funder" not in state):
+        # cached history runs past t0 (cannot subtract it back out), or predates funder tracking
+        state = None
+    if state is not None and t0 - state["as_of"] <= feature_cache.FRESH_S and not state.get("truncated"):
+        metrics.FETCH_SECONDS.observe(time.perf_counter() - began, chain, "fresh")
+        return features.finalize(state, t0)
 
-        erc20_data = await _fetch(client, {
-            "module": "account", "action": "tokentx",
-            "address": addr, "startblock": 0, "endblock": 99999999,
-            "sort": "asc", "offset": 5000, "page": 1,
-        }, chain)
-        erc20_txs = [t for t in (erc20_data.get("result") or [])
-                     if int(t.get("timeStamp", 0)) < t0]
+    cache = "refresh" if state is not None else "miss"
+    state = state or features.new_state()
+    state.setdefault("truncated", [])
+    client = get_client()
+    endblock = await _block_at(client, chain, t0)
 
-        nft_data = await _fetch(client, {
-            "module": "account", "action": "tokennfttx",
-            "address": addr, "startblock": 0, "endblock": 99999999,
-            "sort": "asc", "offset": 5000, "page": 1,
-        }, chain)
-        nft_txs = [t for t in (nft_data.get("result") or [])
-                   if int(t.get("timeStamp", 0)) < t0]
-
-    if not txs:
-        return _zero_features()
-
-    timestamps  = [int(t["timeStamp"]) for t in txs]
-    first_ts    = min(timestamps)
-    last_ts     = max(timestamps)
-    recent_cutoff = t0 - 30 * 86400
-
-    out_txs = [t for t in txs if t.get("from", "").lower() == addr]
-    in_txs  = [t for t in txs if t.get("to",   "").lower() == addr]
-
-    tx_count         = len(txs)
-    wallet_age_days  = max((t0 - first_ts) / 86400, 0.01)
-    days_since_last  = max((t0 - last_ts)  / 86400, 0.0)
-    active_span_days = max((last_ts - first_ts) / 86400, 0.01)
-
-    buy_value  = sum(int(t.get("value", 0)) for t in out_txs) / 1e18
-    sell_value = sum(int(t.get("value", 0)) for t in in_txs)  / 1e18
-    int_recv   = sum(int(t.get("value", 0)) for t in int_txs
-                     if t.get("to", "").lower() == addr) / 1e18
-    sell_value += int_recv
-    pnl_proxy  = sell_value - buy_value
-
-    all_contracts = {t["to"].lower() for t in txs if t.get("to")}
-    unique_interactions = len(all_contracts)
-
-    nft_contracts_bought = {
-        t.get("contractAddress", "").lower()
-        for t in nft_txs
-        if t.get("from", "").lower() != addr
-    }
-    buy_collections = len(nft_contracts_bought)
-
-    buy_count  = len(out_txs)
-    sell_count = len(in_txs)
-    sell_ratio = sell_count / max(tx_count, 1)
-    recent_activity = sum(1 for ts in timestamps if ts >= recent_cutoff)
-
-    lp_contracts    = set()
-    blend_in_count  = 0
-    blend_out_count = 0
-    blend_net_value = 0.0
-    for t in erc20_txs:
-        sym = t.get("tokenSymbol", "").upper()
-        if any(x in sym for x in ["LP", "UNI-V2", "CAKE-LP"]):
-            lp_contracts.add(t.get("contractAddress", "").lower())
-        if t.get("contractAddress", "").lower() in _KNOWN_BLEND_CONTRACTS:
-            val = int(t.get("value", 0)) / (10 ** max(int(t.get("tokenDecimal", 18)), 0))
-            if t.get("to", "").lower() == addr:
-                blend_in_count += 1
-                blend_net_value += val
+    async def stream(action: str):
+        start = state["blocks"].get(action, -1) + 1
+        seen = None
+        try:
+            async for page in _iter_pages(client, action, addr, start, endblock, chain):
+                with metrics.stage("features"):
+                    blocks, keep = features.fold(state, addr, action, page, t0)
+                kept = int(keep.sum())
+                if kept:
+                    seen = int(blocks[kept - 1])
+                if kept < len(page):
+                    # Rows are in block (hence time) order: the rest is past t0
+                    state["blocks"][action] = int(blocks[kept]) - 1
+                    break
             else:
-                blend_out_count += 1
-                blend_net_value -= val
+                if endblock != _LATEST:
+                    state["blocks"][action] = endblock
+                elif seen is not None:
+                    state["blocks"][action] = seen
+        except _Truncated:
+            # Pages end on whole blocks: the next refresh resumes after the last one folded in
+            if seen is not None:
+                state["blocks"][action] = seen
+            if action not in state["truncated"]:
+                state["truncated"].append(action)
+            return
+        if action in state["truncated"]:
+            state["truncated"].remove(action)
 
-    lp_count = len(lp_contracts)
+    await _all(stream(action) for action in features.ENDPOINTS)
+    state["as_of"] = t0
+    # recent_activity only ever looks back 30d from a t0 >= as_of
+    state["recent_ts"] = [ts for ts in state["recent_ts"] if ts >= t0 - 30 * 86400]
+    await asyncio.to_thread(feature_cache.put, chain, addr, state)
+    metrics.FETCH_SECONDS.observe(time.perf_counter() - began, chain, cache)
+    return features.finalize(state, t0)
 
-    return {
-        "buy_count":           float(buy_count),
-        "sell_count":          float(sell_count),
-        "tx_count":            float(tx_count),
-        "total_trade_count":   float(tx_count),
-        "buy_value":           float(buy_value),
-        "sell_value":          float(sell_value),
-        "pnl_proxy":           float(pnl_proxy),
-        "buy_collections":     float(buy_collections),
-        "unique_interactions": float(unique_interactions),
-        "sell_ratio":          float(sell_ratio),
-        "wallet_age_days":     float(wallet_age_days),
-        "days_since_last_buy": float(days_since_last),
-        "recent_activity":     float(recent_activity),
-        "blend_in_count":      float(blend_in_count),
-        "blend_out_count":     float(blend_out_count),
-        "blend_net_value":     float(blend_net_value),
-        "LP_count":            float(lp_count),
-        "ratio":               float(blend_in_count / max(tx_count, 1)),
-        # extras for response display
-        "_wallet_age_days":    float(wallet_age_days),
-        "_active_span_days":   float(active_span_days),
-        "_nft_collections":    float(buy_collections),
-        "_unique_contracts":   float(unique_interactions),
-        "_total_volume_eth":   float(buy_value + sell_value),
-        "_first_tx_ts":        float(first_ts),
-        "_last_tx_ts":         float(last_ts),
-    }
 
+# ── single-flight ────────────────────────────────────────────────────────────
+# Concurrent live lookups of one address (an airdrop rush on /v1/verify, a live
+# job overlapping it) share one fetch: callers in the same LIVE_WINDOW_S bucket
+# of t0 await the first caller's task instead of spending four more requests.
+
+LIVE_WINDOW_S = int(os.getenv("LIVE_WINDOW_S", "30"))
+
+_inflight = {}      # (chain, address, t0 bucket) → fetch_features task
+
+
+async def fetch_features_shared(address: str, chain: str = "eth") -> dict:
+    """fetch_features as of now, deduplicated across concurrent callers."""
+    addr = address.lower()
+    key = (chain, addr, int(time.time()) // max(LIVE_WINDOW_S, 1))
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(fetch_features(addr, chain=chain))
 
-def _zero_features() -> dict:
-    keys = [
-        "buy_count", "sell_count", "tx_count", "total_trade_count",
-        "buy_value", "sell_value", "pnl_proxy", "buy_collections",
-        "unique_interactions", "sell_ratio", "wallet_age_days",
-        "days_since_last_buy", "recent_activity", "blend_in_count",
-        "blend_out_count", "blend_net_value", "LP_count", "ratio",
-        "_wallet_age_days", "_active_span_days", "_nft_collections",
-        "_unique_contracts", "_total_volume_eth", "_first_tx_ts", "_last_tx_ts",
-    ]
-    return {k: 0.0 for k in keys}
+        def done(t):
+            _inflight.pop(key, None)
+            if not t.cancelled():
+                t.exception()     # retrieved here in case every caller gave up waiting
+
+        task.add_done_callback(done)
+        metrics.LIVE_FETCHES.inc(chain, "leader")
+    else:
+        metrics.LIVE_FETCHES.inc(chain, "joined")
+    # A caller that times out or disconnects must not cancel the fetch for the others
+    return await asyncio.shield(task)
+
+
+def unsupported_result(addr: str, chain: str) -> dict:
+    """Result payload for a chain no configured key can query (never sent upstream)."""
+    r = error_result(addr, chain, LookupError(f"no Etherscan API key configured for chain '{chain}'"))
+    r.update(risk="unsupported", sybil_type="unsupported", data_source="unsupported")
+    return r
+
+
+def error_result(addr: str, chain: str, e: Exception) -> dict:
+    """Result payload for an address whose live fetch failed."""
+    return {
+        "address":    addr,
+        "score":      None,
+        "risk":       "error",
+        "sybil_type": "error",
+        "error":      str(e) or type(e).__name__,
+        "chain":      chain,
+        "data_source": "error",
+    }
@@ -0,0 +1,117 @@
+"""
+Compact result exports for finished jobs (gzip CSV).
+
+  <job_id>.csv.gz            every result row: scores, risk, type, display
+                             fields, cluster fields; no contributions
+  <job_id>.allowlist.csv.gz  the addresses that pass the job's threshold
+                             (score < threshold, not raised by clustering)
+
+A job that runs start to finish in one runner appends each stored batch to
+both files as it lands (`Writer`); clustered or resumed jobs, and jobs that
+finished before exports existed, are written in one paging pass over the
+stored results (`build`). Either way memory stays constant in the job size,
+and the finished files are served as-is to every later download. Each writer
+works on its own `.part` files and renames them into place when complete, so
+concurrent builds of one job cannot interleave. A writer may be driven from
+several threads (the job runner hands each batch to asyncio.to_thread); its
+calls are serialised and writes after close/discard are dropped.
+"""
+
+import os
+import csv
+import gzip
+import glob
+import json
+import uuid
+import threading
+from services import job_store
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+EXPORT_DIR    = os.getenv("JOB_EXPORT_DIR", os.path.join(_DATA_DIR, "exports"))
+COMPRESSLEVEL = int(os.getenv("JOB_EXPORT_COMPRESSLEVEL", "6"))
+
+KINDS   = ("csv", "allowlist")
+COLUMNS = ("address", "sybil_score", "score", "risk", "sybil_type", "tx_count", "wallet_age_days",
+           "nft_collections", "unique_contracts", "total_volume_eth", "chain", "data_source",
+           "funded_by", "cluster_id", "cluster_size", "model_risk", "error")
+_PAGE = 5000
+
+
+def path(job_id: str, kind: str) -> str:
+    suffix = ".csv.gz" if kind == "csv" else ".allowlist.csv.gz"
+    return os.path.join(EXPORT_DIR, job_id + suffix)
+
+
+def allowed(r: dict, threshold: float) -> bool:
+    return r.get("score") is not None and r["score"] < threshold and r.get("model_risk") is None
+
+
+class Writer:
+    """Both export files of one job, appended to batch by batch."""
+
+    def __init__(self, job_id: str, threshold: float):
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        self.job_id, self.threshold, self.rows = job_id, threshold, 0
+        self._lock = threading.Lock()
+        self._parts = [f"{path(job_id, k)}.{uuid.uuid4().hex[:8]}.part" for k in KINDS]
+        self._files = [gzip.open(p, "wt", newline="", compresslevel=COMPRESSLEVEL) for p in self._parts]
+        self._csv = csv.DictWriter(self._files[0], COLUMNS, extrasaction="ignore")
+        self._csv.writeheader()
+        self._allow = csv.writer(self._files[1])
+        self._allow.writerow(["address"])
+
+    def write(self, results: list):
+        with self._lock:
+            if self._files[0].closed:
+                return
+            self._csv.writerows(results)
+            self._allow.writerows([r["address"]] for r in results if allowed(r, self.threshold))
+            self.rows += len(results)
+
+    def close(self):
+        """Finish both files and move them into place."""
+        with self._lock:
+            for f in self._files:
+                f.close()
+            for k, part in zip(KINDS, self._parts):
+                os.replace(part, path(self.job_id, k))
+
+    def discard(self):
+        with self._lock:
+            for f in self._files:
+                f.close()
+            for part in self._parts:
+                _unlink(part)
+
+
+def build(job_id: str, threshold: float) -> int:
+    """Write a job's exports from its stored results; returns the row count."""
+    w = Writer(job_id, threshold)
+    try:
+        after = -1
+        while page := job_store.results_after(job_id, after=after, limit=_PAGE):
+            after = page[-1][0]
+            w.write([json.loads(r) for _, r in page])
+    except BaseException:
+        w.discard()
+        raise
+    w.close()
+    return w.rows
+
+
+def ready(job_id: str) -> bool:
+    return all(os.path.exists(path(job_id, k)) for k in KINDS)
+
+
+def _unlink(p: str):
+    try:
+        os.remove(p)
+    except FileNotFoundError:
+        pass
+
+
+def remove(job_id: str):
+    for k in KINDS:
+        for p in (path(job_id, k), *glob.glob(glob.escape(path(job_id, k)) + ".*.part")):
+            _unlink(p)
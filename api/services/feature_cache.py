@@ -0,0 +1,126 @@
+"""
+On-disk cache of live-fetched history aggregates, keyed by (chain, address).
+
+Each entry is the mergeable state built by services.etherscan (last block per
+endpoint, running sums, unique-contract sets, …). Entries older than the TTL
+are dropped, and the table is trimmed to FEATURE_CACHE_MAX_ENTRIES by least
+recent access. Set FEATURE_CACHE_PATH="" to disable.
+
+Every thread opens its own connection and there is no process-wide lock, as
+in services.job_store; calls block, so async code runs them through
+asyncio.to_thread (services.etherscan).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+CACHE_PATH  = os.getenv("FEATURE_CACHE_PATH", os.path.join(_DATA_DIR, "feature_cache.sqlite"))
+FRESH_S     = int(os.getenv("FEATURE_CACHE_FRESH_S", "600"))          # serve without any API call
+TTL_S       = int(os.getenv("FEATURE_CACHE_TTL_S", str(7 * 86400)))    # drop entries not refreshed since
+MAX_ENTRIES = int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "200000"))
+_EVICT_EVERY = 500                                                     # puts between eviction sweeps
+_IN_CHUNK    = 500                                                     # addresses per IN (…) query
+
+_local = threading.local()     # one connection per thread; SQLite serialises the writers
+_lock = threading.Lock()       # guards _puts
+_puts = 0
+
+
+def _db():
+    db = getattr(_local, "conn", None)
+    if db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(CACHE_PATH)), exist_ok=True)
+        db = sqlite3.connect(CACHE_PATH, isolation_level=None, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS features (
+                chain        TEXT NOT NULL,
+                address      TEXT NOT NULL,
+                state        TEXT NOT NULL,
+                refreshed_at REAL NOT NULL,
+                accessed_at  REAL NOT NULL,
+                PRIMARY KEY (chain, address)
+            )""")
+        db.execute("CREATE INDEX IF NOT EXISTS features_accessed ON features (accessed_at)")
+        _local.conn = db
+    return db
+
+
+def get(chain: str, address: str):
+    """Cached state for (chain, address), or None if missing/expired."""
+    if not CACHE_PATH:
+        return None
+    now = time.time()
+    db = _db()
+    row = db.execute(
+        "SELECT state, refreshed_at FROM features WHERE chain = ? AND address = ?",
+        (chain, address),
+    ).fetchone()
+    if row is None:
+        return None
+    if now - row[1] > TTL_S:
+        db.execute("DELETE FROM features WHERE chain = ? AND address = ?", (chain, address))
+        return None
+    db.execute(
+        "UPDATE features SET accessed_at = ? WHERE chain = ? AND address = ?",
+        (now, chain, address),
+    )
+    return json.loads(row[0])
+
+
+def put(chain: str, address: str, state: dict):
+    global _puts
+    if not CACHE_PATH:
+        return
+    now = time.time()
+    _db().execute(
+        "INSERT OR REPLACE INTO features (chain, address, state, refreshed_at, accessed_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (chain, address, json.dumps(state, separators=(",", ":")), now, now),
+    )
+    with _lock:
+        _puts += 1
+        sweep = _puts % _EVICT_EVERY == 0
+    if sweep:
+        _evict(now)
+
+
+def funders(chain: str, addresses: list) -> dict:
+    """address → funder for the cached (chain, address) states that have one (no JSON decoding)."""
+    if not CACHE_PATH or not addresses:
+        return {}
+    out = {}
+    db = _db()
+    for i in range(0, len(addresses), _IN_CHUNK):
+        chunk = addresses[i:i + _IN_CHUNK]
+        out.update(db.execute(
+            "SELECT address, json_extract(state, '$.funder[1]') FROM features "
+            f"WHERE chain = ? AND address IN ({','.join('?' * len(chunk))}) "
+            "AND json_extract(state, '$.funder[1]') IS NOT NULL",
+            (chain, *chunk),
+        ).fetchall())
+    return out
+
+
+def _evict(now: float):
+    db = _db()
+    db.execute("DELETE FROM features WHERE refreshed_at < ?", (now - TTL_S,))
+    (count,) = db.execute("SELECT COUNT(*) FROM features").fetchone()
+    if count > MAX_ENTRIES:
+        db.execute(
+            "DELETE FROM features WHERE rowid IN "
+            "(SELECT rowid FROM features ORDER BY accessed_at LIMIT ?)",
+            (count - MAX_ENTRIES,),
+        )
+
+
+def evict():
+    """Run a TTL + LRU sweep now."""
+    if CACHE_PATH:
+        _evict(time.time())
@@ -0,0 +1,374 @@
+"""
+Columnar feature extraction for Etherscan transaction histories.
+
+Each endpoint response is parsed once into flat NumPy columns (timestamps,
+blocks, interned from/to/contract ids, values); every model feature is then a
+vectorized reduction over those columns. Wei values stay exact Python ints
+(object columns) and are summed as ints, as the per-row code did; token
+amounts are parsed only for the Blend rows that use them. Rows from many addresses can be
+stacked with an owner index, so one pass extracts features for a whole batch.
+
+Reductions produce mergeable aggregates (the "state" the feature cache
+stores); `finalize` turns a state into the 18 model features plus the
+`_`-prefixed display extras. The state also keeps the address's funder — the
+sender of its earliest inbound value transfer, normal or internal — which
+services.clusters links addresses by.
+"""
+
+import functools
+import numpy as np
+
+ENDPOINTS = ("txlist", "txlistinternal", "tokentx", "tokennfttx")
+
+# Known Blur Blend contracts (ETH mainnet only; ignored on other chains)
+BLEND_CONTRACTS = {
+    "0x29469395eaf6f95920e59f858042f0e28d98a20b",
+}
+
+_RECENT_S = 30 * 86400
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_lp(symbol: str) -> bool:
+    sym = symbol.upper()
+    return any(x in sym for x in ["LP", "UNI-V2", "CAKE-LP"])
+
+
+class Interner:
+    """Lowercased address ↔ dense int id; id 0 is the empty address."""
+
+    def __init__(self):
+        self.ids = {"": 0}
+        self.names = [""]
+        self._raw = {}
+
+    def id(self, s: str) -> int:
+        i = self._raw.get(s)
+        if i is None:
+            low = s.lower()
+            i = self.ids.get(low)
+            if i is None:
+                i = self.ids[low] = len(self.names)
+                self.names.append(low)
+            self._raw[s] = i
+        return i
+
+    def column(self, rows: list, field: str) -> np.ndarray:
+        get = self.id
+        return np.fromiter((get(t.get(field) or "") for t in rows), dtype=np.int64, count=len(rows))
+
+    def lookup(self, ids) -> list:
+        names = self.names
+        return [names[i] for i in ids]
+
+
+def _int(s, default: int = 0) -> int:
+    """Etherscan numeric field → int; missing or malformed ("", None, …) → `default`."""
+    try:
+        return int(s)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse(kind: str, rows: list, interner: Interner) -> dict:
+    """Parse one endpoint's rows (once) into columns."""
+    n = len(rows)
+    cols = {
+        "ts":    np.fromiter((int(t.get("timeStamp", 0)) for t in rows), dtype=np.int64, count=n),
+        "block": np.fromiter((int(t.get("blockNumber", 0)) for t in rows), dtype=np.int64, count=n),
+        "from":  interner.column(rows, "from"),
+        "to":    interner.column(rows, "to"),
+    }
+    if kind in ("txlist", "txlistinternal"):
+        cols["value"] = np.empty(n, dtype=object)
+        cols["value"][:] = [_int(t.get("value")) for t in rows]
+    if kind in ("tokentx", "tokennfttx"):
+        cols["contract"] = interner.column(rows, "contractAddress")
+    if kind == "tokentx":
+        cols["lp"] = np.fromiter((_is_lp(t.get("tokenSymbol", "")) for t in rows), dtype=bool, count=n)
+        cols["row"] = np.empty(n, dtype=object)     # raw rows: amounts are parsed where needed
+        cols["row"][:] = rows
+    return cols
+
+
+def _int_sums(owner: np.ndarray, values: np.ndarray, mask: np.ndarray, n: int) -> list:
+    """Exact per-owner sums of the int `values` where `mask` holds."""
+    acc = np.zeros(n, dtype=object)
+    np.add.at(acc, owner[mask], values[mask])
+    return acc.tolist()
+
+
+def _take(cols: dict, mask: np.ndarray) -> dict:
+    return {k: v[mask] for k, v in cols.items()}
+
+
+def _groups(owner: np.ndarray, values: np.ndarray, n: int) -> list:
+    """Split `values` into one array per owner (owner order preserved within groups)."""
+    order = np.argsort(owner, kind="stable")
+    bounds = np.searchsorted(owner[order], np.arange(1, n))
+    return np.split(values[order], bounds)
+
+
+def _unique_per_owner(owner: np.ndarray, ids: np.ndarray, n: int) -> list:
+    """Distinct ids per owner, as one array per owner."""
+    if not len(ids):
+        return [ids[:0]] * n
+    width = int(ids.max()) + 1
+    pairs = np.unique(owner * width + ids)
+    return _groups(pairs // width, pairs % width, n)
+
+
+def _first_inbound(cols: dict, owner: np.ndarray, me: np.ndarray, n: int, interner: Interner) -> list:
+    """[ts, sender] of each owner's earliest inbound value transfer (None if it has none)."""
+    mask = (cols["to"] == me) & (cols["from"] != me) & (cols["from"] != 0) & (cols["value"] > 0).astype(bool)
+    out = [None] * n
+    if mask.any():
+        o, ts, src = owner[mask], cols["ts"][mask], cols["from"][mask]
+        order = np.lexsort((ts, o))
+        owners, first = np.unique(o[order], return_index=True)
+        for i, j in zip(owners.tolist(), order[first].tolist()):
+            out[i] = [int(ts[j]), interner.names[src[j]]]
+    return out
+
+
+def reduce(kind: str, cols: dict, owner: np.ndarray, self_ids: np.ndarray, interner: Interner) -> list:
+    """Grouped reductions for one endpoint → one partial aggregate per owner."""
+    n = len(self_ids)
+    me = self_ids[owner]
+    count = np.bincount(owner, minlength=n)
+
+    if kind == "txlist":
+        ts = cols["ts"]
+        out = cols["from"] == me
+        inn = cols["to"] == me
+        first = np.full(n, np.iinfo(np.int64).max)
+        last  = np.full(n, np.iinfo(np.int64).min)
+        np.minimum.at(first, owner, ts)
+        np.maximum.at(last,  owner, ts)
+        out_count = np.bincount(owner, weights=out, minlength=n)
+        in_count  = np.bincount(owner, weights=inn, minlength=n)
+        out_wei   = _int_sums(owner, cols["value"], out, n)
+        in_wei    = _int_sums(owner, cols["value"], inn, n)
+        has_to  = cols["to"] != 0
+        to_sets = _unique_per_owner(owner[has_to], cols["to"][has_to], n)
+        stamps  = _groups(owner, ts, n)
+        funders = _first_inbound(cols, owner, me, n, interner)
+        return [
+            {
+                "tx_count":  int(count[i]),
+                "out_count": int(out_count[i]),
+                "in_count":  int(in_count[i]),
+                "out_wei":   out_wei[i],
+                "in_wei":    in_wei[i],
+                "first_ts":  int(first[i]) if count[i] else None,
+                "last_ts":   int(last[i])  if count[i] else None,
+                "recent_ts": stamps[i].tolist(),
+                "to_set":    interner.lookup(to_sets[i]),
+                "funder":    funders[i],
+            }
+            for i in range(n)
+        ]
+
+    if kind == "txlistinternal":
+        inn = cols["to"] == me
+        int_in = _int_sums(owner, cols["value"], inn, n)
+        funders = _first_inbound(cols, owner, me, n, interner)
+        return [{"int_in_wei": int_in[i], "funder": funders[i]} for i in range(n)]
+
+    if kind == "tokennfttx":
+        bought = cols["from"] != me
+        sets = _unique_per_owner(owner[bought], cols["contract"][bought], n)
+        return [{"nft_bought": interner.lookup(sets[i])} for i in range(n)]
+
+    if kind == "tokentx":
+        lp = cols["lp"]
+        lp_sets = _unique_per_owner(owner[lp], cols["contract"][lp], n)
+        blend_ids = [interner.ids[c] for c in BLEND_CONTRACTS if c in interner.ids]
+        blend = np.isin(cols["contract"], blend_ids)
+        inn = cols["to"] == me
+        b_in  = np.bincount(owner, weights=blend & inn,  minlength=n)
+        b_out = np.bincount(owner, weights=blend & ~inn, minlength=n)
+        b_net = [0.0] * n
+        for i in np.flatnonzero(blend).tolist():
+            t = cols["row"][i]
+            val = _int(t.get("value")) / 10 ** max(_int(t.get("tokenDecimal"), 18), 0)
+            b_net[owner[i]] += val if inn[i] else -val
+        return [
+            {
+                "lp_contracts": interner.lookup(lp_sets[i]),
+                "blend_in":     int(b_in[i]),
+                "blend_out":    int(b_out[i]),
+                "blend_net":    b_net[i],
+            }
+            for i in range(n)
+        ]
+
+    raise ValueError(f"unknown endpoint '{kind}'")
+
+
+# ── mergeable state ───────────────────────────────────────────────────────────
+
+_SUMS = ("tx_count", "out_count", "in_count", "out_wei", "in_wei", "int_in_wei",
+         "blend_in", "blend_out", "blend_net")
+_SETS = ("to_set", "nft_bought", "lp_contracts")
+
+
+def new_state() -> dict:
+    """Mergeable history aggregates for one (chain, address)."""
+    return {
+        "as_of":     0,
+        "blocks":    {},          # endpoint → last block folded in
+        "truncated": [],          # endpoints whose last refresh stopped at ETHERSCAN_MAX_PAGES
+        "tx_count":  0,
+        "out_count": 0,
+        "in_count":  0,
+        "out_wei":   0,
+        "in_wei":    0,
+        "int_in_wei": 0,
+        "first_ts":  None,
+        "last_ts":   None,
+        "recent_ts": [],
+        "to_set":       [],       # unique counterparties of normal txs
+        "nft_bought":   [],       # NFT contracts received
+        "lp_contracts": [],
+        "blend_in":  0,
+        "blend_out": 0,
+        "blend_net": 0.0,
+        "funder":    None,        # [ts, sender] of the earliest inbound value transfer
+    }
+
+
+def merge(state: dict, partial: dict):
+    for k in _SUMS:
+        if k in partial:
+            state[k] += partial[k]
+    for k in _SETS:
+        if partial.get(k):
+            state[k] = sorted(set(state[k]).union(partial[k]))
+    if partial.get("first_ts") is not None:
+        f, l = partial["first_ts"], partial["last_ts"]
+        state["first_ts"] = f if state["first_ts"] is None else min(state["first_ts"], f)
+        state["last_ts"]  = l if state["last_ts"]  is None else max(state["last_ts"],  l)
+    if partial.get("recent_ts"):
+        state["recent_ts"] += partial["recent_ts"]
+    f = partial.get("funder")
+    if f is not None and (state["funder"] is None or f[0] < state["funder"][0]):
+        state["funder"] = f
+
+
+def fold(state: dict, addr: str, kind: str, rows: list, t0: int) -> np.ndarray:
+    """
+    Parse one page of `kind` rows for `addr` and merge the rows before t0 into
+    `state`. Returns the parsed block column and the keep mask.
+    """
+    interner = Interner()
+    cols = parse(kind, rows, interner)
+    keep = cols["ts"] < t0
+    if keep.any():
+        kept = _take(cols, keep)
+        owner = np.zeros(int(keep.sum()), dtype=np.int64)
+        merge(state, reduce(kind, kept, owner, np.array([interner.id(addr)]), interner)[0])
+    return cols["block"], keep
+
+
+def extract_batch(addrs: list, histories: list, t0: int) -> list:
+    """
+    Features for many addresses at once. `histories[i]` maps endpoint → rows
+    for addrs[i]; each endpoint is parsed and reduced in one stacked pass.
+    """
+    interner = Interner()
+    self_ids = np.array([interner.id(a) for a in addrs], dtype=np.int64)
+    states = [new_state() for _ in addrs]
+    for kind in ENDPOINTS:
+        rows, owner = [], []
+        for i, h in enumerate(histories):
+            r = h.get(kind) or []
+            rows.extend(r)
+            owner.append(np.full(len(r), i, dtype=np.int64))
+        if not rows:
+            continue
+        cols = parse(kind, rows, interner)
+        owner = np.concatenate(owner)
+        keep = cols["ts"] < t0
+        for state, partial in zip(states, reduce(kind, _take(cols, keep), owner[keep], self_ids, interner)):
+            merge(state, partial)
+    return [finalize(s, t0) for s in states]
+
+
+def finalize(state: dict, t0: int) -> dict:
+    """Turn accumulated aggregates into the model feature dict as of `t0`."""
+    funded_by = state["funder"][1] if state["funder"] else ""
+    partial = bool(state.get("truncated"))
+    if not state["tx_count"]:
+        return {**zero_features(), "_funded_by": funded_by, "_partial": partial}
+
+    first_ts = state["first_ts"]
+    last_ts  = state["last_ts"]
+    recent_cutoff = t0 - _RECENT_S
+
+    tx_count         = state["tx_count"]
+    wallet_age_days  = max((t0 - first_ts) / 86400, 0.01)
+    days_since_last  = max((t0 - last_ts)  / 86400, 0.0)
+    active_span_days = max((last_ts - first_ts) / 86400, 0.01)
+
+    buy_value  = state["out_wei"] / 1e18
+    sell_value = state["in_wei"]  / 1e18
+    sell_value += state["int_in_wei"] / 1e18
+    pnl_proxy  = sell_value - buy_value
+
+    unique_interactions = len(state["to_set"])
+    buy_collections     = len(state["nft_bought"])
+
+    buy_count  = state["out_count"]
+    sell_count = state["in_count"]
+    sell_ratio = sell_count / max(tx_count, 1)
+    recent_activity = int(np.count_nonzero(np.asarray(state["recent_ts"], dtype=np.int64) >= recent_cutoff))
+
+    blend_in_count  = state["blend_in"]
+    blend_out_count = state["blend_out"]
+    blend_net_value = state["blend_net"]
+    lp_count = len(state["lp_contracts"])
+
+    return {
+        "buy_count":           float(buy_count),
+        "sell_count":          float(sell_count),
+        "tx_count":            float(tx_count),
+        "total_trade_count":   float(tx_count),
+        "buy_value":           float(buy_value),
+        "sell_value":          float(sell_value),
+        "pnl_proxy":           float(pnl_proxy),
+        "buy_collections":     float(buy_collections),
+        "unique_interactions": float(unique_interactions),
+        "sell_ratio":          float(sell_ratio),
+        "wallet_age_days":     float(wallet_age_days),
+        "days_since_last_buy": float(days_since_last),
+        "recent_activity":     float(recent_activity),
+        "blend_in_count":      float(blend_in_count),
+        "blend_out_count":     float(blend_out_count),
+        "blend_net_value":     float(blend_net_value),
+        "LP_count":            float(lp_count),
+        "ratio":               float(blend_in_count / max(tx_count, 1)),
+        # extras for response display
+        "_wallet_age_days":    float(wallet_age_days),
+        "_active_span_days":   float(active_span_days),
+        "_nft_collections":    float(buy_collections),
+        "_unique_contracts":   float(unique_interactions),
+        "_total_volume_eth":   float(buy_value + sell_value),
+        "_first_tx_ts":        float(first_ts),
+        "_last_tx_ts":         float(last_ts),
+        "_funded_by":          funded_by,
+        "_partial":            partial,
+    }
+
+
+def zero_features() -> dict:
+    keys = [
+        "buy_count", "sell_count", "tx_count", "total_trade_count",
+        "buy_value", "sell_value", "pnl_proxy", "buy_collections",
+        "unique_interactions", "sell_ratio", "wallet_age_days",
+        "days_since_last_buy", "recent_activity", "blend_in_count",
+        "blend_out_count", "blend_net_value", "LP_count", "ratio",
+        "_wallet_age_days", "_active_span_days", "_nft_collections",
+        "_unique_contracts", "_total_volume_eth", "_first_tx_ts", "_last_tx_ts",
+    ]
+    return {**{k: 0.0 for k in keys}, "_funded_by": "", "_partial": False}
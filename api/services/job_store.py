@@ -0,0 +1,411 @@
+"""
+Durable job store (SQLite, WAL) shared by every uvicorn worker on the host.
+
+  jobs           — one row per job: options, status, progress, risk counters,
+                   funding-cluster summary, completion callback, owner + heartbeat
+  job_addresses  — submitted addresses in input order (seq); uploads append
+                   to it while the job is already running (upload_complete = 0)
+  job_results    — scored rows in completion order (n = 0, 1, 2, … with no
+                   gaps, so it doubles as a download cursor), each tied to its addr_seq
+
+A job is owned by the worker running it; the owner refreshes its heartbeat,
+and jobs whose heartbeat goes stale (worker died or restarted) are claimed and
+resumed by another worker from the addresses that have no result yet.
+Finished jobs are dropped after JOB_RETENTION_S and beyond JOB_MAX_JOBS.
+
+Every thread opens its own connection and there is no process-wide lock: WAL
+readers never wait, and writers are serialised by SQLite itself. Calls block,
+so async code runs them through asyncio.to_thread (services.jobs).
+"""
+
+import os
+import json
+import contextlib
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+STORE_PATH   = os.getenv("JOB_STORE_PATH", os.path.join(_DATA_DIR, "jobs.sqlite"))
+RETENTION_S  = int(os.getenv("JOB_RETENTION_S", str(7 * 86400)))
+MAX_JOBS     = int(os.getenv("JOB_MAX_JOBS", "1000"))
+
+_ACTIVE = ("pending", "running")
+_RISKS  = ("high", "medium", "low", "unknown")
+
+_local = threading.local()     # one connection per thread; SQLite serialises the writers
+
+
+def _db():
+    db = getattr(_local, "conn", None)
+    if db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(STORE_PATH)), exist_ok=True)
+        db = sqlite3.connect(STORE_PATH, isolation_level=None, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id       TEXT PRIMARY KEY,
+                status       TEXT NOT NULL,
+                chain        TEXT NOT NULL,
+                live         INTEGER NOT NULL DEFAULT 0,
+                concurrency  INTEGER NOT NULL DEFAULT 8,
+                total        INTEGER NOT NULL DEFAULT 0,
+                completed    INTEGER NOT NULL DEFAULT 0,
+                high         INTEGER NOT NULL DEFAULT 0,
+                medium       INTEGER NOT NULL DEFAULT 0,
+                low          INTEGER NOT NULL DEFAULT 0,
+                unknown      INTEGER NOT NULL DEFAULT 0,
+                upload_complete INTEGER NOT NULL DEFAULT 1,
+                explain      TEXT NOT NULL DEFAULT 'top3',
+                cluster      INTEGER NOT NULL DEFAULT 0,
+                threshold    REAL NOT NULL DEFAULT 0.5,
+                clusters     TEXT,
+                callback_url    TEXT,
+                callback_status TEXT,
+                error        TEXT,
+                created_at   TEXT NOT NULL,
+                completed_at TEXT,
+                finished     REAL,
+                owner        TEXT,
+                heartbeat    REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, heartbeat);
+            CREATE TABLE IF NOT EXISTS job_addresses (
+                job_id  TEXT NOT NULL,
+                seq     INTEGER NOT NULL,
+                address TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id   TEXT NOT NULL,
+                n        INTEGER NOT NULL,
+                addr_seq INTEGER NOT NULL,
+                result   TEXT NOT NULL,
+                PRIMARY KEY (job_id, n)
+            ) WITHOUT ROWID;
+            CREATE UNIQUE INDEX IF NOT EXISTS job_results_addr ON job_results (job_id, addr_seq);
+            CREATE INDEX IF NOT EXISTS job_addresses_addr ON job_addresses (job_id, address);
+        """)
+        _local.conn = db
+    return db
+
+
+@contextlib.contextmanager
+def _transaction():
+    """
+    BEGIN IMMEDIATE … COMMIT on this thread's connection, rolled back if
+    anything raises (or the commit fails) so the write lock is never left held.
+    """
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+
+
+def _now_iso() -> str:
+    return datetime.datetime.utcnow().isoformat()
+
+
+def create(addresses: list, owner: str, chain: str = "eth", live: bool = False, concurrency: int = 8,
+           explain: str = "top3", cluster: bool = False, threshold: float = 0.5, callback_url: str = None,
+           uploading: bool = False) -> str:
+    """New pending job; with uploading=True more addresses follow via add_addresses()."""
+    jid = str(uuid.uuid4())
+    with _transaction() as db:
+        db.execute(
+            "INSERT INTO jobs (job_id, status, chain, live, concurrency, explain, cluster, threshold, callback_url, "
+            "callback_status, total, upload_complete, created_at, owner, heartbeat) "
+            "VALUES (?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (jid, chain, int(live), concurrency, explain, int(cluster), threshold, callback_url,
+             "pending" if callback_url else None, len(addresses), int(not uploading), _now_iso(), owner, time.time()),
+        )
+        db.executemany(
+            "INSERT INTO job_addresses (job_id, seq, address) VALUES (?, ?, ?)",
+            ((jid, i, a) for i, a in enumerate(addresses)),
+        )
+    return jid
+
+
+_JOB_COLS = ("job_id", "status", "chain", "live", "concurrency", "explain", "cluster", "threshold", "total", "completed",
+             "upload_complete", "clusters", "callback_url", "callback_status", "error", "created_at",
+             "completed_at") + _RISKS
+
+
+def get(job_id: str):
+    """Job row as a dict with its risk `summary` (no addresses/results), or None."""
+    row = _db().execute(
+        f"SELECT {', '.join(_JOB_COLS)} FROM jobs WHERE job_id = ?", (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(_JOB_COLS, row))
+    job["live"] = bool(job["live"])
+    job["upload_complete"] = bool(job["upload_complete"])
+    job["cluster"] = bool(job["cluster"])
+    for k in ("clusters", "callback_url", "callback_status", "error"):
+        if job[k] is None:
+            del job[k]
+    if "clusters" in job:
+        job["clusters"] = json.loads(job["clusters"])
+    job["summary"] = {"total": job["total"], **{c: job.pop(c) for c in _RISKS}}
+    return job
+
+
+def add_addresses(job_id: str, addrs: list, limit: int = None) -> int:
+    """
+    Append normalised addresses to an uploading job, skipping any the job
+    already has. Returns how many were new. At most `limit` are inserted; a
+    new address past it is counted but not stored, so a return above
+    `limit` means the upload overflowed.
+    """
+    with _transaction() as db:
+        (seq,) = db.execute(
+            "SELECT COALESCE(MAX(seq), -1) + 1 FROM job_addresses WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        added = over = 0
+        for a in dict.fromkeys(addrs):
+            if db.execute("SELECT 1 FROM job_addresses WHERE job_id = ? AND address = ?", (job_id, a)).fetchone():
+                continue
+            if limit is not None and added >= limit:
+                over = 1
+                break
+            db.execute("INSERT INTO job_addresses (job_id, seq, address) VALUES (?, ?, ?)", (job_id, seq + added, a))
+            added += 1
+        db.execute("UPDATE jobs SET total = total + ?, heartbeat = ? WHERE job_id = ?", (added, time.time(), job_id))
+    return added + over
+
+
+def finish_upload(job_id: str):
+    _db().execute("UPDATE jobs SET upload_complete = 1 WHERE job_id = ?", (job_id,))
+
+
+def addresses(job_id: str) -> list:
+    rows = _db().execute(
+        "SELECT address FROM job_addresses WHERE job_id = ? ORDER BY seq", (job_id,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def results(job_id: str) -> list:
+    rows = _db().execute(
+        "SELECT result FROM job_results WHERE job_id = ? ORDER BY n", (job_id,)
+    ).fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+
+def results_after(job_id: str, after: int = -1, limit: int = 1000) -> list:
+    """Up to `limit` (n, result JSON text) rows with n > `after`, in completion order."""
+    return _db().execute(
+        "SELECT n, result FROM job_results WHERE job_id = ? AND n > ? ORDER BY n LIMIT ?",
+        (job_id, after, limit),
+    ).fetchall()
+
+
+def result_for(job_id: str, address: str):
+    """Stored result for a (normalised) address in the job, or None if absent / not scored yet."""
+    row = _db().execute(
+        "SELECT r.result FROM job_addresses a JOIN job_results r "
+        "ON r.job_id = a.job_id AND r.addr_seq = a.seq "
+        "WHERE a.job_id = ? AND (a.address = ? OR lower(trim(a.address)) = ?) LIMIT 1",
+        (job_id, address, address),
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def pending(job_id: str, after: int = -1, limit: int = 500) -> list:
+    """(seq, address) pairs after `after` that have no result yet, in input order."""
+    return _db().execute(
+        "SELECT a.seq, a.address FROM job_addresses a "
+        "WHERE a.job_id = ? AND a.seq > ? AND NOT EXISTS "
+        "(SELECT 1 FROM job_results r WHERE r.job_id = a.job_id AND r.addr_seq = a.seq) "
+        "ORDER BY a.seq LIMIT ?",
+        (job_id, after, limit),
+    ).fetchall()
+
+
+def _risk_bucket(r: dict):
+    if r.get("score") is not None:
+        return r.get("risk") if r.get("risk") in ("high", "medium", "low") else None
+    return "unknown" if r.get("risk") in ("unknown", "error") else None
+
+
+def append_results(job_id: str, rows: list):
+    """
+    Persist [(addr_seq, result dict), …] and advance progress and the risk
+    counters in one transaction. Rows whose addr_seq already has a result
+    (a resumed job re-scoring a batch) are skipped and not counted twice.
+    """
+    if not rows:
+        return
+    counts = dict.fromkeys(_RISKS, 0)
+    with _transaction() as db:
+        (n,) = db.execute(
+            "SELECT COALESCE(MAX(n), -1) + 1 FROM job_results WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        added = 0
+        for seq, r in rows:
+            if db.execute(
+                "INSERT OR IGNORE INTO job_results (job_id, n, addr_seq, result) VALUES (?, ?, ?, ?)",
+                (job_id, n + added, seq, json.dumps(r, separators=(",", ":"))),
+            ).rowcount:
+                added += 1
+                bucket = _risk_bucket(r)
+                if bucket:
+                    counts[bucket] += 1
+        db.execute(
+            "UPDATE jobs SET completed = completed + ?, high = high + ?, medium = medium + ?, "
+            "low = low + ?, unknown = unknown + ?, heartbeat = ? WHERE job_id = ?",
+            (added, *counts.values(), time.time(), job_id),
+        )
+
+
+def result_fields(job_id: str, fields: tuple, after: int = -1, limit: int = 1000) -> list:
+    """(n, *values of `fields`) for up to `limit` results after `after`, read without decoding the rows."""
+    cols = ", ".join("json_extract(result, ?)" for _ in fields)
+    return _db().execute(
+        f"SELECT n, {cols} FROM job_results WHERE job_id = ? AND n > ? ORDER BY n LIMIT ?",
+        (*(f"$.{f}" for f in fields), job_id, after, limit),
+    ).fetchall()
+
+
+def update_results(job_id: str, rows: list):
+    """
+    Merge fields into stored results in place (post-scoring stages):
+    [(n, {field: value, …}), …], None removing the field. Risk counters move
+    with any verdict that changed.
+    """
+    if not rows:
+        return
+    delta = dict.fromkeys(_RISKS, 0)
+    with _transaction() as db:
+        for n, fields in rows:
+            old = db.execute(
+                "SELECT json_extract(result, '$.risk'), json_extract(result, '$.score') "
+                "FROM job_results WHERE job_id = ? AND n = ?",
+                (job_id, n),
+            ).fetchone()
+            if old is None:
+                continue
+            expr, args = "result", []
+            drop = [f"$.{k}" for k, v in fields.items() if v is None]
+            if drop:
+                expr = f"json_remove({expr}, {', '.join('?' * len(drop))})"
+                args += drop
+            put = [(f"$.{k}", v) for k, v in fields.items() if v is not None]
+            if put:
+                expr = f"json_set({expr}, {', '.join('?, ?' for _ in put)})"
+                args += [x for kv in put for x in kv]
+            db.execute(f"UPDATE job_results SET result = {expr} WHERE job_id = ? AND n = ?", (*args, job_id, n))
+            before = _risk_bucket({"risk": old[0], "score": old[1]})
+            after = _risk_bucket({"risk": fields.get("risk", old[0]), "score": old[1]})
+            if before != after:
+                if before:
+                    delta[before] -= 1
+                if after:
+                    delta[after] += 1
+        db.execute(
+            "UPDATE jobs SET high = high + ?, medium = medium + ?, low = low + ?, unknown = unknown + ?, "
+            "heartbeat = ? WHERE job_id = ?",
+            (*delta.values(), time.time(), job_id),
+        )
+
+
+def set_clusters(job_id: str, summary: dict):
+    _db().execute("UPDATE jobs SET clusters = ? WHERE job_id = ?", (json.dumps(summary), job_id))
+
+
+def set_callback_status(job_id: str, status: str):
+    _db().execute("UPDATE jobs SET callback_status = ? WHERE job_id = ?", (status, job_id))
+
+
+def set_status(job_id: str, status: str, error: str = None):
+    if status in _ACTIVE:
+        # Never revive a job that already finished (e.g. an upload failed meanwhile)
+        _db().execute(
+            "UPDATE jobs SET status = ?, heartbeat = ? WHERE job_id = ? AND status IN ('pending', 'running')",
+            (status, time.time(), job_id),
+        )
+    else:
+        _db().execute(
+            "UPDATE jobs SET status = ?, error = ?, completed_at = ?, finished = ? WHERE job_id = ?",
+            (status, error, _now_iso(), time.time(), job_id),
+        )
+
+
+def heartbeat(owner: str):
+    """Refresh the lease on every active job `owner` holds, and on its finished jobs still owing a callback."""
+    _db().execute(
+        "UPDATE jobs SET heartbeat = ? WHERE owner = ? "
+        "AND (status IN ('pending', 'running') OR callback_status = 'pending')",
+        (time.time(), owner),
+    )
+
+
+def claim_orphans(owner: str, lease_s: float) -> list:
+    """
+    Take over active jobs whose owner stopped heartbeating; returns their ids.
+    A job whose upload was cut off with its owner cannot be completed and is failed instead.
+    """
+    now = time.time()
+    with _transaction() as db:
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = 'upload interrupted', completed_at = ?, finished = ? "
+            "WHERE status IN ('pending', 'running') AND upload_complete = 0 AND heartbeat < ?",
+            (_now_iso(), now, now - lease_s),
+        )
+        ids = [r[0] for r in db.execute(
+            "SELECT job_id FROM jobs WHERE status IN ('pending', 'running') AND heartbeat < ? "
+            "ORDER BY created_at",
+            (now - lease_s,),
+        ).fetchall()]
+        db.executemany(
+            "UPDATE jobs SET owner = ?, heartbeat = ? WHERE job_id = ?",
+            ((owner, now, jid) for jid in ids),
+        )
+    return ids
+
+
+def claim_callbacks(owner: str, lease_s: float) -> list:
+    """
+    Take over finished jobs whose callback is still pending after their owner
+    stopped heartbeating (delivery cancelled on shutdown or lost in a crash);
+    returns their ids.
+    """
+    now = time.time()
+    with _transaction() as db:
+        ids = [r[0] for r in db.execute(
+            "SELECT job_id FROM jobs WHERE status NOT IN ('pending', 'running') "
+            "AND callback_status = 'pending' AND heartbeat < ?",
+            (now - lease_s,),
+        ).fetchall()]
+        db.executemany(
+            "UPDATE jobs SET owner = ?, heartbeat = ? WHERE job_id = ?",
+            ((owner, now, jid) for jid in ids),
+        )
+    return ids
+
+
+def evict() -> list:
+    """Drop finished jobs past retention, then the oldest beyond MAX_JOBS; returns their ids."""
+    db = _db()
+    stale = [r[0] for r in db.execute(
+        "SELECT job_id FROM jobs WHERE finished IS NOT NULL AND "
+        "(finished < ? OR job_id NOT IN "
+        " (SELECT job_id FROM jobs WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT ?))",
+        (time.time() - RETENTION_S, MAX_JOBS),
+    ).fetchall()]
+    for jid in stale:
+        with _transaction():
+            db.execute("DELETE FROM job_results WHERE job_id = ?", (jid,))
+            db.execute("DELETE FROM job_addresses WHERE job_id = ?", (jid,))
+            db.execute("DELETE FROM jobs WHERE job_id = ?", (jid,))
+    return stale
@@ -1,40 +1,468 @@
+"""
+Batch job execution.
+
+Jobs are persisted in services.job_store, so any worker can answer for them
+and they survive restarts. Each API worker runs a small queue of job runners;
+CPU-bound scoring is shipped to a process pool so the event loop keeps serving
+/health and /v1/verify while large jobs run. A maintenance loop heartbeats the
+jobs this worker owns, resumes jobs orphaned by a dead worker and applies the
+retention policy. Jobs submitted with cluster=True finish with the
+funding-graph stage (services.clusters) over all of their results.
+
+Stored batches are also appended to the job's gzip CSV exports
+(services.exports) as they land, so finished jobs download without any
+recomputation. Every stored batch and status change wakes the job's event streams
+(`changes`) in this worker; streams for jobs run elsewhere fall back to
+re-reading the store every EVENTS_POLL_S. Finished jobs with a callback URL
+are reported through services.callbacks; a delivery cut off by a shutdown or
+crash is picked up again by the maintenance loop once its lease runs out.
+
+Store calls block on SQLite, so everything reached from the event loop runs
+them on a thread (asyncio.to_thread); the helpers that read the store are
+coroutines for the same reason.
+"""
+
+import os
+import time
 import uuid
+import socket
 import asyncio
-import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from services import callbacks, exports, job_store, metrics, registry, upload
 
-jobs = {}
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "2"))   # 0 → score on a thread instead
+JOB_RUNNERS     = int(os.getenv("JOB_RUNNERS", "2"))       # jobs run concurrently per API worker
+JOB_LEASE_S     = float(os.getenv("JOB_LEASE_S", "30"))    # heartbeat age before a job is taken over
+BATCH_SIZE      = 500
+UPLOAD_POLL_S   = 0.5                                       # runner wait for more uploaded addresses
 
+# Live mode: bounded-concurrency fetch pipeline for addresses missing from the lookup
+LIVE_MAX_CONCURRENCY = int(os.getenv("LIVE_MAX_CONCURRENCY", "32"))
+LIVE_FETCH_TIMEOUT_S = float(os.getenv("LIVE_FETCH_TIMEOUT", "60"))
+LIVE_MICRO_BATCH     = 32
+LIVE_FLUSH_S         = 1.0
+LIVE_CHUNK           = 5000     # missing addresses handed to the fetch pipeline at a time
+LIVE_CHUNK_S         = 2.0      # … or as soon as the oldest buffered one has waited this long
 
-def create_job(addresses: list, chain: str = "eth") -> str:
-    jid = str(uuid.uuid4())
-    jobs[jid] = {
-        "job_id":    jid,
-        "status":    "pending",
-        "chain":     chain,
-        "addresses": addresses,
-        "results":   [],
-        "total":     len(addresses),
-        "completed": 0,
-        "created_at":   datetime.datetime.utcnow().isoformat(),
-        "completed_at": None,
-    }
-    return jid
+EVENTS_POLL_S = float(os.getenv("EVENTS_POLL_S", "1"))   # event-stream store re-check without a local wake-up
 
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_queue = None
+_tasks = []
+_pool  = None
+_running = 0
+_in_pool = False      # set in scoring processes: ship metric increments back with each batch
+_watchers = {}        # job_id → {asyncio.Event} of open event streams
+_deliveries = set()   # callback tasks in flight
+_writers = {}         # job_id → exports.Writer while this worker streams its exports
 
-def get_job(job_id: str):
-    return jobs.get(job_id)
+metrics.Gauge("sybilscan_job_queue_depth", "Jobs waiting for a runner in this worker",
+              fn=lambda: _queue.qsize() if _queue is not None else 0)
+metrics.Gauge("sybilscan_jobs_running", "Jobs being run by this worker", fn=lambda: _running)
+metrics.Gauge("sybilscan_job_event_streams", "Open /v1/jobs/{id}/events streams on this worker",
+              fn=lambda: sum(len(w) for w in _watchers.values()))
 
 
-async def run_job(job_id: str):
+async def create_job(addresses: list, chain: str = "eth", live: bool = False, concurrency: int = 8,
+                     explain: str = "top3", cluster: bool = False, threshold: float = 0.5,
+                     callback_url: str = None) -> str:
+    return await asyncio.to_thread(
+        job_store.create, addresses, _OWNER, chain=chain, live=live,
+        concurrency=max(1, min(concurrency, LIVE_MAX_CONCURRENCY)), explain=explain, cluster=cluster,
+        threshold=threshold, callback_url=callback_url,
+    )
+
+
+async def upload_job(chunks, chain: str = "eth", live: bool = False, concurrency: int = 8,
+                     encoding: str = "", explain: str = "top3", cluster: bool = False,
+                     threshold: float = 0.5, callback_url: str = None) -> dict:
+    """
+    Create a job from a streamed address list. The job is queued before the
+    first chunk arrives, so scoring overlaps the upload; addresses are
+    normalised and de-duplicated as they land.
+    """
+    jid = await asyncio.to_thread(
+        job_store.create, [], _OWNER, chain=chain, live=live,
+        concurrency=max(1, min(concurrency, LIVE_MAX_CONCURRENCY)), explain=explain, cluster=cluster,
+        threshold=threshold, callback_url=callback_url, uploading=True,
+    )
+    submit(jid)
+    stats = {"received": 0, "duplicates": 0}
+    total = 0
+    try:
+        async for batch in upload.addresses(chunks, stats, encoding=encoding):
+            stats["received"] += len(batch)
+            room = upload.UPLOAD_MAX_ADDRESSES - total
+            added = await asyncio.to_thread(job_store.add_addresses, jid, batch, room)
+            _notify(jid)
+            if added > room:
+                raise upload.UploadError(f"more than {upload.UPLOAD_MAX_ADDRESSES:,} addresses")
+            stats["duplicates"] += len(batch) - added
+            total += added
+    except BaseException as e:
+        await _finish(jid, "failed", error=f"upload failed: {e}" if str(e) else "upload aborted")
+        raise
+    await asyncio.to_thread(job_store.finish_upload, jid)
+    return {"job_id": jid, "status": "running", "total": total, **stats}
+
+
+async def get_status(job_id: str):
+    """Job status, progress and risk summary — constant cost regardless of job size."""
+    j = await asyncio.to_thread(job_store.get, job_id)
+    if j is not None:
+        j["progress"] = j["completed"] / max(j["total"], 1)
+    return j
+
+
+async def get_job(job_id: str):
+    """Status plus every address and result (the original, unpaginated payload)."""
+    j = await get_status(job_id)
+    if j is not None:
+        j["addresses"] = await asyncio.to_thread(job_store.addresses, job_id)
+        j["results"]   = await asyncio.to_thread(job_store.results, job_id)
+    return j
+
+
+async def get_result(job_id: str, address: str):
+    return await asyncio.to_thread(job_store.result_for, job_id, address.strip().lower())
+
+
+async def get_results(job_id: str, after: int = -1, limit: int = 1000) -> list:
+    """(n, result JSON text) rows after cursor `after`."""
+    return await asyncio.to_thread(job_store.results_after, job_id, after=after, limit=limit)
+
+
+async def export_path(job_id: str, kind: str) -> str:
+    """A finished job's export file, built from its stored results first if missing (older jobs)."""
+    if not exports.ready(job_id):
+        j = await asyncio.to_thread(job_store.get, job_id)
+        await _score(_score_export, job_id, j["threshold"])
+    return exports.path(job_id, kind)
+
+
+# ── progress notifications ───────────────────────────────────────────────────
+
+async def changes(job_id: str):
+    """
+    Yield whenever the job may have changed: right away, then on each batch or
+    status change this worker makes, or after EVENTS_POLL_S without one.
+    """
+    ev = asyncio.Event()
+    _watchers.setdefault(job_id, set()).add(ev)
+    try:
+        while True:
+            yield
+            try:
+                await asyncio.wait_for(ev.wait(), EVENTS_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            ev.clear()
+    finally:
+        w = _watchers.get(job_id)
+        if w is not None:
+            w.discard(ev)
+            if not w:
+                del _watchers[job_id]
+
+
+def _notify(job_id: str):
+    for ev in _watchers.get(job_id, ()):
+        ev.set()
+
+
+async def _append(job_id: str, rows: list):
+    await asyncio.to_thread(job_store.append_results, job_id, rows)
+    w = _writers.get(job_id)
+    if w is not None:
+        await asyncio.to_thread(w.write, [r for _, r in rows])
+    _notify(job_id)
+
+
+async def _drop_writer(job_id: str):
+    w = _writers.pop(job_id, None)
+    if w is not None:
+        await asyncio.to_thread(w.discard)
+
+
+async def _finish(job_id: str, status: str, error: str = None):
+    """Record a finished job, wake its streams and report it to its callback URL."""
+    await _drop_writer(job_id)
+    await asyncio.to_thread(job_store.set_status, job_id, status, error=error)
+    metrics.JOBS.inc(status)
+    _notify(job_id)
+    j = await get_status(job_id)
+    if j is not None and j.get("callback_status") == "pending":
+        _deliver(j)
+
+
+def _deliver(j: dict):
+    task = asyncio.ensure_future(_callback(j))
+    _deliveries.add(task)
+    task.add_done_callback(_deliveries.discard)
+
+
+async def _callback(j: dict):
+    payload = {k: v for k, v in j.items() if not k.startswith("callback_")}
+    try:
+        outcome = await callbacks.deliver(j["callback_url"], payload)
+    except Exception as e:
+        outcome = f"failed: {type(e).__name__}"
+    await asyncio.to_thread(job_store.set_callback_status, j["job_id"], outcome)
+
+
+# ── scheduling ────────────────────────────────────────────────────────────────
+
+def _warm():
+    global _in_pool
+    _in_pool = True
+    registry.current()   # map the models once per scoring process, before the first batch
+
+
+def _executor():
+    global _pool
+    if _pool is None and SCORING_WORKERS > 0:
+        _pool = ProcessPoolExecutor(
+            max_workers=SCORING_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm,
+        )
+    return _pool
+
+
+async def _score(fn, *args):
+    """Run a CPU-bound scoring call off the event loop."""
+    with metrics.POOL_SECONDS.time(fn.__name__.removeprefix("_score_")):
+        result, delta = await asyncio.get_running_loop().run_in_executor(_executor(), fn, *args)
+    metrics.merge(delta)
+    return result
+
+
+# Executed in the scoring processes (or an executor thread with SCORING_WORKERS=0),
+# so model loading and scoring stay off the event loop. Each returns
+# (results, metric increments recorded in the scoring process, if it is one).
+
+def _score_lookup(addrs: list, explain: str) -> tuple:
     from services.model import score_addresses
-    j = jobs[job_id]
-    j["status"] = "running"
-    chain = j.get("chain", "eth")
-    addrs = j["addresses"]
-    for i in range(0, len(addrs), 500):
-        batch = addrs[i:i+500]
-        j["results"].extend(score_addresses(batch))
-        j["completed"] += len(batch)
-        await asyncio.sleep(0)
-    j["status"] = "complete"
-    j["completed_at"] = datetime.datetime.utcnow().isoformat()
+    results = score_addresses(addrs, explain=explain)
+    return results, metrics.drain() if _in_pool else None
+
+
+def _score_live(addrs: list, features: list, chain: str, explain: str) -> tuple:
+    from services.model import score_live_features
+    results = score_live_features(addrs, features, chain=chain, explain=explain)
+    return results, metrics.drain() if _in_pool else None
+
+
+def _score_export(job_id: str, threshold: float) -> tuple:
+    rows = exports.build(job_id, threshold)
+    return rows, metrics.drain() if _in_pool else None
+
+
+def _score_clusters(job_id: str, chain: str) -> tuple:
+    from services.clusters import cluster_job
+    summary = cluster_job(job_id, chain)
+    return summary, metrics.drain() if _in_pool else None
+
+
+def _ensure_started():
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+        _tasks.extend(asyncio.create_task(_runner()) for _ in range(JOB_RUNNERS))
+        _tasks.append(asyncio.create_task(_maintain()))
+
+
+def submit(job_id: str):
+    _ensure_started()
+    _queue.put_nowait(job_id)
+
+
+async def start():
+    """App startup: begin runners and pick up jobs left behind by a previous process."""
+    _ensure_started()
+    _executor()
+
+
+async def stop():
+    global _queue, _pool
+    for t in (*_tasks, *_deliveries):
+        t.cancel()
+    _tasks.clear()
+    _queue = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _runner():
+    global _running
+    while True:
+        jid = await _queue.get()
+        _running += 1
+        try:
+            await run_job(jid)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await _finish(jid, "failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            _running -= 1
+
+
+async def _maintain():
+    while True:
+        try:
+            await asyncio.to_thread(job_store.heartbeat, _OWNER)
+            for jid in await asyncio.to_thread(job_store.claim_orphans, _OWNER, JOB_LEASE_S):
+                _queue.put_nowait(jid)
+            for jid in await asyncio.to_thread(job_store.claim_callbacks, _OWNER, JOB_LEASE_S):
+                j = await get_status(jid)
+                if j is not None and j.get("callback_status") == "pending":
+                    _deliver(j)
+            for jid in await asyncio.to_thread(job_store.evict):
+                exports.remove(jid)
+        except Exception:
+            pass   # store busy; try again next tick
+        await asyncio.sleep(JOB_LEASE_S / 3)
+
+
+# ── execution ─────────────────────────────────────────────────────────────────
+
+async def run_job(job_id: str):
+    j = await asyncio.to_thread(job_store.get, job_id)
+    if j is None or j["status"] not in ("pending", "running"):
+        return
+    await asyncio.to_thread(job_store.set_status, job_id, "running")
+    _notify(job_id)
+    started = time.perf_counter()
+    await registry.wait_ready()
+    if not j["completed"] and not j["cluster"]:
+        # Rows are final as stored: stream them into the exports as they land
+        _writers[job_id] = await asyncio.to_thread(exports.Writer, job_id, j["threshold"])
+    chain = j["chain"]
+    live = j["live"]
+    missing = []   # (seq, address) for the live pipeline
+    buffered_at = 0.0
+    after = -1
+    # Resumable: only addresses without a stored result are (re)scored
+    while True:
+        # Read the upload flag before looking for rows so none slip past the final check
+        state = await asyncio.to_thread(job_store.get, job_id)
+        if state is None or state["status"] not in ("pending", "running"):
+            await _drop_writer(job_id)
+            return        # failed upload or evicted
+        rows = await asyncio.to_thread(job_store.pending, job_id, after=after, limit=BATCH_SIZE)
+        if not rows:
+            if state["upload_complete"]:
+                break
+            if missing:
+                # Nothing more uploaded yet: fetch what is buffered instead of idling
+                await _run_live(j, missing)
+                missing, buffered_at = [], 0.0
+                continue
+            await asyncio.sleep(UPLOAD_POLL_S)
+            continue
+        after = rows[-1][0]
+        if live and chain != "eth":
+            # The lookup table only covers ETH; every address goes through the live fetch
+            missing.extend((seq, a.strip().lower()) for seq, a in rows)
+        else:
+            scored = await _score(_score_lookup, [a for _, a in rows], j["explain"])
+            done = [(seq, r) for (seq, _), r in zip(rows, scored)]
+            if live:
+                missing.extend((seq, r["address"]) for seq, r in done if r["data_source"] == "not_found")
+                done = [(seq, r) for seq, r in done if r["data_source"] != "not_found"]
+            await _append(job_id, done)
+        if missing and not buffered_at:
+            buffered_at = time.monotonic()
+        if len(missing) >= LIVE_CHUNK or (missing and time.monotonic() - buffered_at >= LIVE_CHUNK_S):
+            await _run_live(j, missing)
+            missing, buffered_at = [], 0.0
+    if missing:
+        await _run_live(j, missing)
+    if j["cluster"]:
+        await _score(_score_clusters, job_id, chain)
+    await _export(job_id, j["threshold"])
+    await _finish(job_id, "complete")
+    metrics.JOB_SECONDS.observe(time.perf_counter() - started)
+
+
+async def _export(job_id: str, threshold: float):
+    """Put the finished exports in place: the streamed files if they hold every row, else a rebuild."""
+    w = _writers.pop(job_id, None)
+    if w is not None and w.rows == (await asyncio.to_thread(job_store.get, job_id))["completed"]:
+        await asyncio.to_thread(w.close)
+        return
+    if w is not None:
+        await asyncio.to_thread(w.discard)
+    await _score(_score_export, job_id, threshold)
+
+
+async def _run_live(j: dict, addrs: list):
+    """
+    Fetch features for `addrs` ((seq, address) pairs) with at most
+    j["concurrency"] requests in flight.
+    Finished fetches are scored in micro-batches and appended to the job as they
+    land, so one slow address never holds back the rest.
+    """
+    from services.etherscan import fetch_features_shared, error_result
+
+    job_id = j["job_id"]
+    chain = j["chain"]
+    queue = asyncio.Queue()
+    for item in addrs:
+        queue.put_nowait(item)
+    ready = []     # (seq, addr, features) awaiting scoring
+
+    async def flush():
+        if not ready:
+            return
+        batch = ready[:]
+        ready.clear()
+        scored = await _score(_score_live, [a for _, a, _ in batch], [f for _, _, f in batch], chain, j["explain"])
+        await _append(job_id, [(seq, r) for (seq, _, _), r in zip(batch, scored)])
+
+    async def worker():
+        while True:
+            try:
+                seq, addr = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if not upload.valid_address(addr):
+                # never sent upstream: Etherscan would only reject it
+                await _append(job_id, [(seq, error_result(addr, chain, ValueError("Invalid address")))])
+                continue
+            try:
+                features = await asyncio.wait_for(fetch_features_shared(addr, chain=chain), LIVE_FETCH_TIMEOUT_S)
+            except Exception as e:
+                metrics.LIVE_ERRORS.inc(chain, type(e).__name__)
+                await _append(job_id, [(seq, error_result(addr, chain, e))])
+                continue
+            ready.append((seq, addr, features))
+            if len(ready) >= LIVE_MICRO_BATCH:
+                await flush()
+
+    done = asyncio.Event()
+
+    async def flusher():
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), LIVE_FLUSH_S)
+            except asyncio.TimeoutError:
+                pass
+            await flush()
+
+    ticker = asyncio.create_task(flusher())
+    workers = [asyncio.create_task(worker()) for _ in range(min(j["concurrency"], len(addrs)))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        # The job has failed: stop the other workers instead of leaving them on the keys
+        for t in workers:
+            t.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    finally:
+        done.set()
+        await ticker
@@ -0,0 +1,205 @@
+"""
+Adaptive multi-key scheduler for Etherscan requests.
+
+Each API key gets a token bucket (Etherscan enforces its rate limit per key,
+across chains). Every request is routed to the eligible key for its chain with
+the most tokens left. Throttled keys are drained and cooled down with
+exponential backoff + jitter; keys that keep failing are evicted for a while.
+Time spent waiting for a token is recorded so queueing is visible.
+
+With a `path`, bucket levels and cooldowns live in a SQLite file shared by
+every process on the host (uvicorn --workers N, job runners), so the workers
+draw on one budget per key instead of each spending the full rate. Each
+acquire reads, refills and debits the buckets in one write transaction, run
+through asyncio.to_thread; wall-clock time replaces the monotonic clock so
+processes agree on refill times. Request and error counters stay per process.
+"""
+
+import os
+import asyncio
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+
+_BACKOFF_BASE_S = 1.0
+_BACKOFF_MAX_S  = 30.0
+_EVICT_AFTER    = 3       # consecutive errors before a key is evicted
+_EVICT_S        = 60.0
+
+
+class _Key:
+    __slots__ = ("key", "tokens", "updated", "cooldown_until", "drained", "throttles", "failures",
+                 "requests", "throttled_total", "errors_total")
+
+    def __init__(self, key: str, burst: float, now: float):
+        self.key = key
+        self.tokens = burst
+        self.updated = now
+        self.cooldown_until = 0.0
+        self.drained = False      # throttled since the shared bucket was last written
+        self.throttles = 0        # consecutive rate-limit hits (drives backoff)
+        self.failures = 0         # consecutive errors (drives eviction)
+        self.requests = 0
+        self.throttled_total = 0
+        self.errors_total = 0
+
+
+class KeyPool:
+    def __init__(self, rate: float, burst: float = None, path: str = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.path = path or None
+        self._clock = time.time if self.path else time.monotonic
+        self._local = threading.local()
+        self._keys = {}
+        self._chains = {}
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self.waits = 0
+        self.waiting = 0
+
+    def _db(self):
+        db = getattr(self._local, "conn", None)
+        if db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key_id         TEXT PRIMARY KEY,
+                    tokens         REAL NOT NULL,
+                    updated        REAL NOT NULL,
+                    cooldown_until REAL NOT NULL
+                )""")
+            self._local.conn = db
+        return db
+
+    def register(self, chain: str, keys: list):
+        """Make `keys` eligible for `chain` (order-preserving, duplicates dropped)."""
+        keys = [k for k in dict.fromkeys(keys) if k]
+        for k in keys:
+            self._keys.setdefault(k, _Key(k, self.burst, self._clock()))
+        self._chains[chain] = keys
+
+    def _refill(self, k: _Key, now: float):
+        k.tokens = min(self.burst, k.tokens + (now - k.updated) * self.rate)
+        k.updated = now
+
+    def _take(self, names: list, now: float) -> tuple:
+        """Debit a token from the fullest ready key → (key or None, earliest time another is ready)."""
+        best, wake = None, None
+        for name in names:
+            k = self._keys[name]
+            self._refill(k, now)
+            if k.cooldown_until > now:
+                ready = k.cooldown_until
+            elif k.tokens >= 1:
+                if best is None or k.tokens > best.tokens:
+                    best = k
+                continue
+            else:
+                ready = now + (1 - k.tokens) / self.rate
+            wake = ready if wake is None else min(wake, ready)
+        if best is not None:
+            best.tokens -= 1
+        return best, wake
+
+    def _take_shared(self, names: list) -> tuple:
+        """_take over the shared buckets: load, pick and write back in one transaction."""
+        ids = {name: hashlib.sha256(name.encode()).hexdigest()[:16] for name in names}
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = self._clock()
+            rows = {r[0]: r[1:] for r in db.execute(
+                f"SELECT key_id, tokens, updated, cooldown_until FROM buckets "
+                f"WHERE key_id IN ({','.join('?' * len(ids))})", list(ids.values()))}
+            for name, kid in ids.items():
+                k = self._keys[name]
+                if kid in rows:
+                    k.tokens, k.updated, cooldown = rows[kid]
+                    k.cooldown_until = max(k.cooldown_until, cooldown)   # publishes this process's backoff
+                if k.drained:
+                    k.tokens, k.drained = 0.0, False
+            best, wake = self._take(names, now)
+            db.executemany(
+                "INSERT OR REPLACE INTO buckets (key_id, tokens, updated, cooldown_until) VALUES (?, ?, ?, ?)",
+                [(kid, self._keys[n].tokens, self._keys[n].updated, self._keys[n].cooldown_until)
+                 for n, kid in ids.items()],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return best, wake, now
+
+    async def acquire(self, chain: str) -> str:
+        """Wait for a token on the best key for `chain` and return that key."""
+        names = self._chains.get(chain)
+        if not names:
+            raise LookupError(f"no Etherscan API key configured for chain '{chain}'")
+        start = self._clock()
+        self.waiting += 1
+        try:
+            while True:
+                if self.path:
+                    best, wake, now = await asyncio.to_thread(self._take_shared, names)
+                else:
+                    now = self._clock()
+                    best, wake = self._take(names, now)
+                if best is not None:
+                    best.requests += 1
+                    waited = now - start
+                    self.waits += 1
+                    self.wait_total_s += waited
+                    self.wait_max_s = max(self.wait_max_s, waited)
+                    return best.key
+                await asyncio.sleep(max(wake - now, 0.001))
+        finally:
+            self.waiting -= 1
+
+    def ok(self, key: str):
+        k = self._keys[key]
+        k.throttles = 0
+        k.failures = 0
+
+    def throttled(self, key: str):
+        """Key hit the upstream rate limit: drain it and back off with jitter."""
+        k = self._keys[key]
+        k.throttles += 1
+        k.throttled_total += 1
+        k.tokens = 0.0
+        k.drained = True
+        delay = min(_BACKOFF_MAX_S, _BACKOFF_BASE_S * 2 ** (k.throttles - 1))
+        k.cooldown_until = self._clock() + random.uniform(delay / 2, delay)
+
+    def failed(self, key: str):
+        """Transport error, 5xx or rejected key; evict the key after repeated failures."""
+        k = self._keys[key]
+        k.failures += 1
+        k.errors_total += 1
+        if k.failures >= _EVICT_AFTER:
+            k.cooldown_until = self._clock() + _EVICT_S
+            k.failures = 0
+
+    def stats(self) -> dict:
+        now = self._clock()
+        return {
+            "waiting":        self.waiting,
+            "acquired":       self.waits,
+            "wait_avg_ms":    round(1000 * self.wait_total_s / max(self.waits, 1), 2),
+            "wait_max_ms":    round(1000 * self.wait_max_s, 2),
+            "keys": [
+                {
+                    "key":        k.key[:6] + "…",
+                    "requests":   k.requests,
+                    "throttled":  k.throttled_total,
+                    "errors":     k.errors_total,
+                    "cooling_s":  round(max(k.cooldown_until - now, 0.0), 2),
+                }
+                for k in self._keys.values()
+            ],
+        }
@@ -0,0 +1,267 @@
+"""
+Memory-mapped lookup store for known addresses (fast path).
+
+On-disk layout (one directory):
+  addresses.npy — sorted 20-byte address keys (dtype S20)
+  features.npy  — feature matrix, rows aligned with addresses, columns in feature_names order
+  funders.npy   — optional: each row's funder (S20, empty if unknown), from the CSV's
+                  funded_by column; clustering links lookup hits through it
+  meta.json     — feature_names, dtype, row count, content digest, source file and its stamp
+
+  scores/<fingerprint>/ — optional precomputed model outputs per row (services.precompute)
+
+The matrix is float64 by default, so rows are bit-exact with the CSV (unix
+timestamps and volumes do not survive float32, and trees split on them).
+
+Both arrays are opened with mmap_mode="r", so startup is near-instant and the
+pages live in the OS page cache, shared by every uvicorn worker on the host.
+
+Build from the labeled CSV (run from api/):
+  python -m services.lookup data/nft_feats_labeled_T30.csv data/lookup
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
+
+_KEY_DTYPE = "S20"
+FUNDER_COLUMN = "funded_by"
+
+
+def _to_key(addr: str):
+    """'0xabc…' (40 hex chars) → 20 raw bytes, or None if malformed."""
+    a = addr.strip().lower()
+    if a.startswith("0x"):
+        a = a[2:]
+    if len(a) != 40:
+        return None
+    try:
+        return bytes.fromhex(a)
+    except ValueError:
+        return None
+
+
+def _to_keys(addrs) -> tuple:
+    """Addresses → (S20 key array, valid mask). Malformed addresses get an empty key."""
+    raw = [_to_key(a) for a in addrs]
+    valid = np.array([k is not None for k in raw], dtype=bool)
+    keys = np.array([k or b"" for k in raw], dtype=_KEY_DTYPE)
+    return keys, valid
+
+
+class LookupStore:
+    """Sorted address keys + aligned feature matrix with vectorized batch lookup."""
+
+    def __init__(self, keys: np.ndarray, matrix: np.ndarray, feature_names: list, digest: str = None,
+                 funders: np.ndarray = None):
+        self.keys = keys
+        self.matrix = matrix
+        self.feature_names = list(feature_names)
+        self.funders = funders        # S20 per row (b"": unknown), or None if the source had no funders
+        self._digest = digest
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def empty(cls, feature_names: list) -> "LookupStore":
+        return cls(
+            np.empty(0, dtype=_KEY_DTYPE),
+            np.empty((0, len(feature_names)), dtype=np.float64),
+            feature_names,
+        )
+
+    @classmethod
+    def open(cls, path: str, feature_names: list = None) -> "LookupStore":
+        """Memory-map a store written by `build`."""
+        meta = json.load(open(os.path.join(path, "meta.json")))
+        if feature_names is not None and list(meta["feature_names"]) != list(feature_names):
+            raise ValueError(f"lookup store {path} was built for a different feature set")
+        keys   = np.load(os.path.join(path, "addresses.npy"), mmap_mode="r")
+        matrix = np.load(os.path.join(path, "features.npy"),  mmap_mode="r")
+        funders = np.load(os.path.join(path, "funders.npy"), mmap_mode="r") if meta.get("funders") else None
+        return cls(keys, matrix, meta["feature_names"], meta.get("digest"), funders)
+
+    @classmethod
+    def from_csv(cls, csv_path: str, feature_names: list, dtype: str = "float64") -> "LookupStore":
+        """Build an in-memory store straight from the labeled CSV (slow; used when no build exists)."""
+        import pandas as pd
+
+        cols = pd.read_csv(csv_path, nrows=0).columns
+        df = pd.read_csv(csv_path, usecols=[c for c in cols if c in ("address", FUNDER_COLUMN) or c in feature_names])
+        keys, valid = _to_keys(df["address"].astype(str))
+        matrix = np.nan_to_num(
+            df.reindex(columns=feature_names, fill_value=0).to_numpy(dtype=float), nan=0.0
+        ).astype(dtype)
+        funders = _to_keys(df[FUNDER_COLUMN].fillna("").astype(str))[0] if FUNDER_COLUMN in cols else None
+        keys, matrix = keys[valid], matrix[valid]
+
+        # Sort by key; on duplicates keep the first row in file order
+        order = np.argsort(keys, kind="stable")
+        keys, matrix = keys[order], matrix[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        if funders is not None:
+            funders = funders[valid][order][first]
+        return cls(keys[first], np.ascontiguousarray(matrix[first]), feature_names, funders=funders)
+
+    def save(self, path: str, source: str = None, source_stamp: dict = None):
+        """
+        Write the store. Each file is replaced atomically (meta.json last), so
+        processes that have the old arrays mapped keep reading the old inodes
+        instead of a truncated file.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "feature_names": self.feature_names,
+            "dtype":         str(self.matrix.dtype),
+            "rows":          len(self.keys),
+            "source":        source,
+            "source_stamp":  source_stamp,
+            "digest":        self.digest(),
+            "funders":       self.funders is not None,
+        }
+        files = [
+            ("addresses.npy", lambda f: np.save(f, np.asarray(self.keys))),
+            ("features.npy",  lambda f: np.save(f, np.asarray(self.matrix))),
+        ]
+        if self.funders is not None:
+            files.append(("funders.npy", lambda f: np.save(f, np.asarray(self.funders))))
+        files.append(("meta.json", lambda f: f.write(json.dumps(meta, indent=2).encode())))
+        for name, write in files:
+            tmp = os.path.join(path, f".{name}.tmp-{os.getpid()}")
+            with open(tmp, "wb") as f:
+                write(f)
+            os.replace(tmp, os.path.join(path, name))
+
+    def digest(self) -> str:
+        """
+        Content hash of the keys and the feature matrix; ties derived tables to
+        these exact rows and values. Recorded in meta.json, so opening a store
+        does not rehash it.
+        """
+        if self._digest is None:
+            h = hashlib.sha256(np.asarray(self.keys).tobytes())
+            h.update(str(self.matrix.dtype).encode())
+            h.update(np.ascontiguousarray(self.matrix).tobytes())
+            self._digest = h.hexdigest()[:16]
+        return self._digest
+
+    def positions(self, addrs: list) -> np.ndarray:
+        """Row index for each address, -1 where unknown."""
+        if not len(self.keys) or not len(addrs):
+            return np.full(len(addrs), -1, dtype=np.int64)
+        q, valid = _to_keys(addrs)
+        pos = np.searchsorted(self.keys, q)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        hit = valid & (self.keys[pos] == q)
+        return np.where(hit, pos, -1)
+
+    def funders_of(self, addrs: list) -> dict:
+        """address → recorded funder for the given addresses that are rows with one."""
+        if self.funders is None:
+            return {}
+        pos = self.positions(addrs)
+        return {
+            a: "0x" + bytes(f).ljust(20, b"\0").hex()       # S20 drops trailing zero bytes
+            for a, p, f in zip(addrs, pos.tolist(), self.funders[np.maximum(pos, 0)]) if p >= 0 and f
+        }
+
+    def lookup(self, addrs: list) -> tuple:
+        """Batch lookup → (float64 feature matrix of hits, hit mask)."""
+        pos = self.positions(addrs)
+        found = pos >= 0
+        return np.asarray(self.matrix[pos[found]], dtype=float), found
+
+
+def save_scores(path: str, fingerprint: str, arrays: dict, meta: dict) -> str:
+    """
+    Write a precomputed score table (arrays aligned with the store's rows)
+    under path/scores/<fingerprint>/ and drop tables of other fingerprints.
+    """
+    root = os.path.join(path, "scores")
+    out = os.path.join(root, fingerprint)
+    tmp = f"{out}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, name + ".npy"), arr)
+    json.dump({**meta, "fingerprint": fingerprint, "arrays": sorted(arrays)},
+              open(os.path.join(tmp, "meta.json"), "w"), indent=2)
+    shutil.rmtree(out, ignore_errors=True)
+    os.rename(tmp, out)
+    for name in os.listdir(root):
+        if name != fingerprint:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return out
+
+
+def open_scores(path: str, fingerprint: str, store: LookupStore):
+    """(arrays, meta) of the memory-mapped score table for `fingerprint`, or None if none matches this store."""
+    d = os.path.join(path, "scores", fingerprint)
+    try:
+        meta = json.load(open(os.path.join(d, "meta.json")))
+    except FileNotFoundError:
+        return None
+    if meta.get("rows") != len(store) or meta.get("lookup") != store.digest():
+        return None    # lookup rebuilt (new rows or new feature values) since the table was computed
+    return {name: np.load(os.path.join(d, name + ".npy"), mmap_mode="r") for name in meta["arrays"]}, meta
+
+
+def source_stamp(csv_path: str) -> dict:
+    """Size, mtime and content hash of the CSV a store is built from."""
+    st = os.stat(csv_path)
+    h = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+
+def _header(csv_path: str) -> list:
+    with open(csv_path) as f:
+        return f.readline().strip().split(",")
+
+
+def is_current(path: str, csv_path: str) -> bool:
+    """
+    True if the store at `path` is a full-precision build of `csv_path` as it
+    is now. A matching size + mtime is trusted; otherwise the CSV is hashed, so
+    touching or copying it does not force a rebuild but any edit does.
+    """
+    try:
+        meta = json.load(open(os.path.join(path, "meta.json")))
+    except (OSError, ValueError):
+        return False
+    recorded = meta.get("source_stamp") or {}
+    if meta.get("dtype") != "float64" or not recorded:
+        return False    # float32 builds round timestamps and volumes; unstamped builds predate the check
+    if not meta.get("funders") and FUNDER_COLUMN in _header(csv_path):
+        return False    # built before funders were recorded
+    st = os.stat(csv_path)
+    if (recorded.get("size"), recorded.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+        return True
+    return recorded.get("size") == st.st_size and recorded.get("sha256") == source_stamp(csv_path)["sha256"]
+
+
+def build(csv_path: str, out_dir: str, feature_names: list, dtype: str = "float64") -> LookupStore:
+    stamp = source_stamp(csv_path)
+    store = LookupStore.from_csv(csv_path, feature_names, dtype=dtype)
+    store.save(out_dir, source=os.path.basename(csv_path), source_stamp=stamp)
+    return store
+
+
+if __name__ == "__main__":
+    _models = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
+    p = argparse.ArgumentParser(description="Build the memory-mapped lookup store from the labeled CSV.")
+    p.add_argument("csv")
+    p.add_argument("out_dir")
+    p.add_argument("--dtype", default="float64", choices=["float64", "float32"],
+                   help="float32 halves the file but rounds timestamps and volumes (scores can change)")
+    args = p.parse_args()
+    names = json.load(open(os.path.join(_models, "feature_names.json")))
+    s = build(args.csv, args.out_dir, names, dtype=args.dtype)
+    print(f"wrote {len(s)} rows × {len(names)} features ({args.dtype}) to {args.out_dir}")
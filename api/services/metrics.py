@@ -0,0 +1,303 @@
+"""
+Prometheus metrics and optional per-request trace spans, dependency-free.
+
+Every metric lives in this process; /metrics renders them in the Prometheus
+text format. Scoring processes (services.jobs) record into their own copy and
+ship the increments back with each batch (`drain` / `merge`), so stage timings
+measured there show up on the API worker that ran the job. With
+`uvicorn --workers N` each worker exposes its own numbers — scrape them as
+separate targets, or run one worker per port.
+
+Stages are timed with `stage(name)`: one histogram observation, plus a span
+when the current request is being traced. Tracing is off unless
+SYBILSCAN_TRACE is "header" (requests carrying X-SybilScan-Trace: 1) or
+"all"; spans come back in a Server-Timing header. Off costs one contextvar
+read per stage. SYBILSCAN_METRICS=0 turns recording off altogether.
+"""
+
+import os
+import time
+import bisect
+import asyncio
+import threading
+import contextvars
+
+ENABLED = os.getenv("SYBILSCAN_METRICS", "1") != "0"
+TRACE   = os.getenv("SYBILSCAN_TRACE", "off")          # off | header | all
+TRACE_HEADER = "x-sybilscan-trace"
+
+_LATENCY = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+_LAG     = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _q(v) -> str:
+    return '"' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def _fmt(self, key: tuple, extra: str = "") -> str:
+        pairs = [f"{k}={_q(v)}" for k, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, n: float = 1.0):
+        if ENABLED:
+            with _lock:
+                self.values[labels] = self.values.get(labels, 0.0) + n
+
+    def _render(self, out: list):
+        for key, v in self.values.items():
+            out.append(f"{self.name}{self._fmt(key)} {v:g}")
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by `fn` (→ value, or {label tuple: value})."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def _render(self, out: list):
+        values = self.values
+        if self.fn is not None:
+            try:
+                v = self.fn()
+            except Exception:
+                return
+            values = v if isinstance(v, dict) else {(): v}
+        for key, v in values.items():
+            out.append(f"{self.name}{self._fmt(key)} {v:g}")
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = _LATENCY, span: str = None):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.span = span or name      # name of the trace span `time()` records
+
+    def observe(self, value: float, *labels):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            h = self.values.get(labels)
+            if h is None:
+                h = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels, self.span)
+
+    def _render(self, out: list):
+        for key, (counts, total, n) in self.values.items():
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{self._fmt(key, 'le=%s' % _q(f'{le:g}'))} {acc}")
+            out.append(f"{self.name}_bucket{self._fmt(key, 'le=%s' % _q('+Inf'))} {n}")
+            out.append(f"{self.name}_sum{self._fmt(key)} {total:g}")
+            out.append(f"{self.name}_count{self._fmt(key)} {n}")
+
+
+# ── tracing ───────────────────────────────────────────────────────────────────
+
+_trace = contextvars.ContextVar("sybilscan_trace", default=None)   # [(span, seconds)] while tracing
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "span", "t")
+
+    def __init__(self, hist, labels: tuple, span: str):
+        self.hist, self.labels, self.span = hist, labels, span
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t
+        self.hist.observe(dt, *self.labels)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((self.span, dt))
+        return False
+
+
+def stage(name: str) -> _Timer:
+    """`with stage("predict"):` — time a hot-path stage (and trace it, if tracing)."""
+    return _Timer(STAGE_SECONDS, (name,), name)
+
+
+def server_timing() -> str:
+    """Server-Timing header value for the spans traced so far: total ms and count per name."""
+    totals = {}
+    for name, dt in _trace.get() or ():
+        t = totals.setdefault(name, [0.0, 0])
+        t[0] += dt
+        t[1] += 1
+    return ", ".join(f'{name};dur={dur * 1000:.2f};desc="x{n}"' for name, (dur, n) in totals.items())
+
+
+class Middleware:
+    """
+    ASGI middleware: request latency by route template, and — when tracing
+    applies to the request — spans collected while it runs, returned as
+    Server-Timing on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = None
+        if TRACE == "all" or (TRACE == "header" and (TRACE_HEADER.encode(), b"1") in scope["headers"]):
+            token = _trace.set([])
+        status = 500
+        t = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if token is not None:
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.observe(time.perf_counter() - t, scope["method"],
+                                 getattr(route, "path", "unmatched"), str(status))
+            if token is not None:
+                _trace.reset(token)
+
+
+# ── scoring-process hand-off ──────────────────────────────────────────────────
+
+def drain() -> dict:
+    """Counter and histogram increments since the last drain (resets them)."""
+    out = {}
+    with _lock:
+        for m in _metrics:
+            if m.kind in ("counter", "histogram") and m.values:
+                out[m.name], m.values = m.values, {}
+    return out
+
+
+def merge(delta: dict):
+    """Add increments drained in another process."""
+    if not delta:
+        return
+    by_name = {m.name: m for m in _metrics}
+    with _lock:
+        for name, values in delta.items():
+            m = by_name.get(name)
+            if m is None:
+                continue
+            for key, v in values.items():
+                if m.kind == "counter":
+                    m.values[key] = m.values.get(key, 0.0) + v
+                    continue
+                h = m.values.get(key)
+                if h is None:
+                    m.values[key] = [list(v[0]), v[1], v[2]]
+                else:
+                    h[0] = [a + b for a, b in zip(h[0], v[0])]
+                    h[1] += v[1]
+                    h[2] += v[2]
+
+
+def render() -> str:
+    out = []
+    with _lock:
+        for m in _metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            m._render(out)
+    return "\n".join(out) + "\n"
+
+
+# ── event loop ────────────────────────────────────────────────────────────────
+
+async def watch_loop(interval: float = 0.25):
+    """Observe how late the loop wakes a sleeping task (lag = blocked event loop)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - t - interval, 0.0)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+def _rss() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# ── metrics ───────────────────────────────────────────────────────────────────
+
+STAGE_SECONDS = Histogram("sybilscan_stage_seconds",
+                          "Scoring hot-path stages: lookup, precomputed, predict, contrib, features, cluster",
+                          ("stage",))
+
+HTTP_SECONDS = Histogram("sybilscan_http_request_seconds", "API request latency", ("method", "route", "status"))
+
+ETHERSCAN_SECONDS  = Histogram("sybilscan_etherscan_request_seconds",
+                               "Etherscan HTTP round trip, per attempt", ("chain", "action"), span="etherscan")
+ETHERSCAN_REQUESTS = Counter("sybilscan_etherscan_requests_total",
+                             "Etherscan attempts by outcome: ok, empty, rate_limited, http_error, error",
+                             ("chain", "action", "outcome"))
+ETHERSCAN_RETRIES  = Counter("sybilscan_etherscan_retries_total",
+                             "Etherscan attempts after the first for the same call", ("chain", "action"))
+ETHERSCAN_FAILURES = Counter("sybilscan_etherscan_failures_total",
+                             "Etherscan calls that ran out of retries", ("chain", "action"))
+ETHERSCAN_KEY_WAIT = Histogram("sybilscan_etherscan_key_wait_seconds",
+                               "Wait for a key's rate-limit token before a request", ("chain",), span="key_wait")
+FETCH_SECONDS      = Histogram("sybilscan_fetch_features_seconds",
+                               "Live feature fetch per address (cache refresh included)", ("chain", "cache"))
+LIVE_FETCHES       = Counter("sybilscan_live_fetches_total",
+                             "Live feature fetches: leader (one upstream fetch) or joined (shared an in-flight one)",
+                             ("chain", "role"))
+LIVE_RESULTS       = Counter("sybilscan_live_result_cache_total", "Recent live-result cache lookups", ("result",))
+LIVE_ERRORS        = Counter("sybilscan_live_errors_total",
+                             "Live scoring failures (score_address_live / live jobs)", ("chain", "error"))
+
+JOBS           = Counter("sybilscan_jobs_total", "Jobs finished by status", ("status",))
+JOB_SECONDS    = Histogram("sybilscan_job_seconds", "Job run time (runner start → complete)",
+                           buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600))
+CALLBACKS      = Counter("sybilscan_job_callbacks_total",
+                          "Job completion callback attempts: delivered, retry, failed", ("outcome",))
+POOL_SECONDS   = Histogram("sybilscan_scoring_batch_seconds",
+                           "Scoring batch round trip through the scoring pool (queueing included)", ("kind",),
+                           span="scoring_pool")
+
+LOOP_LAG      = Histogram("sybilscan_event_loop_lag_seconds", "Event-loop wake-up delay", buckets=_LAG)
+LOOP_LAG_LAST = Gauge("sybilscan_event_loop_lag_last_seconds", "Most recent event-loop lag sample")
+RSS           = Gauge("process_resident_memory_bytes", "Resident memory of this process", fn=_rss)
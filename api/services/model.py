@@ -5,37 +5,47 @@ Scoring service.
 """
 
 import os
-import json
+import time
 import asyncio
+import threading
+from collections import OrderedDict
 import numpy as np
-import pandas as pd
-import joblib
+from services import metrics, registry
 
-# ── model loading ──────────────────────────────────────────────────────────────
-_BASE = os.path.dirname(os.path.abspath(__file__))
-_MODEL_DIR = os.path.join(_BASE, "..", "models")
-_DATA_DIR  = os.path.join(_BASE, "..", "data")
+# Models and the lookup table come from services.registry (loaded once,
+# memory-mapped, hot-swapped); every scoring call works on one bundle.
 
-lgb_model    = joblib.load(os.path.join(_MODEL_DIR, "lgb_blur_t30.joblib"))
-iso_model    = joblib.load(os.path.join(_MODEL_DIR, "iso_blur.joblib"))
-feature_names = json.load(open(os.path.join(_MODEL_DIR, "feature_names.json")))
+# Explanations: "none" skips contributions entirely, "top3" is the default
+# three-feature summary, "full" lists every feature plus the base value.
+EXPLAIN_MODES      = ("none", "top3", "full")
+CONTRIB_CACHE_SIZE = int(os.getenv("CONTRIB_CACHE_SIZE", "50000"))   # lookup addresses, per process
 
-# Lookup table for known Blur addresses (fast path)
-_lookup_path = os.path.join(_DATA_DIR, "nft_feats_labeled_T30.csv")
-if os.path.exists(_lookup_path):
-    df_lookup = pd.read_csv(_lookup_path).set_index("address")
-else:
-    df_lookup = pd.DataFrame()
+# Precomputed score tables (services.precompute) store risk / type as codes
+# into these; bump SCORE_VERSION whenever the scoring rules here change so
+# stale tables are ignored.
+RISK_LABELS   = ("high", "medium", "low")
+TYPE_LABELS   = ("hyperactive_bot", "mid_volume", "new_wallet", "retail_hunter")
+SCORE_VERSION = 1
+
+_contrib_cache = OrderedDict()     # (model fingerprint, address) → contribution row
+_contrib_lock  = threading.Lock()
+
+# Recent live results: repeat /v1/verify calls for an address within
+# LIVE_RESULT_TTL_S skip the feature cache and, per explain mode, the model.
+LIVE_RESULT_TTL_S      = float(os.getenv("LIVE_RESULT_TTL_S", "30"))      # 0 disables
+LIVE_RESULT_CACHE_SIZE = int(os.getenv("LIVE_RESULT_CACHE_SIZE", "10000"))
+
+_live_results = OrderedDict()      # (chain, address) → [expires_at, features, {(fingerprint, explain): result}]
 
 # IF score normalization bounds (precomputed from Blur dataset)
 # Avoid running decision_function on 251K rows at startup
 _iso_min, _iso_max = -0.18, 0.12
 
 
-def _normalize_iso(raw: float) -> float:
+def _normalize_iso(raw: np.ndarray) -> np.ndarray:
     if _iso_max == _iso_min:
-        return 0.5
-    return float(np.clip((raw - _iso_min) / (_iso_max - _iso_min), 0.0, 1.0))
+        return np.full(np.shape(raw), 0.5)
+    return np.clip((raw - _iso_min) / (_iso_max - _iso_min), 0.0, 1.0)
 
 
 # Human-readable labels for each feature
@@ -65,80 +75,191 @@ _FEATURE_LABELS = {
 }
 
 
-def _top_features(feat_vec: np.ndarray, n: int = 3) -> list:
-    """Return top-n features by per-prediction LightGBM contribution."""
+def _lgb_proba(m, X: np.ndarray) -> np.ndarray:
+    return m.engine.lgb_proba(X) if m.engine else m.lgb_model.predict_proba(X)[:, 1]
+
+
+def _iso_raw(m, X: np.ndarray) -> np.ndarray:
+    return m.engine.iso_score(X) if m.engine else -m.iso_model.decision_function(X)
+
+
+def _contributions(m, X: np.ndarray) -> np.ndarray:
+    """Per-feature LightGBM contributions, shape (rows, n_features+1); last col is bias."""
+    with metrics.stage("contrib"):
+        return m.engine.contributions(X) if m.engine else m.lgb_model.predict(X, pred_contrib=True)
+
+
+def _cached_contributions(m, addrs: list, X: np.ndarray) -> np.ndarray:
+    """
+    Contributions for lookup rows, memoised per model version: lookup features
+    never change for a given fingerprint, so only uncached rows are computed.
+    """
+    out = np.empty((len(addrs), X.shape[1] + 1))
+    todo = []
+    with _contrib_lock:
+        for i, addr in enumerate(addrs):
+            row = _contrib_cache.get((m.fingerprint, addr))
+            if row is None:
+                todo.append(i)
+            else:
+                _contrib_cache.move_to_end((m.fingerprint, addr))
+                out[i] = row
+    if todo:
+        out[todo] = _contributions(m, X[todo])
+        with _contrib_lock:
+            for i in todo:
+                _contrib_cache[(m.fingerprint, addrs[i])] = out[i].copy()
+            while len(_contrib_cache) > CONTRIB_CACHE_SIZE:
+                _contrib_cache.popitem(last=False)
+    return out
+
+
+def _rank(contribs: np.ndarray, n: int = 3) -> np.ndarray:
+    """Feature indices by descending |contribution| (bias column excluded), top n."""
+    return np.argsort(np.abs(contribs[:, :-1]), axis=1)[:, ::-1][:, :n]
+
+
+def _top_features(m, X: np.ndarray, contribs: np.ndarray, n: int = 3, order: np.ndarray = None) -> list:
+    """Features ranked by |contribution|, top n (all if n is None), one list per row."""
+    feature_names = m.feature_names
+    top_idx = _rank(contribs, n) if order is None else order
+    rows = np.arange(len(X))[:, None]
+    values  = X[rows, top_idx].tolist()
+    contrib = contribs[rows, top_idx].tolist()
+    result = []
+    for idx_row, val_row, con_row in zip(top_idx.tolist(), values, contrib):
+        result.append([
+            {
+                "feature":      feature_names[i],
+                "label":        _FEATURE_LABELS.get(feature_names[i], feature_names[i]),
+                "value":        round(v, 4),
+                "contribution": round(c, 4),
+            }
+            for i, v, c in zip(idx_row, val_row, con_row)
+        ])
+    return result
+
+
+def _explain(m, addrs: list, X: np.ndarray, explain: str, pos: np.ndarray = None) -> list:
+    """Explanation fields to merge into each result, per `explain` mode."""
+    if explain == "none" or not len(addrs):
+        return [{} for _ in addrs]
+    if explain == "top3" and pos is not None and m.scores is not None:
+        idx = np.asarray(m.scores["top_idx"][pos], np.int64)
+        contribs = np.zeros((len(addrs), X.shape[1] + 1))
+        np.put_along_axis(contribs, idx, m.scores["top_contrib"][pos], axis=1)
+        return [{"top_features": t} for t in _top_features(m, X, contribs, n=3, order=idx)]
     try:
-        # pred_contrib returns shape (1, n_features+1); last col is bias
-        contribs = lgb_model.predict(feat_vec, pred_contrib=True)[0]
-        feature_contribs = contribs[:-1]  # drop bias
-        top_idx = np.argsort(np.abs(feature_contribs))[::-1][:n]
-        result = []
-        for i in top_idx:
-            name = feature_names[i]
-            result.append({
-                "feature":      name,
-                "label":        _FEATURE_LABELS.get(name, name),
-                "value":        round(float(feat_vec[0][i]), 4),
-                "contribution": round(float(feature_contribs[i]), 4),
-            })
-        return result
+        contribs = _cached_contributions(m, addrs, X) if pos is not None else _contributions(m, X)
     except Exception:
-        return []
+        return [{"top_features": []} for _ in addrs]
+    top = _top_features(m, X, contribs, n=None if explain == "full" else 3)
+    if explain == "full":
+        return [{"top_features": t, "base_value": round(b, 4)} for t, b in zip(top, contribs[:, -1].tolist())]
+    return [{"top_features": t} for t in top]
 
 
-def _score_features(features: dict, addr: str) -> dict:
-    """Run LGB + IF on a feature dict and return result payload."""
-    feat_vec = np.array([features.get(f, 0.0) for f in feature_names], dtype=float).reshape(1, -1)
-    feat_vec = np.nan_to_num(feat_vec, nan=0.0)
+def _feature_matrix(m, rows: list) -> np.ndarray:
+    """Stack feature dicts into a model-ordered matrix (NaN → 0)."""
+    X = np.array([[r.get(f, 0.0) for f in m.feature_names] for r in rows], dtype=float)
+    return np.nan_to_num(X.reshape(len(rows), len(m.feature_names)), nan=0.0)
+
+
+def _col(m, X: np.ndarray, name: str, default: float = 0.0) -> np.ndarray:
+    i = m.index.get(name)
+    return X[:, i] if i is not None else np.full(len(X), default)
+
 
-    lgb_score = float(lgb_model.predict_proba(feat_vec)[0][1])
-    iso_raw   = float(-iso_model.decision_function(feat_vec)[0])
+def _score_components(m, X: np.ndarray) -> tuple:
+    """(lgb_score, if_norm, final, risk code, type code) for every row of X."""
+    lgb_score = _lgb_proba(m, X)
+    iso_raw   = _iso_raw(m, X)
     if_norm   = _normalize_iso(iso_raw)
-    final     = lgb_score * 0.7 + if_norm * 0.3
-
-    buy_count      = features.get("buy_count", 0) or 0
-    blend_in_count = features.get("blend_in_count", 0) or 0
-    wallet_age     = features.get("wallet_age_days", 9999) or 9999
-
-    if buy_count > 9000 or blend_in_count > 100:
-        sybil_type = "hyperactive_bot"
-    elif buy_count > 794:
-        sybil_type = "mid_volume"
-    elif wallet_age < 30:
-        sybil_type = "new_wallet"
+    final = lgb_score * 0.7 + if_norm * 0.3
+
+    buy_count      = _col(m, X, "buy_count")
+    blend_in_count = _col(m, X, "blend_in_count")
+    wallet_age     = _col(m, X, "wallet_age_days", 9999)
+    wallet_age     = np.where(wallet_age == 0, 9999, wallet_age)
+    sybil_type = np.select(
+        [(buy_count > 9000) | (blend_in_count > 100), buy_count > 794, wallet_age < 30],
+        [0, 1, 2],
+        3,
+    )
+
+    sybil_score = np.clip(np.rint(final * 100), 0, 100).astype(int)
+    risk = np.select([sybil_score >= 70, sybil_score >= 40], [0, 1], 2)
+    return lgb_score, if_norm, final, risk, sybil_type
+
+
+def _score_matrix(m, addrs: list, X: np.ndarray, explain: str = "top3", pos: np.ndarray = None) -> list:
+    """
+    Run LGB + IF over a feature matrix in one pass and return result payloads.
+    `pos` gives the lookup rows X was read from: their scores come straight
+    from the precomputed table when one matches the model, and their
+    contributions may be memoised.
+    """
+    if not len(addrs):
+        return []
+    if pos is not None and m.scores is not None:
+        t = m.scores
+        with metrics.stage("precomputed"):
+            lgb_score, if_norm, final, risk, sybil_type = (t[k][pos] for k in ("lgb", "iso", "score", "risk", "type"))
     else:
-        sybil_type = "retail_hunter"
-
-    sybil_score = min(100, max(0, round(final * 100)))
-    risk = "high" if sybil_score >= 70 else "medium" if sybil_score >= 40 else "low"
-
-    return {
-        "address":          addr,
-        "sybil_score":      sybil_score,
-        "score":            round(final, 4),
-        "lgb_score":        round(lgb_score, 4),
-        "if_score":         round(if_norm, 4),
-        "risk":             risk,
-        "sybil_type":       sybil_type,
-        "tx_count":         int(features.get("tx_count", 0)),
-        "wallet_age_days":  round(features.get("wallet_age_days", 0), 1),
-        "nft_collections":  int(features.get("buy_collections", 0)),
-        "unique_contracts": int(features.get("unique_interactions", 0)),
-        "total_volume_eth": round(features.get("buy_value", 0) + features.get("sell_value", 0), 4),
-        "top_features":     _top_features(feat_vec),
-        "data_source":      "cached",
-    }
+        with metrics.stage("predict"):
+            lgb_score, if_norm, final, risk, sybil_type = _score_components(m, X)
+    sybil_score = np.clip(np.rint(final * 100), 0, 100).astype(int)
+    risk = np.asarray(RISK_LABELS)[risk]
+    sybil_type = np.asarray(TYPE_LABELS)[sybil_type]
 
+    volume = _col(m, X, "buy_value") + _col(m, X, "sell_value")
+    cols = zip(
+        addrs, sybil_score.tolist(), final.tolist(), lgb_score.tolist(), if_norm.tolist(),
+        risk.tolist(), sybil_type.tolist(),
+        _col(m, X, "tx_count").tolist(), _col(m, X, "wallet_age_days").tolist(),
+        _col(m, X, "buy_collections").tolist(), _col(m, X, "unique_interactions").tolist(),
+        volume.tolist(), _explain(m, addrs, X, explain, pos),
+    )
+    return [
+        {
+            "address":          addr,
+            "sybil_score":      s,
+            "score":            round(fin, 4),
+            "lgb_score":        round(lgb, 4),
+            "if_score":         round(iso, 4),
+            "risk":             rk,
+            "sybil_type":       st,
+            "tx_count":         int(txc),
+            "wallet_age_days":  round(age, 1),
+            "nft_collections":  int(nftc),
+            "unique_contracts": int(uc),
+            "total_volume_eth": round(vol, 4),
+            **why,
+            "data_source":      "cached",
+        }
+        for addr, s, fin, lgb, iso, rk, st, txc, age, nftc, uc, vol, why in cols
+    ]
+
+
+def _score_features(features: dict, addr: str, explain: str = "top3") -> dict:
+    """Run LGB + IF on a feature dict and return result payload."""
+    m = registry.current()
+    return _score_matrix(m, [addr], _feature_matrix(m, [features]), explain)[0]
 
-def score_addresses(addresses: list) -> list:
+
+def score_addresses(addresses: list, explain: str = "top3") -> list:
     """Sync scoring — only uses lookup table (for batch jobs)."""
+    m = registry.current()
+    addrs = [a.strip().lower() for a in addresses]
+    with metrics.stage("lookup"):
+        pos = m.lookup.positions(addrs)
+        found = pos >= 0
+        X = np.asarray(m.lookup.matrix[pos[found]], dtype=float)
+    scored = iter(_score_matrix(m, [a for a, f in zip(addrs, found) if f], X, explain, pos=pos[found]))
     results = []
-    for addr in addresses:
-        addr = addr.strip().lower()
-        if addr in df_lookup.index:
-            row = df_lookup.loc[addr]
-            features = {f: float(row.get(f, 0) or 0) for f in feature_names}
-            result = _score_features(features, addr)
+    for addr, hit in zip(addrs, found.tolist()):
+        if hit:
+            result = next(scored)
         else:
             # No live fetch in sync path — return pending marker
             result = {
@@ -152,42 +273,191 @@ def score_addresses(addresses: list) -> list:
     return results
 
 
-async def score_address_live(address: str, chain: str = "eth") -> dict:
+async def score_address_live(address: str, chain: str = "eth", explain: str = "top3") -> dict:
     """
     Async single-address scoring with live Etherscan fallback.
     Used by /v1/verify endpoint. Supports multi-chain via `chain` param.
     """
-    from services.etherscan import fetch_features
+    from services.etherscan import error_result
 
     addr = address.strip().lower()
 
     # Fast path: cached (only available for ETH/Blur dataset)
-    if chain == "eth" and addr in df_lookup.index:
-        row = df_lookup.loc[addr]
-        features = {f: float(row.get(f, 0) or 0) for f in feature_names}
-        result = _score_features(features, addr)
-        result["data_source"] = "cached"
-        result["chain"] = chain
-        return result
-
-    # Slow path: live chain fetch
+    if chain == "eth":
+        m = registry.current()
+        with metrics.stage("lookup"):
+            pos = m.lookup.positions([addr])
+        if pos[0] >= 0:
+            result = _score_matrix(m, [addr], np.asarray(m.lookup.matrix[pos], dtype=float), explain, pos=pos)[0]
+            result["chain"] = chain
+            return result
+
+    # Slow path: live chain fetch, shared with concurrent callers and recent repeats
     try:
-        features = await fetch_features(addr, chain=chain)
-        result = _score_features(features, addr)
-        result["data_source"] = "live"
-        result["chain"]            = chain
-        result["wallet_age_days"]  = round(features.get("_wallet_age_days", 0), 1)
-        result["nft_collections"]  = int(features.get("_nft_collections", 0))
-        result["unique_contracts"] = int(features.get("_unique_contracts", 0))
-        result["total_volume_eth"] = round(features.get("_total_volume_eth", 0), 4)
-        return result
+        entry = await _live_entry(addr, chain)
     except Exception as e:
-        return {
-            "address":    addr,
-            "score":      None,
-            "risk":       "error",
-            "sybil_type": "error",
-            "error":      str(e),
-            "chain":      chain,
-            "data_source": "error",
-        }
+        metrics.LIVE_ERRORS.inc(chain, type(e).__name__)
+        return error_result(addr, chain, e)
+    key = (registry.current().fingerprint, explain)
+    result = entry[2].get(key)
+    if result is None:
+        result = entry[2][key] = score_live_features([addr], [entry[1]], chain=chain, explain=explain)[0]
+    return dict(result)
+
+
+async def _live_entry(addr: str, chain: str) -> list:
+    """
+    [expires_at, features, scored results] for a live address: from the recent
+    results, or one fetch shared by every concurrent caller (who then also
+    share the scored result).
+    """
+    from services.etherscan import fetch_features_shared
+
+    now = time.monotonic()
+    entry = _live_results.get((chain, addr))
+    if entry is not None and entry[0] > now:
+        _live_results.move_to_end((chain, addr))
+        metrics.LIVE_RESULTS.inc("hit")
+        return entry
+    metrics.LIVE_RESULTS.inc("miss")
+    features = await fetch_features_shared(addr, chain=chain)
+    entry = _live_results.get((chain, addr))
+    if entry is not None and entry[1] is features:
+        return entry              # another waiter on the same fetch got here first
+    entry = [time.monotonic() + LIVE_RESULT_TTL_S, features, {}]
+    if LIVE_RESULT_TTL_S > 0:
+        _live_results[(chain, addr)] = entry
+        _live_results.move_to_end((chain, addr))
+        while len(_live_results) > LIVE_RESULT_CACHE_SIZE:
+            _live_results.popitem(last=False)
+    return entry
+
+
+def _live_fields(result: dict, f: dict, chain: str) -> dict:
+    """Live display fields from the `_` extras of a fetched feature dict."""
+    result["data_source"] = "live"
+    result["chain"]            = chain
+    result["wallet_age_days"]  = round(f.get("_wallet_age_days", 0), 1)
+    result["nft_collections"]  = int(f.get("_nft_collections", 0))
+    result["unique_contracts"] = int(f.get("_unique_contracts", 0))
+    result["total_volume_eth"] = round(f.get("_total_volume_eth", 0), 4)
+    result["funded_by"]        = f.get("_funded_by") or None
+    if f.get("_partial"):
+        result["partial"] = True     # history cut at ETHERSCAN_MAX_PAGES; the next refresh continues it
+    return result
+
+
+def score_live_features(addrs: list, features: list, chain: str = "eth", explain: str = "top3") -> list:
+    """Score live-fetched feature dicts in one model pass."""
+    m = registry.current()
+    results = _score_matrix(m, addrs, _feature_matrix(m, features), explain)
+    return [_live_fields(r, f, chain) for r, f in zip(results, features)]
+
+
+async def score_cross_chain(addresses: list, chains: list, explain: str = "none",
+                            concurrency: int = 16, timeout: float = 30.0) -> list:
+    """
+    Score every (address, chain) pair in one call. Known ETH addresses come
+    from the lookup; every other pair is fetched live (shared with concurrent
+    callers, recent results reused) with at most `concurrency` fetches in
+    flight across all chains, and the fetched rows are scored in one model
+    pass. Pairs not fetched within `timeout` of the start come back as errors,
+    so latency is bounded by the slowest chain, not the sum.
+    Returns one entry per address: the cross-chain aggregate plus per-chain results.
+    """
+    from services.etherscan import error_result, has_keys, unsupported_result
+
+    addrs = list(dict.fromkeys(a.strip().lower() for a in addresses))
+    m = registry.current()
+    results = {}      # (address, chain) → result
+
+    if "eth" in chains:
+        with metrics.stage("lookup"):
+            pos = m.lookup.positions(addrs)
+            hit = pos >= 0
+            X = np.asarray(m.lookup.matrix[pos[hit]], dtype=float)
+        for r in _score_matrix(m, [a for a, h in zip(addrs, hit) if h], X, explain, pos=pos[hit]):
+            r["chain"] = "eth"
+            results[(r["address"], "eth")] = r
+    for c in chains:
+        if not has_keys(c):
+            for a in addrs:
+                results.setdefault((a, c), unsupported_result(a, c))
+    pairs = [(a, c) for a in addrs for c in chains if (a, c) not in results]
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(addr: str, chain: str) -> list:
+        async with sem:
+            left = deadline - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError(f"not fetched within {timeout:g}s")
+            return await asyncio.wait_for(_live_entry(addr, chain), left)
+
+    entries = await asyncio.gather(*(fetch(a, c) for a, c in pairs), return_exceptions=True)
+
+    key = (m.fingerprint, explain)
+    todo = []         # (address, chain, live entry) still to score
+    for (addr, chain), entry in zip(pairs, entries):
+        if isinstance(entry, Exception):
+            metrics.LIVE_ERRORS.inc(chain, type(entry).__name__)
+            results[(addr, chain)] = error_result(addr, chain, entry)
+        elif key in entry[2]:
+            results[(addr, chain)] = dict(entry[2][key])
+        else:
+            todo.append((addr, chain, entry))
+    if todo:
+        feats = [e[1] for _, _, e in todo]
+        scored = _score_matrix(m, [a for a, _, _ in todo], _feature_matrix(m, feats), explain)
+        for (addr, chain, entry), r, f in zip(todo, scored, feats):
+            entry[2][key] = _live_fields(r, f, chain)
+            results[(addr, chain)] = dict(r)
+    return [_cross_chain_summary(addr, chains, results) for addr in addrs]
+
+
+def _cross_chain_summary(addr: str, chains: list, results: dict) -> dict:
+    """
+    Cross-chain risk for one address: the highest-scoring chain among those
+    with activity (all scored chains if none has any). Chains the model saw
+    only as an empty history would otherwise dilute or inflate the verdict.
+    """
+    per_chain = {c: results[(addr, c)] for c in chains}
+    scored = {c: r for c, r in per_chain.items() if r.get("score") is not None}
+    active = [c for c, r in scored.items() if r.get("tx_count")]
+    summary = {
+        "address":       addr,
+        "sybil_score":   None,
+        "score":         None,
+        "risk":          "error",
+        "worst_chain":   None,
+        "chains_active": active,
+        "chains_failed": [c for c, r in per_chain.items() if r.get("data_source") == "error"],
+        "chains_unsupported": [c for c, r in per_chain.items() if r.get("data_source") == "unsupported"],
+    }
+    if scored:
+        worst = max(active or scored, key=lambda c: scored[c]["score"])
+        summary.update(sybil_score=scored[worst]["sybil_score"], score=scored[worst]["score"],
+                       risk=scored[worst]["risk"], worst_chain=worst)
+    summary["chains"] = per_chain
+    return summary
+
+
+async def explain_address(address: str, chain: str = "eth", explain: str = "full") -> dict:
+    """
+    Explanation for one address on demand: lookup features when known (cached
+    contributions), otherwise the live features (usually still among the
+    recent live results for an address that was just scored).
+    """
+    addr = address.strip().lower()
+    m = registry.current()
+    pos = m.lookup.positions([addr]) if chain == "eth" else np.array([-1])
+    if pos[0] >= 0:
+        why = _explain(m, [addr], np.asarray(m.lookup.matrix[pos], dtype=float), explain, pos=pos)[0]
+        source = "cached"
+    else:
+        X = _feature_matrix(m, [(await _live_entry(addr, chain))[1]])
+        why = _explain(m, [addr], X, explain)[0]
+        source = "live"
+    return {"address": addr, "chain": chain, "explain": explain, **why, "data_source": source}
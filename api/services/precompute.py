@@ -0,0 +1,60 @@
+"""
+Offline scoring of the whole lookup table.
+
+Lookup features are frozen and the models are deterministic, so every known
+address's score, LGB / IF components, risk, sybil_type and top-3 features are
+computed once per model version and stored next to the lookup store
+(data/lookup/scores/<fingerprint>/). The registry maps the table when its
+fingerprint, SCORE_VERSION and lookup digest (keys and feature values) all
+match, and the known-address path in services.model turns into an index read. A table for other models or
+an older lookup is simply ignored (and replaced by the next run).
+
+Run from api/ after building the lookup store or changing the models:
+  python -m services.precompute
+"""
+
+import sys
+import time
+import numpy as np
+from services import registry
+from services.lookup import save_scores
+from services.model import SCORE_VERSION, _contributions, _rank, _score_components
+
+_CHUNK = 4096
+
+
+def precompute(m=None) -> str:
+    """Score every lookup row with bundle `m` (default: the current one) and save the table."""
+    m = m or registry.current()
+    n = len(m.lookup)
+    if not n:
+        raise ValueError("lookup store is empty")
+    arrays = {
+        "lgb":         np.empty(n),
+        "iso":         np.empty(n),
+        "score":       np.empty(n),
+        "risk":        np.empty(n, np.uint8),
+        "type":        np.empty(n, np.uint8),
+        "top_idx":     np.empty((n, 3), np.uint8),
+        "top_contrib": np.empty((n, 3)),
+    }
+    for i in range(0, n, _CHUNK):
+        X = np.asarray(m.lookup.matrix[i:i + _CHUNK], dtype=float)
+        part = slice(i, i + len(X))
+        for name, col in zip(("lgb", "iso", "score", "risk", "type"), _score_components(m, X)):
+            arrays[name][part] = col
+        contribs = _contributions(m, X)
+        idx = _rank(contribs, 3)
+        arrays["top_idx"][part] = idx
+        arrays["top_contrib"][part] = np.take_along_axis(contribs, idx, axis=1)
+    meta = {"version": SCORE_VERSION, "rows": n, "lookup": m.lookup.digest(), "created_at": time.time()}
+    return save_scores(registry.LOOKUP_DIR, m.fingerprint, arrays, meta)
+
+
+if __name__ == "__main__":
+    t = time.perf_counter()
+    try:
+        out = precompute()
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"scored {len(registry.current().lookup)} rows in {time.perf_counter() - t:.1f}s → {out}")
@@ -0,0 +1,242 @@
+"""
+Model registry: one place that loads, shares and swaps the scoring models.
+
+Nothing is loaded at import. The API process warms up in the background
+(`start`, called from the app lifespan) and reports progress on /ready;
+scoring processes load synchronously on first use. Loading is cheap after the
+first time on a host: the tree ensemble is exported once per model version to
+models/trees/<fingerprint>/ and the lookup table is built once into
+data/lookup/ (and rebuilt when the labeled CSV changes), and both are
+memory-mapped, so every worker and scoring process shares the same page-cache
+pages instead of holding its own copy.
+
+The loaded bundle is swapped atomically when the model files or the lookup
+store change on disk (checked every MODEL_WATCH_S), so a new model version is
+picked up without a restart; in-flight requests finish on the bundle they
+started with.
+
+    python -m services.registry      # preload (export + lookup build) and print the stage timings
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import threading
+import numpy as np
+from services import trees
+from services.lookup import LookupStore, build as build_lookup, is_current as is_lookup_current, open_scores
+
+_BASE = os.path.dirname(os.path.abspath(__file__))
+_MODEL_DIR = os.getenv("SYBILSCAN_MODEL_DIR", os.path.join(_BASE, "..", "models"))
+_DATA_DIR  = os.path.join(_BASE, "..", "data")
+
+FEATURE_NAMES_PATH = os.path.join(_MODEL_DIR, "feature_names.json")
+LOOKUP_DIR         = os.getenv("SYBILSCAN_LOOKUP_DIR", os.path.join(_DATA_DIR, "lookup"))
+LOOKUP_CSV         = os.path.join(_DATA_DIR, "nft_feats_labeled_T30.csv")
+
+TREE_ENGINE   = os.getenv("SYBILSCAN_TREE_ENGINE", "native")  # "numpy": services.trees (small batches)
+MODEL_WATCH_S = float(os.getenv("MODEL_WATCH_S", "30"))        # model / lookup change check interval
+
+
+class NotReady(RuntimeError):
+    """Models are still loading (or the last load failed)."""
+
+
+class Models:
+    """One immutable model version: feature layout, lookup store and scorers."""
+
+    def __init__(self, feature_names, lookup, engine, lgb_model, iso_model, fingerprint, stamp, scores=None):
+        self.feature_names = feature_names
+        self.index = {f: i for i, f in enumerate(feature_names)}
+        self.lookup = lookup
+        self.engine = engine              # trees.TreeEngine, or None with the native engine
+        self.lgb_model = lgb_model        # only loaded with the native engine
+        self.iso_model = iso_model
+        self.fingerprint = fingerprint
+        self.scores = scores              # precomputed per-row outputs for this fingerprint, or None
+        self.stamp = stamp
+        self.loaded_at = time.time()
+
+
+_lock = threading.Lock()
+_current = None
+_warming = False          # a background loader owns loading in this process
+_checked = 0.0
+_state = {"status": "idle", "error": None, "timings": {}}
+
+
+def _stamp() -> tuple:
+    """(path, mtime_ns, size) of every file a bundle is built from."""
+    out = []
+    for p in (trees.LGB_PATH, trees.ISO_PATH, FEATURE_NAMES_PATH,
+              os.path.join(LOOKUP_DIR, "meta.json"), os.path.join(LOOKUP_DIR, "scores"), LOOKUP_CSV):
+        try:
+            st = os.stat(p)
+            out.append((p, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            out.append((p, None, None))
+    return tuple(out)
+
+
+def _open_lookup(feature_names: list) -> LookupStore:
+    """
+    Memory-mapped lookup store, built from the labeled CSV on first use and
+    rebuilt whenever the CSV no longer matches the one the store was built from.
+    """
+    if os.path.exists(os.path.join(LOOKUP_DIR, "meta.json")) and os.path.exists(LOOKUP_CSV) \
+            and not is_lookup_current(LOOKUP_DIR, LOOKUP_CSV):
+        try:
+            build_lookup(LOOKUP_CSV, LOOKUP_DIR, feature_names)    # files replaced atomically
+            shutil.rmtree(os.path.join(LOOKUP_DIR, "scores"), ignore_errors=True)   # scored from the old rows
+        except OSError:
+            pass    # read-only data dir: keep serving the existing store
+    if not os.path.exists(os.path.join(LOOKUP_DIR, "meta.json")) and os.path.exists(LOOKUP_CSV):
+        tmp = f"{LOOKUP_DIR}.tmp-{os.getpid()}"
+        try:
+            build_lookup(LOOKUP_CSV, tmp, feature_names)
+            os.rename(tmp, LOOKUP_DIR)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)   # another process won the race, or read-only data dir
+            if not os.path.exists(os.path.join(LOOKUP_DIR, "meta.json")):
+                return LookupStore.from_csv(LOOKUP_CSV, feature_names)
+    if os.path.exists(os.path.join(LOOKUP_DIR, "meta.json")):
+        return LookupStore.open(LOOKUP_DIR, feature_names)
+    return LookupStore.empty(feature_names)
+
+
+def _open_scores(lookup: LookupStore, fp: str):
+    """Precomputed score table for this model and lookup, if one is current."""
+    from services.model import SCORE_VERSION
+    if not len(lookup):
+        return None
+    table = open_scores(LOOKUP_DIR, fp, lookup)
+    if table is None or table[1].get("version") != SCORE_VERSION:
+        return None
+    return table[0]
+
+
+def load() -> Models:
+    """Build a fresh bundle, recording how long each stage took in _state["timings"]."""
+    timings = {}
+    t = time.perf_counter()
+
+    def stage(name):
+        nonlocal t
+        now = time.perf_counter()
+        timings[name] = round(now - t, 4)
+        t = now
+
+    stamp = _stamp()
+    feature_names = json.load(open(FEATURE_NAMES_PATH))
+    stage("feature_names")
+    lookup = _open_lookup(feature_names)
+    stage("lookup")
+    engine = lgb_model = iso_model = None
+    if TREE_ENGINE == "native":
+        import joblib
+        lgb_model, iso_model = joblib.load(trees.LGB_PATH), joblib.load(trees.ISO_PATH)
+        fp = trees.fingerprint()
+        stage("models")
+    else:
+        engine = trees.TreeEngine.load(trees.export())
+        fp = engine.fingerprint
+        stage("trees")
+    scores = _open_scores(lookup, fp)
+    stage("scores")
+    m = Models(feature_names, lookup, engine, lgb_model, iso_model, fp, stamp, scores)
+
+    # One prediction touches the mapped pages and builds the lazy SHAP tables before traffic arrives
+    if engine is not None:
+        X = np.asarray(lookup.matrix[:1], np.float64) if len(lookup) else np.zeros((1, len(feature_names)))
+        engine.lgb_proba(X), engine.iso_score(X), engine.contributions(X)
+    stage("warmup")
+    timings["total"] = round(sum(timings.values()), 4)
+    _state["timings"] = timings
+    return m
+
+
+def reload(force: bool = False) -> Models:
+    """Load a new bundle if the files changed (or `force`) and swap it in."""
+    global _current, _checked
+    with _lock:
+        _checked = time.monotonic()
+        if _current is not None and not force and _current.stamp == _stamp():
+            return _current
+        _state["status"] = "loading" if _current is None else "reloading"
+        try:
+            _current = load()
+        except Exception as e:
+            _state["error"] = f"{type(e).__name__}: {e}"
+            _state["status"] = "failed" if _current is None else "ready"
+            if _current is None:
+                raise NotReady(_state["error"]) from e
+            return _current      # keep serving the previous version
+        _state["status"], _state["error"] = "ready", None
+        return _current
+
+
+def current() -> Models:
+    """
+    The bundle to score with. Loads synchronously on first use, unless this
+    process's background loader owns loading — then raises NotReady until it is done.
+    """
+    m = _current
+    if m is None:
+        if _warming:
+            raise NotReady(_state["error"] or "models are loading")
+        return reload()
+    if not _warming and time.monotonic() - _checked >= MODEL_WATCH_S:
+        return reload()
+    return m
+
+
+async def wait_ready() -> Models:
+    while _current is None:
+        if _state["status"] == "failed":
+            raise NotReady(_state["error"])
+        await asyncio.sleep(0.1)
+    return _current
+
+
+def status() -> dict:
+    m = _current
+    return {
+        **_state,
+        "engine":      TREE_ENGINE,
+        "fingerprint": m.fingerprint if m else None,
+        "loaded_at":   m.loaded_at if m else None,
+        "lookup_rows": len(m.lookup) if m else None,
+        "precomputed": m.scores is not None if m else None,
+    }
+
+
+def start() -> asyncio.Task:
+    """App startup: warm up in the background; scoring calls get NotReady until it finishes."""
+    global _warming
+    _warming = True
+    return asyncio.create_task(_watch())
+
+
+async def _watch():
+    """Load, then check the model files every MODEL_WATCH_S and hot-swap on change."""
+    global _warming
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(reload)
+            except NotReady:
+                pass   # reported by status(); retried next tick
+            await asyncio.sleep(MODEL_WATCH_S)
+    finally:
+        _warming = False
+
+
+if __name__ == "__main__":
+    try:
+        reload()
+    except NotReady as e:
+        sys.exit(str(e))
+    print(json.dumps(status(), indent=2))
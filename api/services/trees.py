@@ -0,0 +1,524 @@
+"""
+Pure-NumPy inference for the LightGBM + IsolationForest ensemble.
+
+Both joblib models are flattened into contiguous node arrays (feature,
+threshold, children, leaf value) and, from those, per-feature bitvector
+tables: a row's threshold bin on each feature selects one precomputed mask
+per tree, and the lowest bit surviving the AND over features is the exit
+leaf. A batch is scored with a searchsorted per feature, one gather and one
+AND-reduce, with no per-level loop and none of the per-call overhead of the
+sklearn / LightGBM wrappers.
+
+Contributions are exact path-dependent TreeSHAP (what LightGBM's
+pred_contrib computes). For a leaf with value v whose path has unique
+features i with zero fraction z_i (cover ratio) and one fraction o_i (row
+follows every split on i), feature j receives
+
+    v · (o_j − z_j) · ∫₀¹ ∏_{i≠j} (z_i·(1−u) + o_i·u) du
+
+The integrand is a polynomial of degree < k, so Gauss–Legendre quadrature
+with ⌈k/2⌉ nodes is exact. Leaves are grouped by k and evaluated for all
+rows together.
+
+The engine is opt-in (SYBILSCAN_TREE_ENGINE=numpy): it beats the wrappers'
+per-call overhead on small live batches, but native LightGBM is faster on
+large batches and single-row contributions, so native stays the default.
+tests/test_trees.py runs `verify` against the native models.
+
+Exports live in models/trees/<fingerprint>/ as one .npy per array, so every
+process memory-maps the same files and shares their pages.
+
+    python -m services.trees export   [dir]         # flatten models/*.joblib
+    python -m services.trees verify   [--rows N]    # compare against the native models
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:       # non-POSIX: no cross-process export lock
+    fcntl = None
+
+_BASE = os.path.dirname(os.path.abspath(__file__))
+_MODEL_DIR = os.getenv("SYBILSCAN_MODEL_DIR", os.path.join(_BASE, "..", "models"))
+
+LGB_PATH = os.path.join(_MODEL_DIR, "lgb_blur_t30.joblib")
+ISO_PATH = os.path.join(_MODEL_DIR, "iso_blur.joblib")
+TREES_DIR = os.path.join(_MODEL_DIR, "trees")
+
+_MISSING = {"None": 0, "Zero": 1, "NaN": 2}
+_ZERO = 1e-35           # LightGBM kZeroThreshold
+_CHUNK = 512            # rows per prediction pass (bounds the gathered table rows)
+_SHAP_CHUNK = 256       # rows per SHAP pass
+
+
+def fingerprint(paths=(LGB_PATH, ISO_PATH)) -> str:
+    """Content hash of the model files; exported arrays are only valid for a matching fingerprint."""
+    h = hashlib.sha256()
+    for p in paths:
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+
+# ── export ────────────────────────────────────────────────────────────────────
+
+def _flatten_lgb(booster) -> dict:
+    """Flatten a LightGBM booster (binary, numerical splits) into node + SHAP path arrays."""
+    dump = booster.dump_model()
+    if dump["num_tree_per_iteration"] != 1:
+        raise ValueError("only single-output (binary / regression) boosters are supported")
+    objective = dump["objective"].split()
+    sigmoid = next((float(o.split(":")[1]) for o in objective if o.startswith("sigmoid:")), None)
+
+    feat, thr, left, right, value, dleft, mtype = [], [], [], [], [], [], []
+    roots, leaves = [], []    # leaves: (value, [(node, went_left, feature, zero_fraction)])
+    expected = 0.0
+
+    def walk(node, path):
+        nid = len(feat)
+        for a in (feat, thr, left, right, value, dleft, mtype):
+            a.append(0)
+        if "leaf_index" in node or "split_index" not in node:
+            feat[nid], thr[nid], left[nid], right[nid] = 0, np.inf, nid, nid
+            value[nid] = node.get("leaf_value", 0.0)
+            leaves.append((value[nid], path))
+            return nid, node.get("leaf_count", 0)
+        if node["decision_type"] != "<=":
+            raise ValueError("categorical splits are not supported")
+        feat[nid] = node["split_feature"]
+        thr[nid] = node["threshold"]
+        dleft[nid] = node["default_left"]
+        mtype[nid] = _MISSING[node["missing_type"]]
+        count = node["internal_count"]
+        lc = node["left_child"].get("internal_count", node["left_child"].get("leaf_count", 0))
+        rc = node["right_child"].get("internal_count", node["right_child"].get("leaf_count", 0))
+        left[nid], _ = walk(node["left_child"], path + [(nid, True, feat[nid], lc / count)])
+        right[nid], _ = walk(node["right_child"], path + [(nid, False, feat[nid], rc / count)])
+        return nid, count
+
+    for tree in dump["tree_info"]:
+        first_leaf = len(leaves)
+        roots.append(walk(tree["tree_structure"], [])[0])
+        for v, path in leaves[first_leaf:]:
+            expected += v * np.prod([z for *_, z in path])
+
+    out = {
+        "lgb_feature":      np.asarray(feat, np.int32),
+        "lgb_threshold":    np.asarray(thr, np.float64),
+        "lgb_left":         np.asarray(left, np.int32),
+        "lgb_right":        np.asarray(right, np.int32),
+        "lgb_value":        np.asarray(value, np.float64),
+        "lgb_default_left": np.asarray(dleft, bool),
+        "lgb_missing":      np.asarray(mtype, np.int8),
+        "lgb_roots":        np.asarray(roots, np.int32),
+        "lgb_sigmoid":      np.float64(sigmoid if sigmoid is not None else np.nan),
+        "lgb_expected":     np.float64(expected),
+    }
+    out.update(_shap_tables(leaves))
+    return out
+
+
+def _shap_tables(leaves: list) -> dict:
+    """
+    Path tables for TreeSHAP. Leaves are grouped by their number k of unique
+    path features; per group:
+      shap{k}_v (L,)  leaf values,  shap{k}_feat / shap{k}_z (L, k)  features and
+      zero fractions (product of cover ratios per feature),  shap{k}_slots  offset
+      of the group's (leaf, feature) slots in the global slot order.
+    A slot's one fraction is 1 iff the row follows every split on that feature
+    along the path: shap_slot_node / shap_slot_left (slots, max edges) list
+    those splits as indices into shap_nodes plus the required direction,
+    padded by repeating the slot's last edge.
+    """
+    groups = {}
+    for v, path in leaves:
+        slots, z = {}, []
+        for _, _, f, frac in path:
+            if f not in slots:
+                slots[f] = len(z)
+                z.append(1.0)
+            z[slots[f]] *= frac
+        if slots:          # single-leaf tree: only moves the expected value
+            groups.setdefault(len(z), []).append((v, slots, z, path))
+    out = {}
+    edges = []            # per slot: [(node, went_left)]
+    for k in sorted(groups):
+        out[f"shap{k}_slots"] = np.int64(len(edges))
+        for _, slots, _, path in groups[k]:
+            edges.extend([(nid, is_left) for nid, is_left, ef, _ in path if ef == f] for f in slots)
+        out[f"shap{k}_v"] = np.asarray([g[0] for g in groups[k]], np.float64)
+        out[f"shap{k}_feat"] = np.asarray([list(g[1]) for g in groups[k]], np.int32)
+        out[f"shap{k}_z"] = np.asarray([g[2] for g in groups[k]], np.float64)
+    nodes = sorted({nid for e in edges for nid, _ in e})
+    col = {nid: i for i, nid in enumerate(nodes)}
+    width = max((len(e) for e in edges), default=1)
+    slot_node = np.zeros((len(edges), width), np.int32)
+    slot_left = np.zeros((len(edges), width), bool)
+    for s, e in enumerate(edges):
+        e = e + [e[-1]] * (width - len(e))
+        slot_node[s] = [col[nid] for nid, _ in e]
+        slot_left[s] = [is_left for _, is_left in e]
+    out["shap_nodes"] = np.asarray(nodes, np.int32)
+    out["shap_slot_node"] = slot_node
+    out["shap_slot_left"] = slot_left
+    return out
+
+
+def _bit_tables(prefix: str, arrays: dict, missing: bool) -> dict:
+    """
+    Per-feature exit-leaf bitvectors (QuickScorer-style). Leaves of each tree are
+    numbered left to right; a split that sends a row right rules out every
+    leaf of its left subtree. Since a row's decisions on feature f depend only
+    on which threshold bin its value falls in, each (feature, bin) row of
+    {prefix}_table holds, per tree, the AND of the masks of all f-splits that
+    bin goes right at. A row's exit leaf in each tree is the lowest bit left
+    after AND-ing its table rows across features.
+
+    With `missing`, each feature gets two extra rows after its bins: values
+    that are zero (|x| <= 1e-35) and NaN, resolved per LightGBM's missing_type.
+    """
+    feat, thr = arrays[f"{prefix}_feature"], arrays[f"{prefix}_threshold"]
+    left, right, roots = arrays[f"{prefix}_left"], arrays[f"{prefix}_right"], arrays[f"{prefix}_roots"]
+    dleft = arrays.get(f"{prefix}_default_left")
+    mtype = arrays.get(f"{prefix}_missing")
+
+    # Leaf numbering and left-subtree masks (Python ints, split into 64-bit words below)
+    tree_of = np.zeros(len(feat), np.int32)
+    leaf_bit = {}
+    left_bits = {}
+    n_leaves = []
+    for t, root in enumerate(roots):
+        count = 0
+
+        def walk(nid):
+            nonlocal count
+            tree_of[nid] = t
+            if left[nid] == nid:
+                leaf_bit[nid] = count
+                count += 1
+                return 1 << leaf_bit[nid]
+            lb = walk(left[nid])
+            left_bits[nid] = lb
+            return lb | walk(right[nid])
+
+        walk(int(root))
+        n_leaves.append(count)
+    W = max(1, -(-max(n_leaves) // 64))
+    full = (1 << (64 * W)) - 1
+
+    def words(bits):
+        return [(bits >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(W)]
+
+    leaf_value = np.zeros((len(roots), 64 * W))
+    for nid, bit in leaf_bit.items():
+        leaf_value[tree_of[nid], bit] = arrays[f"{prefix}_value"][nid]
+
+    internal = np.array(sorted(left_bits))
+    used = np.unique(feat[internal]) if len(internal) else np.zeros(0, np.int64)
+    bins, bin_start, row_start, tables = [], [0], [], []
+    n_rows = 0
+    for f in used:
+        nodes = internal[feat[internal] == f]
+        t_f = np.unique(thr[nodes])
+        B = len(t_f)
+        acc = np.full((B + 1 + 2 * missing, len(roots), W), np.uint64(0xFFFFFFFFFFFFFFFF))
+        for nid in nodes:
+            mask = np.array(words(full & ~left_bits[nid]), np.uint64)
+            r = int(np.searchsorted(t_f, thr[nid]))
+            acc[r + 1, tree_of[nid]] &= mask        # bins above rank r go right
+            if missing:
+                zero_right = (not dleft[nid]) if mtype[nid] == 1 else thr[nid] < 0
+                nan_right = (not dleft[nid]) if mtype[nid] != 0 else thr[nid] < 0
+                if zero_right:
+                    acc[B + 1, tree_of[nid]] &= mask
+                if nan_right:
+                    acc[B + 2, tree_of[nid]] &= mask
+        acc[:B + 1] = np.bitwise_and.accumulate(acc[:B + 1], axis=0)
+        bins.append(t_f)
+        bin_start.append(bin_start[-1] + B)
+        row_start.append(n_rows)
+        tables.append(acc)
+        n_rows += len(acc)
+    return {
+        f"{prefix}_used":       used.astype(np.int32),
+        f"{prefix}_bins":       np.concatenate(bins) if bins else np.zeros(0),
+        f"{prefix}_bin_start":  np.asarray(bin_start, np.int64),
+        f"{prefix}_row_start":  np.asarray(row_start, np.int64),
+        f"{prefix}_table":      np.concatenate(tables) if tables else np.zeros((0, len(roots), W), np.uint64),
+        f"{prefix}_leaf_value": leaf_value,
+    }
+
+
+def _average_path_length(n: np.ndarray) -> np.ndarray:
+    """sklearn's c(n): average path length of an unsuccessful BST search."""
+    n = np.asarray(n, np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+def _flatten_iso(iso) -> dict:
+    """Flatten an IsolationForest; leaf value = that leaf's path-length term."""
+    feat, thr, left, right, value, roots = [], [], [], [], [], []
+    base = 0
+    for est, features in zip(iso.estimators_, iso.estimators_features_):
+        t = est.tree_
+        n = t.node_count
+        is_leaf = t.children_left == -1
+        depth = np.ones(n)    # root has depth 1, as in Tree.compute_node_depths
+        for i in range(n):    # parents precede children in sklearn's node order
+            if not is_leaf[i]:
+                depth[t.children_left[i]] = depth[t.children_right[i]] = depth[i] + 1
+        mapped = np.asarray(features)[np.maximum(t.feature, 0)]
+        idx = np.arange(n) + base
+        feat.append(np.where(is_leaf, 0, mapped))
+        thr.append(np.where(is_leaf, np.inf, t.threshold))
+        left.append(np.where(is_leaf, idx, t.children_left + base))
+        right.append(np.where(is_leaf, idx, t.children_right + base))
+        value.append(np.where(is_leaf, depth + _average_path_length(t.n_node_samples) - 1.0, 0.0))
+        roots.append(base)
+        base += n
+    return {
+        "iso_feature":   np.concatenate(feat).astype(np.int32),
+        "iso_threshold": np.concatenate(thr).astype(np.float64),
+        "iso_left":      np.concatenate(left).astype(np.int32),
+        "iso_right":     np.concatenate(right).astype(np.int32),
+        "iso_value":     np.concatenate(value).astype(np.float64),
+        "iso_roots":     np.asarray(roots, np.int32),
+        "iso_denominator": np.float64(len(iso.estimators_) * _average_path_length([iso._max_samples])[0]),
+        "iso_offset":    np.float64(iso.offset_),
+    }
+
+
+def flatten(lgb_model, iso_model) -> dict:
+    booster = getattr(lgb_model, "booster_", lgb_model)
+    arrays = {**_flatten_lgb(booster), **_flatten_iso(iso_model)}
+    arrays["lgb_n_features"] = np.int64(booster.num_feature())
+    arrays.update(_bit_tables("lgb", arrays, missing=True))
+    arrays.update(_bit_tables("iso", arrays, missing=False))
+    return arrays
+
+
+def export(root: str = TREES_DIR, lgb_path: str = LGB_PATH, iso_path: str = ISO_PATH) -> str:
+    """
+    Flatten the joblib models into root/<fingerprint>/ (no-op if that export
+    exists) and prune exports of other fingerprints. Safe to call from several
+    processes at once: one exports, the rest wait on the lock and reuse it.
+    """
+    fp = fingerprint((lgb_path, iso_path))
+    out = os.path.join(root, fp)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(os.path.join(out, "meta.json")):
+            return out
+        import joblib
+        arrays = flatten(joblib.load(lgb_path), joblib.load(iso_path))
+        tmp = f"{out}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), arr)
+        json.dump({"fingerprint": fp, "arrays": sorted(arrays)}, open(os.path.join(tmp, "meta.json"), "w"))
+        shutil.rmtree(out, ignore_errors=True)
+        os.rename(tmp, out)
+        # Mapped files stay valid after unlink, so live processes are unaffected
+        for name in os.listdir(root):
+            if name != fp and not name.startswith("."):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return out
+
+
+# ── inference ─────────────────────────────────────────────────────────────────
+
+def _lgb_decision(x, thr, dleft, missing):
+    """LightGBM NumericalDecision: NaN → 0 unless NaN is the missing marker; missing → default side."""
+    nan = np.isnan(x)
+    x = np.where(nan & (missing != 2), 0.0, x)
+    is_missing = ((missing == 1) & (np.abs(x) <= _ZERO)) | ((missing == 2) & nan)
+    return np.where(is_missing, dleft, x <= thr)
+
+
+class TreeEngine:
+    """Flattened LightGBM + IsolationForest ensemble (see module docstring)."""
+
+    def __init__(self, arrays: dict, fingerprint: str = None):
+        self.a = arrays
+        self.fingerprint = fingerprint
+        self.shap_groups = sorted(int(k[4:-2]) for k in arrays if k.startswith("shap") and k.endswith("_v"))
+        self._bin_feature = {
+            p: np.repeat(np.arange(len(arrays[f"{p}_used"])), np.diff(arrays[f"{p}_bin_start"]))
+            for p in ("lgb", "iso")
+        }
+        self._shap_consts = None
+
+    @classmethod
+    def load(cls, path: str):
+        """Memory-map an export directory written by `export`."""
+        meta = json.load(open(os.path.join(path, "meta.json")))
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in meta["arrays"]}
+        return cls(arrays, meta["fingerprint"])
+
+    @classmethod
+    def from_models(cls, lgb_model, iso_model, fp: str = None):
+        return cls(flatten(lgb_model, iso_model), fp)
+
+    # ── prediction ──
+
+    def _leaf_values(self, prefix: str, X: np.ndarray) -> np.ndarray:
+        """Leaf value reached in every tree, shape (rows, trees)."""
+        a = self.a
+        used, bins, start = a[f"{prefix}_used"], a[f"{prefix}_bins"], a[f"{prefix}_bin_start"]
+        x = X[:, used]
+        n_bins = np.diff(start)
+        if len(X) <= 64:
+            # Tiny batch: one compare against every threshold beats a searchsorted per feature
+            b = np.add.reduceat(bins < x[:, self._bin_feature[prefix]], start[:-1], axis=1) \
+                if len(bins) else np.zeros_like(x, np.int64)
+        else:
+            b = np.empty(x.shape, np.int64)
+            for u in range(len(used)):
+                b[:, u] = np.searchsorted(bins[start[u]:start[u + 1]], x[:, u], side="left")
+        if prefix == "lgb":
+            b = np.where(np.isnan(x), n_bins + 2, np.where(np.abs(x) <= _ZERO, n_bins + 1, b))
+        words = np.bitwise_and.reduce(a[f"{prefix}_table"][a[f"{prefix}_row_start"] + b], axis=1)
+        if words.shape[2] == 1:
+            w, word = 0, words[:, :, 0]
+        else:
+            w = np.argmax(words != 0, axis=2)
+            word = np.take_along_axis(words, w[:, :, None], axis=2)[:, :, 0]
+        low = word & (~word + np.uint64(1))
+        leaf = w * 64 + np.frexp(low.astype(np.float64))[1] - 1
+        return a[f"{prefix}_leaf_value"][np.arange(leaf.shape[1]), leaf]
+
+    def _chunked(self, fn, X, chunk: int = _CHUNK) -> np.ndarray:
+        X = np.asarray(X, np.float64)
+        if len(X) <= chunk:
+            return fn(X)
+        return np.concatenate([fn(X[i:i + chunk]) for i in range(0, len(X), chunk)])
+
+    def lgb_raw(self, X) -> np.ndarray:
+        return self._chunked(lambda x: self._leaf_values("lgb", x).sum(axis=1), X)
+
+    def lgb_proba(self, X) -> np.ndarray:
+        """Positive-class probability (predict_proba(X)[:, 1])."""
+        raw = self.lgb_raw(X)
+        s = float(self.a["lgb_sigmoid"])
+        return raw if np.isnan(s) else 1.0 / (1.0 + np.exp(-s * raw))
+
+    def iso_score(self, X) -> np.ndarray:
+        """Anomaly score, higher = more anomalous (-decision_function(X))."""
+        a = self.a
+
+        def score(x):
+            # sklearn trees split on float32 inputs
+            depth = self._leaf_values("iso", x.astype(np.float32).astype(np.float64)).sum(axis=1)
+            return 2.0 ** (-depth / float(a["iso_denominator"])) + float(a["iso_offset"])
+
+        return self._chunked(score, X, chunk=_CHUNK // 2)
+
+    # ── contributions ──
+
+    def _shap_setup(self):
+        """Per-group quadrature constants, built on first use. Arrays are laid out (leaf, slot, row)."""
+        a = self.a
+        n_feat = int(a["lgb_n_features"])
+        consts = []
+        for k in self.shap_groups:
+            v, feat = a[f"shap{k}_v"], a[f"shap{k}_feat"]
+            z = a[f"shap{k}_z"][:, :, None]
+            u, w = np.polynomial.legendre.leggauss(max(1, (k + 1) // 2))
+            u, w = (u + 1) / 2, w / 2
+            quad = [(z * (1 - uq), z * (1 - uq) + uq, (wq * v)[:, None, None]) for uq, wq in zip(u, w)]
+            scatter = np.eye(n_feat)[feat.ravel()].T.copy()    # (F, L·k): sums slots into features
+            consts.append((k, int(a[f"shap{k}_slots"]), len(v), quad, 1 - z, -z, scatter))
+        self._shap_consts = consts
+        return consts
+
+    def contributions(self, X) -> np.ndarray:
+        """Path-dependent TreeSHAP, shape (rows, features + 1); last column is the expected value."""
+        X = np.asarray(X, np.float64)
+        n_feat = X.shape[1]
+
+        def run(x):
+            phi = np.empty((len(x), n_feat + 1))
+            phi[:, :-1] = self._shap(x).T
+            phi[:, -1] = float(self.a["lgb_expected"])
+            return phi
+
+        return self._chunked(run, X, chunk=_SHAP_CHUNK)
+
+    def _shap(self, X) -> np.ndarray:
+        """Feature contributions, shape (features, rows)."""
+        a = self.a
+        consts = self._shap_consts or self._shap_setup()
+        nodes, slot_node, slot_left = a["shap_nodes"], a["shap_slot_node"], a["shap_slot_left"]
+        go_left = _lgb_decision(X[:, a["lgb_feature"][nodes]], a["lgb_threshold"][nodes],
+                                a["lgb_default_left"][nodes], a["lgb_missing"][nodes]).T.copy()
+        # One fraction of every (leaf, feature) slot: the row follows all of the slot's splits
+        o_all = go_left[slot_node[:, 0]] == slot_left[:, :1]
+        for j in range(1, slot_node.shape[1]):
+            o_all &= go_left[slot_node[:, j]] == slot_left[:, j:j + 1]
+        n = len(X)
+        phi = np.zeros((int(a["lgb_n_features"]), n))
+        for k, s0, L, quad, one_z, neg_z, scatter in consts:
+            o = o_all[s0:s0 + L * k].reshape(L, k, n)
+            # ∫₀¹ ∏_{i≠j} f_i(u) du by Gauss–Legendre, with f_i = z_i(1−u) + o_i u > 0
+            integral = np.zeros((L, k, n))
+            for zq, zq_u, wv in quad:
+                f = np.where(o, zq_u, zq)
+                p = f.prod(axis=1, keepdims=True) * wv
+                integral += np.divide(p, f, out=f)
+            integral *= np.where(o, one_z, neg_z)
+            phi += scatter @ integral.reshape(L * k, n)
+        return phi
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def verify(rows: int = 2000, seed: int = 0) -> dict:
+    """Max abs difference against the native models on lookup rows + perturbed / edge-case rows."""
+    import joblib
+    lgb_model, iso_model = joblib.load(LGB_PATH), joblib.load(ISO_PATH)
+    engine = TreeEngine.from_models(lgb_model, iso_model)
+    n_feat = lgb_model.n_features_in_
+    rng = np.random.default_rng(seed)
+    try:
+        from services import registry
+        matrix = registry.current().lookup.matrix
+        X = np.asarray(matrix[rng.integers(0, len(matrix), rows)], np.float64) \
+            if len(matrix) else np.empty((0, n_feat))
+    except Exception:
+        X = np.empty((0, n_feat))
+    noise = X[rng.permutation(len(X))] * rng.lognormal(0, 0.3, X.shape) if len(X) else rng.lognormal(0, 2, (rows, n_feat))
+    edge = np.zeros((4, n_feat))
+    edge[1] = 1e12
+    edge[2] = -1.0
+    X = np.vstack([X, noise, edge])
+    return {
+        "rows": len(X),
+        "lgb_proba": float(np.abs(engine.lgb_proba(X) - lgb_model.predict_proba(X)[:, 1]).max()),
+        "iso_score": float(np.abs(engine.iso_score(X) + iso_model.decision_function(X)).max()),
+        "contrib":   float(np.abs(engine.contributions(X) - lgb_model.predict(X, pred_contrib=True)).max()),
+    }
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "export":
+        print(export(*sys.argv[2:3]))
+    elif cmd == "verify":
+        n = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 2000
+        print(json.dumps(verify(n), indent=2))
+    else:
+        sys.exit("usage: python -m services.trees export [dir] | verify [--rows N]")
@@ -0,0 +1,117 @@
+"""
+Streaming address-list parser for bulk uploads.
+
+Accepts CSV (address in the first column, header optional), NDJSON
+({"address": …} objects or bare strings) or plain one-per-line text, each
+optionally gzip/zlib-compressed. The body is consumed chunk by chunk, so
+memory is bounded by the chunk size, not the list size.
+"""
+
+import os
+import re
+import json
+import zlib
+
+UPLOAD_MAX_ADDRESSES = int(os.getenv("UPLOAD_MAX_ADDRESSES", "10000000"))
+UPLOAD_BATCH         = 5000          # addresses per job_store insert
+_MAX_INFLATE         = 1 << 20       # decompressed bytes per step (zip-bomb guard)
+_MAX_LINE            = 4096
+
+_ADDRESS = re.compile(r"^0x[0-9a-f]{40}$")
+
+
+class UploadError(ValueError):
+    """Malformed upload body."""
+
+
+def valid_address(address: str) -> bool:
+    """0x followed by 40 hex digits (either case)."""
+    return bool(_ADDRESS.fullmatch(address.strip().lower()))
+
+
+def parse_address(line: str):
+    """Normalised address from one line, or None (header, comment, junk)."""
+    line = line.strip()
+    if not line or line[0] == "#":
+        return None
+    if line[0] in "{\"":
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            return None
+        line = obj.get("address", "") if isinstance(obj, dict) else obj
+        if not isinstance(line, str):
+            return None
+    else:
+        line = line.split(",", 1)[0]
+    addr = line.strip().strip("\"'").lower()
+    return addr if _ADDRESS.match(addr) else None
+
+
+async def _inflate(chunks, encoding: str = ""):
+    """
+    Pass `chunks` through, decompressing when Content-Encoding says so or the
+    body starts with the gzip magic bytes. Concatenated gzip members (`cat
+    a.gz b.gz`, pigz, bgzip) are inflated one after another.
+    """
+    d = None
+    first = True
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if first:
+            first = False
+            if encoding in ("gzip", "x-gzip", "deflate") or chunk[:2] == b"\x1f\x8b":
+                d = zlib.decompressobj(zlib.MAX_WBITS | 32)   # auto-detect gzip / zlib header
+        if d is None:
+            yield chunk
+            continue
+        try:
+            while chunk:
+                data = d.decompress(chunk, _MAX_INFLATE)
+                if data:
+                    yield data
+                if d.unconsumed_tail:
+                    chunk = d.unconsumed_tail
+                elif d.eof and d.unused_data:
+                    chunk = d.unused_data
+                    d = zlib.decompressobj(zlib.MAX_WBITS | 32)
+                else:
+                    chunk = b""
+        except zlib.error as e:
+            raise UploadError(f"bad compressed stream: {e}") from None
+    if d is not None:
+        tail = d.flush()
+        if tail:
+            yield tail
+
+
+async def addresses(chunks, stats: dict, encoding: str = ""):
+    """
+    Yield lists of up to UPLOAD_BATCH normalised addresses from a byte stream.
+    Non-blank lines that hold no valid address are counted in stats["rejected"].
+    """
+    buf = b""
+    batch = []
+    stats.setdefault("rejected", 0)
+    async for data in _inflate(chunks, encoding):
+        buf += data
+        *lines, buf = buf.split(b"\n")
+        if len(buf) > _MAX_LINE:
+            raise UploadError("line too long")
+        for raw in lines:
+            addr = parse_address(raw.decode("utf-8", "replace"))
+            if addr is None:
+                stats["rejected"] += raw.strip() != b""
+                continue
+            batch.append(addr)
+            if len(batch) >= UPLOAD_BATCH:
+                yield batch
+                batch = []
+    addr = parse_address(buf.decode("utf-8", "replace"))
+    if addr is not None:
+        batch.append(addr)
+    elif buf.strip():
+        stats["rejected"] += 1
+    if batch:
+        yield batch
@@ -0,0 +1,103 @@
+"""
+Tests run against small synthetic models (bench.synth) in a temporary
+directory; nothing under models/ or data/ is read or written. The environment
+is set here, before anything imports services.*, because the services read it
+at import.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import pytest
+
+_API = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _API)
+
+WORK = tempfile.mkdtemp(prefix="sybilscan-test-")
+os.environ.update({
+    "SYBILSCAN_MODEL_DIR":   os.path.join(WORK, "models"),
+    "SYBILSCAN_LOOKUP_DIR":  os.path.join(WORK, "lookup"),
+    "JOB_STORE_PATH":        os.path.join(WORK, "jobs.sqlite"),
+    "FEATURE_CACHE_PATH":    os.path.join(WORK, "feature_cache.sqlite"),
+    "ETHERSCAN_KEY_BUDGET_PATH": os.path.join(WORK, "etherscan_keys.sqlite"),
+    "API_KEYS_PATH":         os.path.join(WORK, "api_keys.json"),
+    "API_BUCKETS_PATH":      os.path.join(WORK, "api_buckets.sqlite"),
+    "JOB_EXPORT_DIR":        os.path.join(WORK, "exports"),
+    "MODEL_WATCH_S":         "0",
+    "SYBILSCAN_METRICS":     "0",
+    "SCORING_WORKERS":       "0",
+    "JOB_LEASE_S":           "3",
+})
+
+from bench import synth  # noqa: E402
+
+FEATURE_NAMES = json.load(open(synth.FEATURE_NAMES_PATH))
+
+
+def pytest_sessionstart(session):
+    synth.make_models(os.environ["SYBILSCAN_MODEL_DIR"], FEATURE_NAMES, rows=3000, trees=30)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK, ignore_errors=True)
+
+
+def write_csv(path: str, addrs: list, X, funders: list = None) -> str:
+    """Labeled-CSV stand-in: address column + one column per feature (+ funded_by, if given)."""
+    with open(path, "w") as f:
+        f.write(",".join(["address"] + FEATURE_NAMES + (["funded_by"] if funders else [])) + "\n")
+        for i, (a, row) in enumerate(zip(addrs, X)):
+            extra = [funders[i] or ""] if funders else []
+            f.write(",".join([a] + [repr(float(v)) for v in row] + extra) + "\n")
+    return path
+
+
+@pytest.fixture
+def lookup_csv(tmp_path, monkeypatch):
+    """A 500-row labeled CSV wired into the registry, with a fresh lookup dir and no loaded bundle."""
+    from services import registry
+
+    addrs = synth.addresses(500, seed=7)
+    X = synth.features(500, FEATURE_NAMES, seed=7)
+    path = write_csv(str(tmp_path / "labeled.csv"), addrs, X)
+    monkeypatch.setattr(registry, "LOOKUP_CSV", path)
+    monkeypatch.setattr(registry, "LOOKUP_DIR", str(tmp_path / "lookup"))
+    monkeypatch.setattr(registry, "_current", None)
+    yield path, addrs, X
+    registry._current = None
+
+
+@pytest.fixture
+def client(lookup_csv):
+    """The API app (lifespan running) over the lookup_csv models and lookup."""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as c:
+        for _ in range(200):
+            if c.get("/ready").status_code == 200:
+                break
+            time.sleep(0.05)
+        yield c
+
+
+@pytest.fixture
+def key(monkeypatch):
+    """A fresh API key with a fresh bucket; returns its request headers."""
+    from services import auth
+
+    auth._db().execute("DELETE FROM buckets")
+    return {"Authorization": f"Bearer {auth.generate_key('test')}"}
+
+
+def wait_job(client, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        j = client.get(f"/v1/jobs/{job_id}/status").json()
+        if j["status"] not in ("pending", "running"):
+            return j
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {j['status']}")
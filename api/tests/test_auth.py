@@ -0,0 +1,65 @@
+import threading
+from services import auth
+
+
+def test_key_required_by_default(client, lookup_csv):
+    _, addrs, _ = lookup_csv
+    assert auth.REQUIRE_KEY
+    assert client.post("/v1/score", json={"addresses": addrs[:5]}).status_code == 401
+    bad = {"Authorization": "Bearer sk-nope"}
+    assert client.post("/v1/score", json={"addresses": addrs[:5]}, headers=bad).status_code == 401
+
+
+def test_charged_by_address_count(client, lookup_csv, key, monkeypatch):
+    _, addrs, _ = lookup_csv
+    monkeypatch.setattr(auth, "KEY_RPS", 1.0)
+    monkeypatch.setattr(auth, "KEY_BURST", 50.0)
+    assert client.post("/v1/score", json={"addresses": addrs[:200]}, headers=key).status_code == 200
+    r = client.post("/v1/score", json={"addresses": addrs[:1]}, headers=key)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 100          # 200 credits spent from a 50-credit burst at 1/s
+
+
+def test_anonymous_callers_share_one_bucket(client, lookup_csv, key, monkeypatch):
+    _, addrs, _ = lookup_csv
+    monkeypatch.setattr(auth, "REQUIRE_KEY", False)
+    monkeypatch.setattr(auth, "ANON_RPS", 1.0)
+    monkeypatch.setattr(auth, "ANON_BURST", 10.0)
+    assert client.post("/v1/score", json={"addresses": addrs[:10]}).status_code == 200
+    assert client.post("/v1/score", json={"addresses": addrs[:1]},
+                       headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 429
+    # keyed callers are not held back by anonymous traffic
+    assert client.post("/v1/score", json={"addresses": addrs[:1]}, headers=key).status_code == 200
+
+
+def test_unsupported_chains_not_charged(client, lookup_csv, key, monkeypatch):
+    _, addrs, _ = lookup_csv
+    monkeypatch.setattr(auth, "KEY_RPS", 0.001)
+    monkeypatch.setattr(auth, "KEY_BURST", 50.0)
+    r = client.post("/v1/verify/chains", json={"addresses": addrs[:40], "chains": ["eth", "base"]}, headers=key)
+    assert r.status_code == 200
+    assert all(x["chains_unsupported"] == ["base"] for x in r.json()["results"])
+    # 40 credits for the ETH lookups, none for base: 10 left
+    assert client.post("/v1/score", json={"addresses": addrs[:5]}, headers=key).status_code == 200
+
+
+def test_workers_share_key_buckets(key, monkeypatch):
+    """A charge made by one worker is seen by another: the buckets live in the shared store."""
+    monkeypatch.setattr(auth, "KEY_RPS", 1.0)
+    monkeypatch.setattr(auth, "KEY_BURST", 50.0)
+    k = key["Authorization"][7:]
+    assert auth._wait(k) == 0
+    auth.charge(k, 200)
+    other = []
+    t = threading.Thread(target=lambda: other.append(auth._wait(k)))    # own store connection
+    t.start()
+    t.join()
+    assert other[0] >= 100
+
+
+def test_key_creation_limited_per_ip(client, key, monkeypatch):
+    monkeypatch.setattr(auth, "MINT_PER_HOUR", 2.0)
+    for _ in range(2):
+        assert client.post("/v1/keys", json={"name": "t"}).status_code == 200
+    r = client.post("/v1/keys", json={"name": "t"})
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) > 60
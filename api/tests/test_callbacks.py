@@ -0,0 +1,113 @@
+import json
+import time
+import hmac
+import asyncio
+import socket
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from services import callbacks, job_store
+from tests.conftest import wait_job
+
+
+@pytest.fixture
+def receiver(monkeypatch):
+    """Webhook receiver on 127.0.0.1 (allow-listed); yields (url, received requests)."""
+    got = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            got.append((dict(self.headers), body))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(callbacks, "CALLBACK_ALLOW_HOSTS", ["127.0.0.1"])
+    yield f"http://127.0.0.1:{server.server_port}/hook", got
+    server.shutdown()
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8000/hook",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.1/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "ftp://example.com/hook",
+    "not a url",
+])
+def test_non_public_urls_rejected(url):
+    assert not asyncio.run(callbacks.valid_url(url))
+
+
+def test_public_ip_accepted():
+    assert asyncio.run(callbacks.valid_url("https://1.1.1.1/hook"))
+
+
+def test_submit_rejects_internal_callback(client, lookup_csv, key):
+    _, addrs, _ = lookup_csv
+    r = client.post("/v1/score", json={"addresses": addrs[:5], "callback_url": "http://169.254.169.254/"},
+                    headers=key)
+    assert r.status_code == 400
+
+
+def test_job_posts_signed_callback(client, lookup_csv, key, receiver, monkeypatch):
+    _, addrs, _ = lookup_csv
+    url, got = receiver
+    monkeypatch.setattr(callbacks, "CALLBACK_SECRET", "s3cret")
+    r = client.post("/v1/score", json={"addresses": addrs[:20], "callback_url": url}, headers=key)
+    jid = r.json()["job_id"]
+    wait_job(client, jid)
+    for _ in range(100):
+        if client.get(f"/v1/jobs/{jid}/status").json().get("callback_status") == "delivered":
+            break
+        time.sleep(0.05)
+    headers, body = got[-1]
+    assert json.loads(body)["job_id"] == jid and json.loads(body)["status"] == "complete"
+    sig = hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+    assert headers["X-SybilScan-Signature"] == f"sha256={sig}"
+
+
+def test_stranded_callback_is_redelivered(client, receiver):
+    """A finished job whose owner died before delivering is picked up by the maintenance loop."""
+    url, got = receiver
+    jid = job_store.create(["0x" + "02" * 20], "dead-worker", callback_url=url)
+    job_store.set_status(jid, "complete")
+    job_store._db().execute("UPDATE jobs SET heartbeat = 0 WHERE job_id = ?", (jid,))
+    for _ in range(200):
+        if job_store.get(jid)["callback_status"] == "delivered":
+            break
+        time.sleep(0.05)
+    assert job_store.get(jid)["callback_status"] == "delivered"
+    assert any(json.loads(b)["job_id"] == jid for _, b in got)
+
+
+def test_delivery_connects_to_the_checked_address(receiver, monkeypatch):
+    """A name that re-resolves elsewhere after the check (DNS rebinding) is still only reached at the checked IP."""
+    url, got = receiver
+    real = socket.getaddrinfo
+    lookups = []
+
+    def rebinding(host, *args, **kwargs):
+        if host == "hook.example":
+            lookups.append(host)
+            if len(lookups) > 1:
+                raise socket.gaierror("rebound")
+            host = "127.0.0.1"
+        return real(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", rebinding)
+    monkeypatch.setattr(callbacks, "CALLBACK_RETRIES", 0)
+    monkeypatch.setattr(callbacks, "CALLBACK_ALLOW_HOSTS", ["hook.example"])
+    pinned = url.replace("127.0.0.1", "hook.example")
+    assert asyncio.run(callbacks.deliver(pinned, {"job_id": "j"})) == "delivered"
+    assert lookups == ["hook.example"]
+    assert got[-1][0]["Host"] == pinned.split("/")[2]
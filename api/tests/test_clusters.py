@@ -0,0 +1,29 @@
+import pytest
+from tests.conftest import wait_job, write_csv
+
+FARM_A, FARM_B = "0x" + "aa" * 20, "0x" + "bb" * 20
+
+
+@pytest.fixture
+def funded_csv(lookup_csv):
+    """lookup_csv rewritten with a funded_by column: 12 rows from one farm, 6 from another, the rest unknown."""
+    path, addrs, X = lookup_csv
+    funders = [FARM_A] * 12 + [FARM_B] * 6 + [None] * (len(addrs) - 18)
+    write_csv(path, addrs, X, funders)
+    return addrs
+
+
+def test_lookup_hits_cluster_by_recorded_funder(funded_csv, client, key):
+    addrs = funded_csv[:60]
+    r = client.post("/v1/score", json={"addresses": addrs, "cluster": True, "explain": "none"}, headers=key)
+    j = wait_job(client, r.json()["job_id"])
+    assert j["status"] == "complete"
+    summary = client.get(f"/v1/jobs/{j['job_id']}").json()["clusters"]
+    assert {k: summary[k] for k in ("linked", "clusters", "largest", "unknown_funder")} == \
+        {"linked": 18, "clusters": 2, "largest": 12, "unknown_funder": 42}
+
+    rows = {x["address"]: x for x in client.get(f"/v1/jobs/{j['job_id']}").json()["results"]}
+    a, b = rows[addrs[0].lower()], rows[addrs[12].lower()]
+    assert a["funded_by"] == FARM_A and a["cluster_size"] == 12
+    assert b["funded_by"] == FARM_B and b["cluster_size"] == 6 and b["cluster_id"] != a["cluster_id"]
+    assert "cluster_id" not in rows[addrs[30].lower()]
@@ -0,0 +1,51 @@
+import time
+import asyncio
+import threading
+import pytest
+from bench import synth
+from services import etherscan, feature_cache, features
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """_fetch served from bench.synth histories (25 rows per endpoint, 10 per page)."""
+    async def fetch(client, params, chain, retries=4):
+        rows = [r for r in synth.history(params["address"], params["action"], rows=25)
+                if params["startblock"] <= int(r["blockNumber"]) <= params["endblock"]]
+        return {"status": "1", "result": rows[:params["offset"]]}
+
+    monkeypatch.setattr(etherscan, "_fetch", fetch)
+    monkeypatch.setattr(etherscan, "_PAGE_SIZE", 10)
+
+
+def test_truncated_history_is_flagged_and_resumed(upstream, monkeypatch):
+    addr = synth.addresses(1, seed=11)[0]
+    t0 = int(time.time())
+    full = asyncio.run(etherscan.fetch_features(addr, t0=t0, chain="poly"))
+    assert not full["_partial"]
+
+    monkeypatch.setattr(etherscan, "_MAX_PAGES", 1)
+    f = asyncio.run(etherscan.fetch_features(addr, t0=t0, chain="eth"))
+    assert f["_partial"] and f["tx_count"] < full["tx_count"]
+    assert sorted(feature_cache.get("eth", addr)["truncated"]) == sorted(features.ENDPOINTS)
+
+    # Within the freshness window a partial history is still refreshed, from where it stopped
+    for _ in range(5):
+        f = asyncio.run(etherscan.fetch_features(addr, t0=t0, chain="eth"))
+        if not f["_partial"]:
+            break
+    assert f == full
+    assert feature_cache.get("eth", addr)["truncated"] == []
+
+
+def test_cache_io_runs_off_the_event_loop(upstream, monkeypatch):
+    threads = []
+    for name in ("get", "put"):
+        real = getattr(feature_cache, name)
+
+        def spy(*args, _real=real):
+            threads.append(threading.current_thread())
+            return _real(*args)
+        monkeypatch.setattr(feature_cache, name, spy)
+    asyncio.run(etherscan.fetch_features(synth.addresses(1, seed=12)[0], chain="poly"))
+    assert len(threads) == 2 and threading.main_thread() not in threads
@@ -0,0 +1,27 @@
+import time
+from bench import synth
+from services import features
+
+BLEND = next(iter(features.BLEND_CONTRACTS))
+
+
+def test_malformed_token_rows_and_exact_wei():
+    addr = synth.addresses(1, seed=3)[0]
+    t0 = int(time.time())
+    txlist = synth.history(addr, "txlist", rows=40)
+    for r in txlist:
+        r["value"] = str(10**24 + 1)             # float sums would drop the +1s
+    tokentx = synth.history(addr, "tokentx", rows=4)
+    for r, dec in zip(tokentx, ("", "6", None, "18")):
+        r["contractAddress"] = BLEND
+        r["tokenDecimal"] = dec
+    tokentx[1]["value"] = ""
+
+    f = features.extract_batch([addr], [{"txlist": txlist, "tokentx": tokentx}], t0)[0]
+
+    out = sum(int(r["value"]) for r in txlist if r["from"] == addr)
+    assert f["buy_value"] == out / 1e18
+    assert f["blend_in_count"] + f["blend_out_count"] == 4
+    net = sum((1 if r["to"] == addr else -1) * int(r["value"] or 0) / 10 ** int(r["tokenDecimal"] or 18)
+              for r in tokentx)
+    assert f["blend_net_value"] == net
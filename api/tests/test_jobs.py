@@ -0,0 +1,159 @@
+import time
+import threading
+import gzip
+import asyncio
+import pytest
+from services import job_store, registry, upload
+from tests.conftest import wait_job
+
+
+def test_job_scores_lookup_rows(client, lookup_csv, key):
+    _, addrs, _ = lookup_csv
+    unknown = "0x" + "ab" * 20
+    r = client.post("/v1/score", json={"addresses": addrs[:100] + [unknown]}, headers=key)
+    assert r.status_code == 200
+    j = wait_job(client, r.json()["job_id"])
+    assert j["status"] == "complete" and j["completed"] == 101
+    assert j["summary"]["unknown"] == 1
+
+    full = client.get(f"/v1/jobs/{j['job_id']}").json()
+    by_addr = {x["address"]: x for x in full["results"]}
+    assert by_addr[unknown]["data_source"] == "not_found"
+    assert all(by_addr[a.lower()]["data_source"] == "cached" for a in addrs[:100])
+
+    page = client.get(f"/v1/jobs/{j['job_id']}/results", params={"limit": 60}).json()
+    rest = client.get(f"/v1/jobs/{j['job_id']}/results", params={"after": page["next"]}).json()
+    assert len(page["results"]) + len(rest["results"]) == 101 and rest["done"]
+
+
+def test_reads_do_not_wait_for_a_writer():
+    """No process-wide lock: a reader on another thread is not held up by an open write transaction."""
+    jid = job_store.create(["0x" + "01" * 20], "test")
+    held, release = threading.Event(), threading.Event()
+
+    def writer():
+        db = job_store._db()
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("UPDATE jobs SET heartbeat = ? WHERE job_id = ?", (time.time(), jid))
+        held.set()
+        release.wait(10)
+        db.execute("COMMIT")
+
+    t = threading.Thread(target=writer)
+    t.start()
+    held.wait(5)
+    try:
+        began = time.perf_counter()
+        assert job_store.get(jid)["status"] == "pending"
+        assert time.perf_counter() - began < 1
+    finally:
+        release.set()
+        t.join()
+
+
+def test_failed_write_releases_the_lock():
+    """A write that raises mid-transaction rolls back instead of holding the lock for other threads."""
+    jid = job_store.create(["0x" + "02" * 20], "test")
+    try:
+        job_store.append_results(jid, [(0, {"risk": "low", "bad": object()})])
+    except TypeError:
+        pass
+    other = []
+    t = threading.Thread(target=lambda: other.append(job_store.create(["0x" + "03" * 20], "test")))
+    began = time.perf_counter()
+    t.start()
+    t.join(5)
+    assert other and time.perf_counter() - began < 1
+    assert job_store.get(jid)["completed"] == 0
+
+
+def test_upload_concatenated_gzip_up_to_the_cap(client, lookup_csv, key, monkeypatch):
+    _, addrs, _ = lookup_csv
+    monkeypatch.setattr(upload, "UPLOAD_MAX_ADDRESSES", 6)
+    body = gzip.compress("\n".join(addrs[:3]).encode()) + gzip.compress(("\n" + "\n".join(addrs[3:6])).encode())
+    r = client.post("/v1/score/upload", content=body, headers=key)
+    assert r.status_code == 200 and r.json()["total"] == 6
+    assert wait_job(client, r.json()["job_id"])["completed"] == 6
+
+    dupes = "\n".join(addrs[:6] + addrs[:6]).encode()
+    assert client.post("/v1/score/upload", content=dupes, headers=key).json()["total"] == 6
+    r = client.post("/v1/score/upload", content="\n".join(addrs[:7]).encode(), headers=key)
+    assert r.status_code == 400
+
+
+def test_live_failure_stops_the_other_fetches(monkeypatch):
+    from services import etherscan, jobs
+
+    class Boom(BaseException):
+        pass
+
+    fetched = []
+
+    async def fetch(addr, chain):
+        fetched.append(addr)
+        await asyncio.sleep(0.02)
+        if addr == addrs[5][1]:
+            raise Boom()
+        return {}
+
+    async def nothing(*args):
+        return []
+
+    monkeypatch.setattr(etherscan, "fetch_features_shared", fetch)
+    monkeypatch.setattr(jobs, "_score", nothing)
+    monkeypatch.setattr(jobs, "_append", nothing)
+    addrs = [(i, "0x%040x" % i) for i in range(100)]
+    j = {"job_id": "x", "chain": "arb", "explain": "none", "concurrency": 4}
+
+    async def main():
+        with pytest.raises(Boom):
+            await jobs._run_live(j, addrs)
+        await asyncio.sleep(0.3)     # the loop lives on, as in the API: nothing may keep fetching
+
+    asyncio.run(main())
+    assert len(fetched) <= 16          # the rounds in flight, not all 100
+
+
+def test_live_addresses_flushed_while_upload_continues(lookup_csv, monkeypatch):
+    """A cross-chain upload that is still open has its buffered addresses fetched, not held for LIVE_CHUNK."""
+    from services import jobs
+
+    handed = []
+
+    async def run_live(j, addrs):
+        handed.append(len(addrs))
+
+    monkeypatch.setattr(jobs, "_run_live", run_live)
+    registry.current()
+    jid = job_store.create([], "test", chain="arb", live=True, uploading=True)
+    job_store.add_addresses(jid, ["0x%040x" % i for i in range(1, 4)])
+
+    async def main():
+        task = asyncio.create_task(jobs.run_job(jid))
+        await asyncio.sleep(1.0)
+        seen = list(handed)
+        await asyncio.to_thread(job_store.finish_upload, jid)
+        await task
+        return seen
+
+    assert asyncio.run(main()) == [3]
+
+
+def test_export_writes_run_off_the_event_loop(lookup_csv, monkeypatch):
+    from services import exports, jobs
+
+    _, addrs, _ = lookup_csv
+    threads = []
+    real = exports.Writer.write
+
+    def spy(self, results):
+        threads.append(threading.current_thread())
+        return real(self, results)
+
+    monkeypatch.setattr(exports.Writer, "write", spy)
+    registry.current()
+    jid = job_store.create(addrs[:50], "test")
+    asyncio.run(jobs.run_job(jid))
+    assert threads and threading.main_thread() not in threads
+    with gzip.open(exports.path(jid, "csv"), "rt") as f:
+        assert len(f.read().splitlines()) == 51
@@ -0,0 +1,43 @@
+import time
+import asyncio
+from services.keypool import KeyPool
+
+
+def _pools(path, n=2):
+    pools = [KeyPool(rate=20, burst=10, path=path) for _ in range(n)]
+    for p in pools:
+        p.register("eth", ["k1"])
+    return pools
+
+
+def test_processes_share_one_budget(tmp_path):
+    """Two pools on one file (two workers) get one key's rate between them, not twice it."""
+    pools = _pools(str(tmp_path / "keys.sqlite"))
+
+    async def drain(pool, until):
+        n = 0
+        while time.time() < until:
+            await pool.acquire("eth")
+            n += 1
+        return n
+
+    async def main():
+        start = time.time()
+        counts = await asyncio.gather(*(drain(p, start + 0.5) for p in pools))
+        return sum(counts), time.time() - start
+
+    total, elapsed = asyncio.run(main())
+    assert total <= 10 + 20 * elapsed + 2
+    assert total >= 15
+
+
+def test_backoff_is_seen_by_other_processes(tmp_path):
+    a, b = _pools(str(tmp_path / "keys.sqlite"))
+    asyncio.run(a.acquire("eth"))
+    a.throttled("k1")
+    cooling = a._keys["k1"].cooldown_until
+    asyncio.run(a.acquire("eth"))
+    assert time.time() >= cooling
+
+    asyncio.run(b.acquire("eth"))
+    assert b._keys["k1"].cooldown_until == cooling
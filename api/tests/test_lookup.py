@@ -0,0 +1,52 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from services import registry
+from services.lookup import LookupStore, build, is_current
+from tests.conftest import FEATURE_NAMES, write_csv
+
+
+def test_store_matches_csv_exactly(lookup_csv, tmp_path):
+    """Rows are bit-identical to what the old pandas lookup read from the CSV."""
+    path, addrs, _ = lookup_csv
+    store = build(path, str(tmp_path / "store"), FEATURE_NAMES)
+    found_X, found = store.lookup(addrs)
+    assert found.all()
+    expected = pd.read_csv(path).set_index("address").loc[addrs, FEATURE_NAMES].to_numpy(dtype=float)
+    assert np.array_equal(found_X, expected)
+
+
+def test_reload_rebuilds_after_csv_edit(lookup_csv):
+    path, addrs, X = lookup_csv
+    m = registry.reload(force=True)
+    col = FEATURE_NAMES.index("buy_count")
+    assert m.lookup.lookup(addrs[:1])[0][0, col] != 99999
+
+    X = X.copy()
+    X[0, col] = 99999
+    write_csv(path, addrs, X)
+    os.utime(path, ns=(1, 1))                  # a new stamp even within the same mtime tick
+    m = registry.reload()
+    assert m.lookup.lookup(addrs[:1])[0][0, col] == 99999
+    assert is_current(registry.LOOKUP_DIR, path)
+
+
+def test_touched_csv_is_not_rebuilt(lookup_csv, tmp_path):
+    path, _, _ = lookup_csv
+    out = str(tmp_path / "store")
+    build(path, out, FEATURE_NAMES)
+    os.utime(path, ns=(2, 2))
+    assert is_current(out, path)
+
+
+def test_float32_store_is_rebuilt(lookup_csv, tmp_path):
+    path, _, _ = lookup_csv
+    out = str(tmp_path / "store")
+    build(path, out, FEATURE_NAMES, dtype="float32")
+    assert not is_current(out, path)
+    meta = json.load(open(os.path.join(out, "meta.json")))
+    meta.pop("source_stamp")
+    json.dump(meta, open(os.path.join(out, "meta.json"), "w"))
+    assert not is_current(out, path)
+    assert len(LookupStore.open(out, FEATURE_NAMES)) == 500
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from services import model, registry
+
+
+def _reference(m, df, addr):
+    """The pre-batching per-address scorer, verbatim apart from the model handles."""
+    row = df.loc[addr]
+    features = {f: float(row.get(f, 0) or 0) for f in m.feature_names}
+    feat_vec = np.nan_to_num(np.array([features.get(f, 0.0) for f in m.feature_names], dtype=float).reshape(1, -1))
+    lgb_score = float(m.lgb_model.predict_proba(feat_vec)[0][1])
+    if_norm = float(model._normalize_iso(float(-m.iso_model.decision_function(feat_vec)[0])))
+    final = lgb_score * 0.7 + if_norm * 0.3
+
+    buy_count      = features.get("buy_count", 0) or 0
+    blend_in_count = features.get("blend_in_count", 0) or 0
+    wallet_age     = features.get("wallet_age_days", 9999) or 9999
+    if buy_count > 9000 or blend_in_count > 100:
+        sybil_type = "hyperactive_bot"
+    elif buy_count > 794:
+        sybil_type = "mid_volume"
+    elif wallet_age < 30:
+        sybil_type = "new_wallet"
+    else:
+        sybil_type = "retail_hunter"
+    sybil_score = min(100, max(0, round(final * 100)))
+
+    contribs = m.lgb_model.predict(feat_vec, pred_contrib=True)[0][:-1]
+    top = [{
+        "feature":      m.feature_names[i],
+        "label":        model._FEATURE_LABELS.get(m.feature_names[i], m.feature_names[i]),
+        "value":        round(float(feat_vec[0][i]), 4),
+        "contribution": round(float(contribs[i]), 4),
+    } for i in np.argsort(np.abs(contribs))[::-1][:3]]
+
+    return {
+        "address":          addr,
+        "sybil_score":      sybil_score,
+        "score":            round(final, 4),
+        "lgb_score":        round(lgb_score, 4),
+        "if_score":         round(if_norm, 4),
+        "risk":             "high" if sybil_score >= 70 else "medium" if sybil_score >= 40 else "low",
+        "sybil_type":       sybil_type,
+        "tx_count":         int(features.get("tx_count", 0)),
+        "wallet_age_days":  round(features.get("wallet_age_days", 0), 1),
+        "nft_collections":  int(features.get("buy_collections", 0)),
+        "unique_contracts": int(features.get("unique_interactions", 0)),
+        "total_volume_eth": round(features.get("buy_value", 0) + features.get("sell_value", 0), 4),
+        "top_features":     top,
+        "data_source":      "cached",
+    }
+
+
+def test_batch_matches_per_address_scoring(lookup_csv):
+    path, addrs, _ = lookup_csv
+    m = registry.current()
+    df = pd.read_csv(path).set_index("address")
+    got = model.score_addresses(addrs[:200] + ["0x" + "cd" * 20])
+    for addr, r in zip(addrs[:200], got):
+        want = _reference(m, df, addr.lower())
+        assert {k: r[k] for k in want} == want
+    assert got[-1]["data_source"] == "not_found"
@@ -0,0 +1,42 @@
+import numpy as np
+from services import model, registry
+from services.lookup import LookupStore
+from services.precompute import precompute
+from tests.conftest import FEATURE_NAMES
+
+
+def _bundle_with_table():
+    m = registry.reload(force=True)
+    precompute(m)
+    return registry.reload(force=True)
+
+
+def test_table_scores_match_model(lookup_csv):
+    _, addrs, _ = lookup_csv
+    m = _bundle_with_table()
+    assert m.scores is not None
+    cached = model.score_addresses(addrs[:50])
+    registry._current.scores = None
+    assert model.score_addresses(addrs[:50]) == cached
+
+
+def test_table_rejected_after_feature_change(lookup_csv, monkeypatch, tmp_path):
+    """Same addresses, new feature values: the old table must not be served."""
+    _, addrs, _ = lookup_csv
+    m = _bundle_with_table()
+    monkeypatch.setattr(registry, "LOOKUP_CSV", str(tmp_path / "gone.csv"))   # store swapped in by hand
+    col = FEATURE_NAMES.index("buy_count")
+    matrix = np.array(m.lookup.matrix)
+    matrix[:, col] += 10000                      # every row becomes a hyperactive bot
+    LookupStore(np.array(m.lookup.keys), matrix, FEATURE_NAMES).save(registry.LOOKUP_DIR)
+
+    m = registry.reload(force=True)
+    assert m.scores is None
+    assert {r["sybil_type"] for r in model.score_addresses(addrs[:50])} == {"hyperactive_bot"}
+
+
+def test_digest_covers_values():
+    keys = np.array([b"\x01" * 20, b"\x02" * 20], dtype="S20")
+    a = LookupStore(keys, np.zeros((2, 3)), ["a", "b", "c"])
+    b = LookupStore(keys, np.ones((2, 3)), ["a", "b", "c"])
+    assert a.digest() != b.digest()
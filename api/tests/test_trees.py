@@ -0,0 +1,9 @@
+from services import trees
+
+
+def test_numpy_engine_matches_native_models():
+    d = trees.verify(rows=500)
+    assert d["rows"] > 500
+    assert d["lgb_proba"] < 1e-9
+    assert d["iso_score"] < 1e-9
+    assert d["contrib"] < 1e-9
@@ -39,6 +39,7 @@ Type=simple
 User=${SERVICE_USER}
 WorkingDirectory=${APP_DIR}
 Environment="PYTHONPATH=${APP_DIR}"
+ExecStartPre=${APP_DIR}/venv/bin/python -m services.registry
 ExecStart=${APP_DIR}/venv/bin/uvicorn main:app --host 127.0.0.1 --port 8000
 Restart=on-failure
 RestartSec=5
@@ -7,7 +7,10 @@
 #   ./scripts/batch_score.sh input.csv output.csv http://localhost:8000
 #
 # The input CSV may have a header row; the first column must be the address.
-# Lines starting with '#' are ignored. Empty lines are skipped.
+# Lines starting with '#' are ignored. Empty lines are skipped. The file may
+# also be NDJSON or gzip-compressed (e.g. input.csv.gz).
+#
+# The API key is read from SYBILSCAN_API_KEY.
 
 set -euo pipefail
 
@@ -15,6 +18,10 @@ set -euo pipefail
 INPUT="${1:-}"
 OUTPUT="${2:-}"
 API_BASE="${3:-http://localhost:8000}"
+AUTH=()
+if [[ -n "${SYBILSCAN_API_KEY:-}" ]]; then
+  AUTH=(-H "Authorization: Bearer $SYBILSCAN_API_KEY")
+fi
 
 if [[ -z "$INPUT" || -z "$OUTPUT" ]]; then
   echo "Usage: $0 input.csv output.csv [api_base_url]"
@@ -37,50 +44,26 @@ for dep in curl python3; do
   fi
 done
 
-# ─── Extract addresses ────────────────────────────────────────────────────────
-# Skip comment lines, empty lines; skip header if first column looks non-address
-ADDRESSES=$(
-  grep -v '^\s*#' "$INPUT" |       # drop comment lines
-  grep -v '^\s*$' |                 # drop blank lines
-  awk -F',' '
-    NR==1 {
-      # skip header if first field does not look like an Ethereum address
-      if ($1 !~ /^0x[0-9a-fA-F]{40}$/) next
-    }
-    { print $1 }
-  '
-)
+# ─── Upload to API ────────────────────────────────────────────────────────────
+# The file is streamed as-is; the API skips headers, comments and blank lines,
+# normalises and de-duplicates addresses, and starts scoring while it uploads.
+# explain=none: the CSV only needs scores, so skip the per-address contributions.
+echo "Uploading $INPUT to $API_BASE/v1/score/upload..."
+SCORE_RESP=$(curl -sf -X POST "$API_BASE/v1/score/upload?explain=none" ${AUTH[@]+"${AUTH[@]}"} \
+  -H "Content-Type: text/csv" \
+  -T "$INPUT") || {
+    echo "Error: could not reach API at $API_BASE"
+    echo "Is the API running? Try: cd api && uvicorn main:app --reload"
+    exit 1
+  }
 
-ADDR_COUNT=$(echo "$ADDRESSES" | grep -c '.' || true)
+ADDR_COUNT=$(echo "$SCORE_RESP" | python3 -c "import sys,json; print(json.load(sys.stdin)['total'])")
 if [[ "$ADDR_COUNT" -eq 0 ]]; then
   echo "Error: no valid addresses found in $INPUT"
   exit 1
 fi
 echo "Found $ADDR_COUNT address(es) in $INPUT"
 
-# ─── Build JSON payload ───────────────────────────────────────────────────────
-JSON_ADDRESSES=$(echo "$ADDRESSES" | python3 -c "
-import sys, json
-addrs = [line.strip() for line in sys.stdin if line.strip()]
-print(json.dumps(addrs))
-")
-
-PAYLOAD=$(python3 -c "
-import json
-addrs = $JSON_ADDRESSES
-print(json.dumps({'addresses': addrs}))
-")
-
-# ─── POST to API ──────────────────────────────────────────────────────────────
-echo "Submitting to $API_BASE/v1/score..."
-SCORE_RESP=$(curl -sf -X POST "$API_BASE/v1/score" \
-  -H "Content-Type: application/json" \
-  -d "$PAYLOAD") || {
-    echo "Error: could not reach API at $API_BASE"
-    echo "Is the API running? Try: cd api && uvicorn main:app --reload"
-    exit 1
-  }
-
 JOB_ID=$(echo "$SCORE_RESP" | python3 -c "import sys,json; print(json.load(sys.stdin)['job_id'])")
 echo "Job created: $JOB_ID"
 
@@ -91,7 +74,7 @@ while true; do
   sleep 1
   ELAPSED=$((ELAPSED + 1))
 
-  STATUS_RESP=$(curl -sf "$API_BASE/v1/jobs/$JOB_ID")
+  STATUS_RESP=$(curl -sf "$API_BASE/v1/jobs/$JOB_ID/status")
   STATUS=$(echo "$STATUS_RESP" | python3 -c "import sys,json; print(json.load(sys.stdin)['status'])")
   COMPLETED=$(echo "$STATUS_RESP" | python3 -c "import sys,json; d=json.load(sys.stdin); print(d.get('completed',0))")
   TOTAL=$(echo "$STATUS_RESP" | python3 -c "import sys,json; d=json.load(sys.stdin); print(d.get('total',0))")
@@ -115,24 +98,26 @@ while true; do
 done
 
 # ─── Save results to CSV ──────────────────────────────────────────────────────
-curl -sf "$API_BASE/v1/jobs/$JOB_ID" | python3 - <<'PYEOF' "$OUTPUT"
+# Streamed as NDJSON and written row by row, so memory stays flat for large jobs
+curl -sfN "$API_BASE/v1/jobs/$JOB_ID/results.ndjson" | python3 -c '
 import sys, json, csv
 
 output_path = sys.argv[1]
-data = json.load(sys.stdin)
-results = data.get('results', [])
-
-fieldnames = ['address', 'score', 'risk', 'sybil_type']
-with open(output_path, 'w', newline='') as f:
-    writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+fieldnames = ["address", "score", "risk", "sybil_type"]
+counts = {"high": 0, "medium": 0, "low": 0}
+total = 0
+with open(output_path, "w", newline="") as f:
+    writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
     writer.writeheader()
-    writer.writerows(results)
-
-# Print summary
-high   = sum(1 for r in results if r.get('risk') == 'high')
-medium = sum(1 for r in results if r.get('risk') == 'medium')
-low    = sum(1 for r in results if r.get('risk') == 'low')
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        r = json.loads(line)
+        writer.writerow(r)
+        total += 1
+        if r.get("risk") in counts:
+            counts[r["risk"]] += 1
 
 print(f"Results saved to: {output_path}")
-print(f"Total: {len(results)} | High: {high} | Medium: {medium} | Low: {low}")
-PYEOF
+print("Total: %d | High: %d | Medium: %d | Low: %d" % (total, counts["high"], counts["medium"], counts["low"]))
+' "$OUTPUT"
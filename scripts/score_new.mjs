@@ -7,10 +7,12 @@
  *   node scripts/score_new.mjs --addresses addr1,addr2,...
  *   node scripts/score_new.mjs --addresses addr1,addr2 --api http://localhost:8000
  *
+ * The API key is read from SYBILSCAN_API_KEY.
+ *
  * Steps:
  *   1. Fetch on-chain features via fetch_features.mjs logic
  *   2. POST addresses to /v1/score
- *   3. Poll /v1/jobs/:id until complete
+ *   3. Follow /v1/jobs/:id/events (SSE): progress and result chunks are pushed until done
  *   4. Print results table: address | score | risk | sybil_type
  */
 
@@ -18,34 +20,64 @@ import { parseArgs } from 'util';
 import { fetchFeaturesForAddresses } from './fetch_features.mjs';
 
 const DEFAULT_API = 'http://localhost:8000';
-const POLL_INTERVAL_MS = 1000;
-const MAX_POLL_ATTEMPTS = 120; // 2 minutes max
+const JOB_TIMEOUT_MS = 120_000; // 2 minutes max
+const API_KEY = process.env.SYBILSCAN_API_KEY;
 
 // ─── API helpers ──────────────────────────────────────────────────────────────
 
 async function postScore(apiBase, addresses) {
   const resp = await fetch(`${apiBase}/v1/score`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ addresses }),
+    headers: {
+      'Content-Type': 'application/json',
+      ...(API_KEY ? { Authorization: `Bearer ${API_KEY}` } : {}),
+    },
+    // Only score / risk / type are printed, so skip the contribution pass
+    body: JSON.stringify({ addresses, explain: 'none' }),
   });
   if (!resp.ok) throw new Error(`POST /v1/score failed: ${resp.status}`);
   return resp.json();
 }
 
-async function pollJob(apiBase, jobId) {
-  for (let attempt = 0; attempt < MAX_POLL_ATTEMPTS; attempt++) {
-    await new Promise(r => setTimeout(r, POLL_INTERVAL_MS));
-    const resp = await fetch(`${apiBase}/v1/jobs/${jobId}`);
-    if (!resp.ok) throw new Error(`GET /v1/jobs/${jobId} failed: ${resp.status}`);
-    const job = await resp.json();
-    if (job.status === 'complete') return job;
-    if (job.status === 'failed') throw new Error(`Job ${jobId} failed`);
-    process.stderr.write(
-      `  Waiting for job... (${job.completed}/${job.total} complete)\r`
-    );
+// Minimal SSE reader: yields { event, id, data } for each message on the stream
+async function* sseEvents(body) {
+  const decoder = new TextDecoder();
+  let buf = '';
+  for await (const chunk of body) {
+    buf += decoder.decode(chunk, { stream: true });
+    let end;
+    while ((end = buf.indexOf('\n\n')) >= 0) {
+      const msg = { event: 'message', id: null, data: '' };
+      for (const line of buf.slice(0, end).split('\n')) {
+        if (line.startsWith('event: ')) msg.event = line.slice(7);
+        else if (line.startsWith('id: ')) msg.id = line.slice(4);
+        else if (line.startsWith('data: ')) msg.data += line.slice(6);
+      }
+      buf = buf.slice(end + 2);
+      if (msg.data) yield msg;
+    }
+  }
+}
+
+async function followJob(apiBase, jobId) {
+  const resp = await fetch(`${apiBase}/v1/jobs/${jobId}/events`, {
+    signal: AbortSignal.timeout(JOB_TIMEOUT_MS),
+  });
+  if (!resp.ok) throw new Error(`GET /v1/jobs/${jobId}/events failed: ${resp.status}`);
+  const results = [];
+  for await (const { event, data } of sseEvents(resp.body)) {
+    if (event === 'results') {
+      results.push(...JSON.parse(data));
+    } else if (event === 'progress') {
+      const job = JSON.parse(data);
+      process.stderr.write(`  Waiting for job... (${job.completed}/${job.total} complete)\r`);
+    } else if (event === 'done') {
+      const job = JSON.parse(data);
+      if (job.status !== 'complete') throw new Error(`Job ${jobId} ${job.status}`);
+      return results;
+    }
   }
-  throw new Error('Timed out waiting for job to complete');
+  throw new Error(`Event stream for job ${jobId} ended early`);
 }
 
 // ─── Table printer ────────────────────────────────────────────────────────────
@@ -140,13 +172,13 @@ async function main() {
     process.exit(1);
   }
 
-  // Step 3: Poll until complete
+  // Step 3: Follow the job's event stream until complete
   console.error(`\n[3/3] Waiting for results...`);
-  const completedJob = await pollJob(apiBase, job.job_id);
+  const results = await followJob(apiBase, job.job_id);
   console.error(`      Complete!\n`);
 
   // Step 4: Print results table
-  printTable(completedJob.results);
+  printTable(results);
 }
 
 main().catch(err => {
@@ -0,0 +1,19 @@
+import { NextRequest } from "next/server";
+
+const VPS = process.env.VPS_API_URL || "http://45.76.152.169:8001";
+
+// Pass the job's Server-Sent Events stream through unbuffered
+export async function GET(req: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  const { id } = await params;
+  const lastEventId = req.headers.get("last-event-id");
+  const res = await fetch(`${VPS}/v1/jobs/${id}/events?${req.nextUrl.searchParams}`, {
+    headers: lastEventId ? { "Last-Event-ID": lastEventId } : {},
+    signal: req.signal,
+  });
+  if (!res.ok || !res.body) {
+    return new Response(await res.text(), { status: res.status, headers: { "Content-Type": "application/json" } });
+  }
+  return new Response(res.body, {
+    headers: { "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no" },
+  });
+}
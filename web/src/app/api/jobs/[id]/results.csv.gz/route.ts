@@ -0,0 +1,21 @@
+import { NextRequest } from "next/server";
+
+const VPS = process.env.VPS_API_URL || "http://45.76.152.169:8001";
+
+const PASS = ["content-type", "content-length", "content-disposition", "content-range", "accept-ranges", "etag", "last-modified", "cache-control"];
+
+// Stream the job's prebuilt gzip export through as-is; Range requests resume downloads
+export async function GET(req: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  const { id } = await params;
+  const range = req.headers.get("range");
+  const res = await fetch(`${VPS}/v1/jobs/${id}/results.csv.gz`, {
+    headers: range ? { Range: range } : {},
+    signal: req.signal,
+  });
+  const headers = new Headers();
+  for (const h of PASS) {
+    const v = res.headers.get(h);
+    if (v) headers.set(h, v);
+  }
+  return new Response(res.body, { status: res.status, headers });
+}
@@ -1,12 +1,16 @@
 import { NextRequest, NextResponse } from "next/server";
 
 const VPS = process.env.VPS_API_URL || "http://45.76.152.169:8001";
+const API_KEY = process.env.SYBILSCAN_API_KEY;
 
 export async function POST(req: NextRequest) {
   const body = await req.json();
   const res = await fetch(`${VPS}/v1/score`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: {
+      "Content-Type": "application/json",
+      ...(API_KEY ? { Authorization: `Bearer ${API_KEY}` } : {}),
+    },
     body: JSON.stringify(body),
   });
   const data = await res.json();
@@ -342,19 +342,49 @@ export default function Home() {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ addresses: addrs, chain }),
       });
+      if (!res.ok) throw new Error(`API error ${res.status}`);
       const { job_id } = await res.json();
       setBatchStatus("Processing...");
-      const poll = setInterval(async () => {
-        const jr = await fetch(`/api/jobs/${job_id}`);
-        const j = await jr.json();
+      type JobStatus = { status: string; progress?: number; completed?: number; total: number; error?: string };
+      const onProgress = (j: JobStatus) => {
         setBatchProgress(Math.round((j.progress || 0) * 100));
         setBatchStatus(`Processing ${j.completed || 0} / ${j.total} addresses...`);
+      };
+      const onDone = (j: JobStatus) => {
+        setBatchScanning(false);
         if (j.status === "complete") {
-          clearInterval(poll);
-          setBatchScanning(false);
           router.push(`/results?job_id=${job_id}`);
+        } else {
+          setBatchStatus(j.error || `Job ${j.status}`);
         }
-      }, 1500);
+      };
+      // Fallback when the event stream is unavailable (404, proxy timeout, dropped connection)
+      const poll = async () => {
+        try {
+          for (;;) {
+            const r = await fetch(`/api/jobs/${job_id}/status`);
+            if (!r.ok) throw new Error(`API error ${r.status}`);
+            const j: JobStatus = await r.json();
+            if (j.status !== "pending" && j.status !== "running") return onDone(j);
+            onProgress(j);
+            await new Promise(resolve => setTimeout(resolve, 2000));
+          }
+        } catch (e: unknown) {
+          setBatchStatus(e instanceof Error ? e.message : "Error");
+          setBatchScanning(false);
+        }
+      };
+      // Progress is pushed as batches finish (no polling); rows are loaded on the results page
+      const events = new EventSource(`/api/jobs/${job_id}/events?results=false`);
+      events.addEventListener("progress", (e) => onProgress(JSON.parse((e as MessageEvent).data)));
+      events.addEventListener("done", (e) => {
+        events.close();
+        onDone(JSON.parse((e as MessageEvent).data));
+      });
+      events.onerror = () => {
+        events.close();
+        poll();
+      };
     } catch (e: unknown) {
       setBatchStatus(e instanceof Error ? e.message : "Error");
       setBatchScanning(false);
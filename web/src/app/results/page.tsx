@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useState, useCallback } from "react";
+import { useEffect, useState, useRef } from "react";
 import { useSearchParams, useRouter } from "next/navigation";
 import { Suspense } from "react";
 
@@ -25,7 +25,7 @@ const TR = {
     scan_complete: "Scan complete", scanning: (pct: number) => `Scanning... ${pct}%`,
     total: "Total", high: "High", medium: "Medium", low: "Low", unknown: "Unknown",
     all: "All", filter_placeholder: "Filter by address...", addresses: (n: number) => `${n} addresses`,
-    export: "Export CSV", new_scan: "New scan",
+    export: "Export CSV", allowlist: "Allowlist", new_scan: "New scan",
     cols: ["Address","Score","Risk","Type","Txs","Age","NFT coll.","Volume (ETH)"],
     showing: (n: number, total: number) => `Showing 500 of ${total}. Export CSV for full results.`,
     loading: "Loading results...", no_job: "No job ID.",
@@ -35,7 +35,7 @@ const TR = {
     scan_complete: "扫描完成", scanning: (pct: number) => `扫描中... ${pct}%`,
     total: "总计", high: "高风险", medium: "中风险", low: "低风险", unknown: "未知",
     all: "全部", filter_placeholder: "按地址筛选...", addresses: (n: number) => `${n} 个地址`,
-    export: "导出 CSV", new_scan: "新扫描",
+    export: "导出 CSV", allowlist: "白名单", new_scan: "新扫描",
     cols: ["地址","评分","风险","类型","交易数","钱包年龄","NFT集合","交易量(ETH)"],
     showing: (n: number, total: number) => `显示 500 / ${total}。完整结果请导出 CSV。`,
     loading: "加载结果中...", no_job: "无 Job ID。",
@@ -63,7 +63,6 @@ interface JobData {
   total: number;
   completed: number;
   progress: number;
-  results: ResultRow[];
   summary: { total: number; high: number; medium: number; low: number; unknown: number };
   created_at: string;
   completed_at: string | null;
@@ -73,24 +72,14 @@ const RISK_COLOR: Record<string, string> = {
   high: "#ef4444", medium: "#f59e0b", low: "#22c55e", unknown: "#6b7280", error: "#6b7280",
 };
 
-function downloadCsv(results: ResultRow[], jobId: string) {
-  const header = "address,sybil_score,score,risk,sybil_type,tx_count,wallet_age_days,nft_collections,unique_contracts,total_volume_eth";
-  const rows = results.map(r =>
-    [r.address, r.sybil_score ?? (r.score != null ? Math.round(r.score * 100) : ""), r.score ?? "", r.risk, r.sybil_type, r.tx_count ?? "", r.wallet_age_days ?? "", r.nft_collections ?? "", r.unique_contracts ?? "", r.total_volume_eth ?? ""].join(",")
-  );
-  const blob = new Blob([[header, ...rows].join("\n")], { type: "text/csv" });
-  const url = URL.createObjectURL(blob);
-  const a = document.createElement("a");
-  a.href = url; a.download = `sybilscan_${jobId.slice(0, 8)}.csv`; a.click();
-  URL.revokeObjectURL(url);
-}
-
 function ResultsContent() {
   const params = useSearchParams();
   const router = useRouter();
   const jobId = params.get("job_id");
 
   const [job, setJob] = useState<JobData | null>(null);
+  const [results, setResults] = useState<ResultRow[]>([]);
+  const cursor = useRef(-1);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
   const [filter, setFilter] = useState<"all" | Risk>("all");
@@ -101,25 +90,34 @@ function ResultsContent() {
   const theme = isDark ? DARK : LIGHT;
   const t = TR[lang];
 
-  const fetchJob = useCallback(async () => {
+  useEffect(() => {
     if (!jobId) return;
-    try {
-      const res = await fetch(`/api/jobs/${jobId}`);
-      if (!res.ok) throw new Error("Job not found");
-      const data: JobData = await res.json();
-      setJob(data);
-      if (data.status !== "complete") {
-        setTimeout(fetchJob, 2000);
-      }
-    } catch (e: unknown) {
-      setError(e instanceof Error ? e.message : "Failed to load results");
-    } finally {
+    // Progress and result chunks are pushed as the job runs; EventSource
+    // resumes from the last chunk (Last-Event-ID) if the connection drops
+    const events = new EventSource(`/api/jobs/${jobId}/events?after=${cursor.current}`);
+    events.addEventListener("progress", (e) => {
+      setJob(JSON.parse((e as MessageEvent).data));
       setLoading(false);
-    }
+    });
+    events.addEventListener("results", (e) => {
+      const rows: ResultRow[] = JSON.parse((e as MessageEvent).data);
+      cursor.current = Number((e as MessageEvent).lastEventId);
+      setResults(prev => [...prev, ...rows]);
+    });
+    events.addEventListener("done", (e) => {
+      setJob(JSON.parse((e as MessageEvent).data));
+      setLoading(false);
+      events.close();
+    });
+    events.onerror = () => {
+      if (events.readyState === EventSource.CLOSED) {
+        setError("Failed to load results");
+        setLoading(false);
+      }
+    };
+    return () => events.close();
   }, [jobId]);
 
-  useEffect(() => { fetchJob(); }, [fetchJob]);
-
   if (!jobId) {
     return (
       <div style={{ minHeight: "100vh", background: theme.bg, display: "flex", alignItems: "center", justifyContent: "center" }}>
@@ -151,7 +149,7 @@ function ResultsContent() {
 
   if (!job) return null;
 
-  const filtered = job.results.filter(r => {
+  const filtered = results.filter(r => {
     const matchRisk = filter === "all" || r.risk === filter;
     const matchSearch = !search || r.address.toLowerCase().includes(search.toLowerCase());
     return matchRisk && matchSearch;
@@ -170,14 +168,18 @@ function ResultsContent() {
           SybilScan
         </button>
         <div style={{ display: "flex", gap: 10, alignItems: "center" }}>
-          {job.status === "complete" && (
-            <button onClick={() => downloadCsv(job.results, job.job_id)} style={{
+          {job.status === "complete" && ([
+            ["results.csv.gz", t.export],
+            ["allowlist.csv.gz", t.allowlist],
+          ] as const).map(([file, label]) => (
+            // Served from the gzip exports the API wrote while the job ran
+            <a key={file} href={`/api/jobs/${job.job_id}/${file}`} download style={{
               background: theme.bg3, border: `1px solid ${theme.border2}`, color: theme.text2, borderRadius: 6,
-              padding: "6px 16px", fontSize: 13, cursor: "pointer",
+              padding: "6px 16px", fontSize: 13, cursor: "pointer", textDecoration: "none",
             }}>
-              {t.export}
-            </button>
-          )}
+              {label}
+            </a>
+          ))}
           <button onClick={() => setLang(l => l === "en" ? "zh" : "en")} style={{
             background: theme.bg3, border: `1px solid ${theme.border2}`, borderRadius: 6,
             padding: "4px 10px", fontSize: 12, fontWeight: 600, cursor: "pointer", color: theme.text3,